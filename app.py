@@ -2,179 +2,210 @@
 
 import os
 import re
-import sqlite3
 import json
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort, Response, stream_with_context, g, make_response
 from werkzeug.security import generate_password_hash, check_password_hash
-from functions import *
-from predictor import PricePredictionModel
-import pandas as pd
+import threading
+import time
+from functions import add_item, remove_item
+from price_store import PRODUCT_TABLES, init_price_store, get_product_summaries
+from watchlist import init_watchlist, get_watchlist_page, count_watchlist
+from export import export_price_history, format_available, FORMATS
+from price_series import get_price_series, DOWNSAMPLERS, DEFAULT_POINTS
+from db import get_users_db_connection, get_price_history_db_connection
+from scrape_cache import canonical_url
+from metrics import Histogram, register_stats, register_snapshot_source, render as render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from job_queue import submit, get_job, get_events, get_jobs_connection, queue_stats, worker_metric_snapshots, dedupe_stats, QueueFull
+from jobs import predictor_loader
 import logging
 from datetime import datetime
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'  # Replace with a strong, random secret key
 
-# Define the path to the SQLite databases
 basedir = os.path.abspath(os.path.dirname(__file__))
-users_db_path = os.path.join(basedir, 'users.db')
-price_history_db_path = os.path.join(basedir, 'databases_price_history.db')
 
-def get_users_db_connection():
-    conn = sqlite3.connect(users_db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Watchlist items shown per platform on each dashboard page
+DASHBOARD_PAGE_SIZE = int(os.environ.get('TRACKIT_DASHBOARD_PAGE_SIZE', 50))
 
-def get_price_history_db_connection():
-    conn = sqlite3.connect(price_history_db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+REQUEST_SECONDS = Histogram('trackit_http_request_seconds', 'Request latency by endpoint, method and status.',
+                            ('endpoint', 'method', 'status'))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    # Streamed responses are timed until their first byte is ready
+    started = g.get('request_started')
+    if started is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=request.endpoint or 'unmatched',
+                                method=request.method, status=response.status_code)
+    return response
 
 def get_username(email):
     """Extracts the username from an email address."""
     return email.split('@')[0] if '@' in email else email
 
-# Create the `amazon_data` table if it doesn't exist
+# Create the product and price history tables if they don't exist
 def initialize_database():
     conn = get_price_history_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS amazon_data (
-            srno INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            link TEXT NOT NULL UNIQUE,
-            "2024-10-08" INTEGER DEFAULT 0,
-            "2024-10-09" INTEGER DEFAULT 0,
-            "2024-10-10" INTEGER DEFAULT 0,
-            "2024-10-11" INTEGER DEFAULT 0,
-            "2024-10-12" INTEGER DEFAULT 0,
-            "2024-10-13" INTEGER DEFAULT 0,
-            "2024-10-14" INTEGER DEFAULT 0,
-            "2024-10-15" INTEGER DEFAULT 0,
-            "2024-10-16" INTEGER DEFAULT 0
-        )
-    ''')
-    conn.commit()
+    init_price_store(conn)
     conn.close()
 
-initialize_database()
-
+    conn = get_users_db_connection()
+    init_watchlist(conn)
+    conn.close()
 
-# Initialize Logger
-logging.basicConfig(level=logging.INFO)
+_database_ready = False
+_database_lock = threading.Lock()
 
-# Load data and initialize model
-try:
-    # Connect to the database and load data
-    conn = sqlite3.connect(price_history_db_path)
-    query = "SELECT * FROM amazon_data"
-    dataset = pd.read_sql_query(query, conn)
-    conn.close()
+@app.before_request
+def ensure_database():
+    """Creates the tables on the first request rather than at import time."""
+    global _database_ready
+    if not _database_ready:
+        with _database_lock:
+            if not _database_ready:
+                initialize_database()
+                _database_ready = True
 
-    # Initialize prediction model
-    predictor = PricePredictionModel(dataset)
-    predictor_dataset = predictor.preprocess_data()
-    predictor.train_model()  # Train the model with the cleaned dataset
 
-    logging.info("PricePredictionModel initialized successfully.")
-except Exception as e:
-    logging.error(f"Failed to initialize PricePredictionModel: {e}")
-    predictor = None
+# Initialize Logger
+logging.basicConfig(level=logging.INFO)
 
 
 @app.route('/')
 def index():
     return render_template('index.html', title="TrackIT")
 
-@app.route('/scrape', methods=['POST'])
-def scrape():
-    amazon_product_url = request.form['url']
-    amazon_data = scrape_amazon_product(amazon_product_url)
-    product_name = amazon_data.get('name', 'N/A')
-    current_price = amazon_data['price']
-    product_link = amazon_data['link']
-    today_date = datetime.now().strftime('%Y-%m-%d')
+# Scrapes run in the job workers; their metrics are published through the jobs database
+register_stats('trackit_jobs', 'Queued and running jobs per priority class.', queue_stats, label='priority')
+# Requests for a product already being scraped join its job instead of scraping again
+register_stats('trackit_singleflight', 'Jobs queued and joined through dedupe keys.', lambda: dedupe_stats, label='group')
+register_snapshot_source(worker_metric_snapshots)
 
-    prediction = "Prediction unavailable"
+@app.route('/metrics')
+def metrics():
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
 
-    conn = get_price_history_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        cursor.execute(f'ALTER TABLE amazon_data ADD COLUMN "{today_date}" INTEGER DEFAULT 0')
-        conn.commit()
-    except sqlite3.OperationalError:
-        # Column already exists
-        pass
+# Seconds a client is asked to wait when a queue is full
+RETRY_AFTER = 30
 
-    prediction_text = "Prediction unavailable"
+def queue_full_response(message):
+    response = make_response(render_template('index.html', title="TrackIT", error=message), 503)
+    response.headers['Retry-After'] = str(RETRY_AFTER)
+    return response
 
+@app.route('/scrape', methods=['POST'])
+def scrape():
+    amazon_product_url = request.form['url']
+    # Requests for a product already being scraped join that job
     try:
-        cursor.execute('SELECT * FROM amazon_data WHERE name = ?', (product_name,))
-        product = cursor.fetchone()
-
-        if product:
-            # Update today's price for the product
-            cursor.execute(f'UPDATE amazon_data SET "{today_date}" = ? WHERE name = ?', (current_price, product_name))
-            conn.commit()
-
-            # Extract price columns
-            product_prices = [product[col] for col in product.keys() if col.startswith("2024-")]
-
-            # Clean and filter numeric prices
-            def clean_price(price):
-                if isinstance(price, str):
-                    price = price.replace('₹', '').replace(',', '').strip()
-                try:
-                    return float(price)
-                except (ValueError, TypeError):
-                    return None
-
-            cleaned_prices = [clean_price(price) for price in product_prices if price is not None]
-
-            # Check if sufficient data is available for prediction
-            if len(cleaned_prices) >= 2 and predictor:
-                avg_price = sum(cleaned_prices) / len(cleaned_prices)
-                price_std = (sum((x - avg_price) ** 2 for x in cleaned_prices) / len(cleaned_prices)) ** 0.5
-                price_change = (max(cleaned_prices) - min(cleaned_prices)) / max(cleaned_prices)
-                input_features = [price_std, price_change]
-                try:
-                    prediction = predictor.predict(input_features)
-                except Exception as e:
-                    logging.error(f"Error during prediction: {e}")
-                    prediction = -1  # Default value
-            else:
-                logging.warning("Insufficient data for prediction.")
-                prediction = -1  # Default value
+        job_id = submit('scrape', {'url': amazon_product_url}, 'interactive',
+                        dedupe_key=f"scrape:{canonical_url(amazon_product_url)}")
+    except QueueFull:
+        return queue_full_response('Too many products are being looked up right now. Please try again shortly.')
+    return redirect(url_for('scrape_result', job_id=job_id))
 
-            
-        else:
-            # Insert new product data into the database
-            cursor.execute(f'''
-                INSERT INTO amazon_data (name, link, "{today_date}")
-                VALUES (?, ?, ?)
-            ''', (product_name, product_link, current_price))
-            conn.commit()
+SCRAPE_FAILED = 'Sorry, the product could not be scraped.'
 
-    except Exception as e:
-        logging.error(f"Error processing prediction: {e}")
+def get_scrape_job(job_id):
+    conn = get_jobs_connection()
+    try:
+        job = get_job(conn, job_id)
+    finally:
+        conn.close()
+    if job is None or job['kind'] != 'scrape':
+        abort(404)
+    return job
+
+@app.route('/scrape/<int:job_id>', methods=['GET'])
+def scrape_result(job_id):
+    """Shows the results once the scrape job is done; until then cards filled in from /scrape/<id>/events."""
+    job = get_scrape_job(job_id)
+    if job['status'] == 'done':
+        return render_template('result.html', **job['result'])
+    if job['status'] == 'failed':
+        return render_template('result.html', error=SCRAPE_FAILED)
+    return render_template('result.html', job=job, stream_url=url_for('scrape_events', job_id=job_id))
+
+# Seconds between checks for new scrape events, and before an idle stream is
+# closed (the browser reconnects and resumes from Last-Event-ID)
+EVENT_POLL_INTERVAL = 0.25
+EVENT_STREAM_TIMEOUT = 120
+SCRAPE_PARTS = ('amazon', 'flipkart', 'reliance', 'prediction')
+
+def server_sent_event(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return '\n'.join(lines) + '\n\n'
+
+def render_scrape_part(part, data):
+    """Renders one result card for the event stream, with the link the Track form needs."""
+    context = data if part == 'prediction' else {part: data}
+    return {'html': render_template(f'_result_{part}.html', **context), 'link': data.get('link', '')}
+
+@app.route('/scrape/<int:job_id>/events', methods=['GET'])
+def scrape_events(job_id):
+    """Server-sent events for a scrape job: each retailer's card as soon as it is scraped, then done or failed."""
+    get_scrape_job(job_id)  # 404 for unknown jobs
+    last_event_id = request.headers.get('Last-Event-ID', 0, type=int)
+
+    def generate():
+        after = last_event_id
+        sent = set()
+        state = None
+        started = time.monotonic()
+        conn = get_jobs_connection()
+        try:
+            yield 'retry: 1000\n\n'
+            while time.monotonic() - started < EVENT_STREAM_TIMEOUT:
+                # Read the job before its events, so a finished job's events are all there
+                job = get_job(conn, job_id)
+                if job is None:
+                    # Purged since the stream opened, or a reconnect after it was
+                    yield server_sent_event('failed', {'error': SCRAPE_FAILED})
+                    return
+                for event in get_events(conn, job_id, after):
+                    after = event['id']
+                    if event['event'] in SCRAPE_PARTS:
+                        sent.add(event['event'])
+                        yield server_sent_event(event['event'], render_scrape_part(event['event'], event['data']), after)
+                if job['status'] == 'done':
+                    # Parts published after the job finished are taken from its result
+                    result = job['result']
+                    for part in SCRAPE_PARTS:
+                        if part not in sent:
+                            data = result if part == 'prediction' else result[part]
+                            yield server_sent_event(part, render_scrape_part(part, data))
+                    yield server_sent_event('done', {})
+                    return
+                if job['status'] == 'failed':
+                    yield server_sent_event('failed', {'error': SCRAPE_FAILED})
+                    return
+                if (job['status'], job.get('position')) != state:
+                    state = (job['status'], job.get('position'))
+                    yield server_sent_event(job['status'], {'position': job.get('position')})
+                time.sleep(EVENT_POLL_INTERVAL)
+        finally:
+            conn.close()
 
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-    # Fetch additional details
-    flipkart_product_url = find_flipkart_link(product_name)
-    flipkart_data = scrape_flipkart_product(flipkart_product_url) if flipkart_product_url else {}
-    reliance_product_data = get_first_product_details(product_name)
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def job_status(job_id):
+    conn = get_jobs_connection()
+    try:
+        job = get_job(conn, job_id)
+    finally:
+        conn.close()
+    if job is None:
+        abort(404)
+    return jsonify({key: job.get(key) for key in ('id', 'kind', 'status', 'position', 'error', 'created_at', 'started_at', 'finished_at')})
 
-    conn.close()
-    prediction_value = int(prediction) if str(prediction).isdigit() else -1
-    return render_template(
-        'result.html',
-        amazon=amazon_data,
-        flipkart=flipkart_data,
-        reliance=reliance_product_data,
-        prediction=prediction_value
-        )
-        
 @app.route('/track', methods=['POST'])
 def track():
     # Get product details from the form
@@ -289,11 +320,19 @@ def dashboard():
         flash('Please log in to access the dashboard.', 'warning')
         return redirect(url_for('login'))
 
+    page = max(request.args.get('page', 1, type=int), 1)
+
     conn = get_users_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT email FROM User WHERE id = ?", (user_id,))
-    user = cursor.fetchone()
-    conn.close()
+    try:
+        user = conn.execute("SELECT email FROM User WHERE id = ?", (user_id,)).fetchone()
+        if user:
+            # Fetch one page of the user's watchlist per platform
+            counts = count_watchlist(conn, user_id)
+            watchlist = {platform: get_watchlist_page(conn, user_id, platform, DASHBOARD_PAGE_SIZE,
+                                                      (page - 1) * DASHBOARD_PAGE_SIZE)
+                         for platform in counts}
+    finally:
+        conn.close()
 
     if not user:
         flash('User not found. Please log in again.', 'danger')
@@ -301,16 +340,11 @@ def dashboard():
 
     username = get_username(user['email'])
 
-    # Fetch user's watchlist
-    conn_price = get_users_db_connection()
-    cursor_price = conn_price.cursor()
-    cursor_price.execute("SELECT * FROM user WHERE email = ?", (user_email,))
-    watchlist = cursor_price.fetchone()
-    conn_price.close()
-
-    watchlist_details = fetch_watchlist_details(watchlist) if watchlist else {'amazon': [], 'flipkart': []}
+    watchlist_details = fetch_watchlist_details(watchlist)
+    pages = max(1, -(-max(counts.values(), default=0) // DASHBOARD_PAGE_SIZE))
 
-    return render_template('dashboard.html', username=username, watchlist=watchlist_details)
+    return render_template('dashboard.html', username=username, watchlist=watchlist_details,
+                           page=page, pages=pages)
 
 @app.route('/logout', methods=['POST'])
 def logout():
@@ -330,6 +364,65 @@ def get_srno_from_link(link, table):
         return result['srno']
     return None
 
+@app.route('/api/price_history/<platform>/<int:srno>', methods=['GET'])
+def price_history_api(platform, srno):
+    """Downsampled price series for charts: ?days=365&points=60&method=lttb|minmax"""
+    if platform not in PRODUCT_TABLES:
+        abort(404)
+    method = request.args.get('method', 'lttb')
+    if method not in DOWNSAMPLERS:
+        abort(400)
+    days = request.args.get('days', type=int)
+    points = request.args.get('points', DEFAULT_POINTS, type=int)
+
+    conn = get_price_history_db_connection()
+    try:
+        etag, last_observed_at, payload = get_price_series(conn, platform, srno, days, points, method)
+    finally:
+        conn.close()
+
+    response = jsonify(payload)
+    response.set_etag(etag)
+    if last_observed_at:
+        response.last_modified = datetime.fromisoformat(last_observed_at)
+    # Browsers keep the series but check back every time; unchanged series cost a 304
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/export', methods=['GET'])
+def export():
+    """Streams price history: ?format=csv|jsonl|parquet&platform=amazon&start=YYYY-MM-DD&end=YYYY-MM-DD"""
+    if not session.get('user_id'):
+        flash('Please log in to export price history.', 'warning')
+        return redirect(url_for('login'))
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        abort(400)
+    if not format_available(fmt):
+        abort(501)
+    platforms = request.args.getlist('platform') or None
+    if platforms and any(platform not in PRODUCT_TABLES for platform in platforms):
+        abort(400)
+    start, end = request.args.get('start'), request.args.get('end')
+    try:
+        for value in (start, end):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        abort(400)
+
+    def generate():
+        conn = get_price_history_db_connection()
+        try:
+            yield from export_price_history(conn, fmt, platforms, start, end)
+        finally:
+            conn.close()
+
+    mimetype, extension = FORMATS[fmt]
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=price_history.{extension}'})
+
 @app.template_filter('fromjson')
 def fromjson_filter(json_str):
     """Custom filter to parse JSON strings."""
@@ -339,38 +432,28 @@ def fromjson_filter(json_str):
         return []
 
 def fetch_watchlist_details(watchlist):
-    """Fetch detailed information about the products in the user's watchlist."""
-    watchlist_details = {'amazon': [], 'flipkart': []}
-    conn_price = get_users_db_connection()
-    cursor_price = conn_price.cursor()
+    """Fetch name, link, latest price and drop probability of the watchlisted products.
 
+    One query per platform for the products and one batched model call per
+    platform for the predictions.
+    """
+    predictor = predictor_loader.get()
     conn_data = get_price_history_db_connection()
-    cursor_data = conn_data.cursor()
-
-    if watchlist['srno_a']:
-        try:
-            srnos_a = json.loads(watchlist['srno_a'])
-            for srno in srnos_a:
-                cursor_data.execute("SELECT * FROM amazon_data WHERE srno = ?", (srno,))
-                product = cursor_data.fetchone()
-                if product:
-                    watchlist_details['amazon'].append(product)
-        except Exception as e:
-            logging.error(f"Error parsing srno_a: {e}")
-
-    if watchlist['srno_f']:
-        try:
-            srnos_f = json.loads(watchlist['srno_f'])
-            for srno in srnos_f:
-                cursor_data.execute("SELECT * FROM flipkart_data WHERE srno = ?", (srno,))
-                product = cursor_data.fetchone()
-                if product:
-                    watchlist_details['flipkart'].append(product)
-        except Exception as e:
-            logging.error(f"Error parsing srno_f: {e}")
-
-    conn_price.close()
-    return watchlist_details
+    try:
+        details = {}
+        for platform, srnos in watchlist.items():
+            details[platform] = get_product_summaries(conn_data, platform, srnos)
+            predictions = {}
+            if predictor and srnos:
+                try:
+                    predictions = predictor.predict_products(conn_data, platform, srnos)
+                except Exception as e:
+                    logging.error(f"Error predicting {platform} watchlist: {e}")
+            for product in details[platform]:
+                product['drop_probability'] = predictions.get(product['srno'])
+        return details
+    finally:
+        conn_data.close()
 
 # Notification Route (Optional: Trigger manually)
 @app.route('/send_notifications', methods=['GET'])
@@ -378,34 +461,15 @@ def send_notifications():
     """
     Manual route to trigger notifications.
     You can access this route to send notifications to all users.
+    The alerts are worked out and sent by a background job.
     """
-    price_drops_amazon = notify("amazon_data")
-    price_drops_flipkart = notify("flipkart_data")
-
-    conn_users = get_users_db_connection()
-    cursor_users = conn_users.cursor()
-    cursor_users.execute("SELECT * FROM user")
-    user_carts = cursor_users.fetchall()
-    conn_users.close()
-
-    for cart in user_carts:
-        user_email = cart['user_mail']
-        # Check Flipkart notifications
-        if cart['srno_f']:
-            srnos_f = json.loads(cart['srno_f'])
-            for srno in price_drops_flipkart:
-                if srno in srnos_f:
-                    send_mail(user_email)
-                    break
-        # Check Amazon notifications
-        if cart['srno_a']:
-            srnos_a = json.loads(cart['srno_a'])
-            for srno in price_drops_amazon:
-                if srno in srnos_a:
-                    send_mail(user_email)
-                    break
-
-    flash('Notifications have been sent successfully.', 'success')
+    try:
+        job_id = submit('send_notifications', {}, 'nightly', dedupe_key='send_notifications')
+    except QueueFull:
+        flash('Too many jobs are queued; please try again later.', 'warning')
+        return redirect(url_for('dashboard')), 503
+
+    flash(f'Price drop alerts are being sent (job {job_id}).', 'success')
     return redirect(url_for('dashboard'))
 
 # Route to remove item from watchlist
@@ -415,10 +479,7 @@ def remove_watchlist():
     platform = request.form.get('platform')  # 'amazon' or 'flipkart'
     srno = request.form.get('srno')  # The serial number of the product to remove
 
-    # Debugging print
-    print(f"Form data: {request.form}")
-    print(f"Platform: {platform}")
-    print(f"Serial Number: {srno}")
+    logging.debug(f"Removing {platform} product {srno} from the watchlist")
 
     if not user_email:
         flash('Please log in to remove products from your watchlist.', 'warning')
@@ -436,7 +497,7 @@ def remove_watchlist():
         remove_item(user_email, columnname, int(srno))
         flash('Product removed from your watchlist.', 'success')
     except Exception as e:
-        print(f"Error during removal: {e}")
+        logging.error(f"Error during removal: {e}")
         flash('Failed to remove product from your watchlist.', 'danger')
 
     return redirect(url_for('dashboard'))
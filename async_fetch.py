@@ -0,0 +1,204 @@
+# async_fetch.py
+#
+# asyncio fetch engine for pages that do not need a browser. One event loop
+# runs in a background thread and owns a keep-alive aiohttp session, so plain
+# synchronous code (Flask views, refresh jobs) can fetch one page or many
+# pages concurrently through fetch_html() / fetch_many().
+
+import os
+import time
+import atexit
+import random
+import asyncio
+import logging
+import threading
+from urllib.parse import urlparse
+from email.utils import parsedate_to_datetime
+from metrics import register_stats
+
+FETCH_CONCURRENCY = int(os.environ.get('TRACKIT_FETCH_CONCURRENCY', 32))  # requests in flight overall
+FETCH_PER_HOST = int(os.environ.get('TRACKIT_FETCH_PER_HOST', 8))  # open connections per host
+FETCH_HOST_INTERVAL = float(os.environ.get('TRACKIT_FETCH_HOST_INTERVAL', 0))  # min seconds between request starts per host
+FETCH_CONNECT_TIMEOUT = float(os.environ.get('TRACKIT_FETCH_CONNECT_TIMEOUT', 5))
+FETCH_RETRIES = int(os.environ.get('TRACKIT_FETCH_RETRIES', 3))
+FETCH_BACKOFF = float(os.environ.get('TRACKIT_FETCH_BACKOFF', 0.5))  # seconds, doubled per retry
+MAX_RETRY_AFTER = float(os.environ.get('TRACKIT_FETCH_MAX_RETRY_AFTER', 60))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def retry_after_seconds(value):
+    """Parses a Retry-After header (seconds or HTTP date); None if absent or invalid."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Seconds to wait before retry number `attempt` (1-based).
+
+    A server's Retry-After wins, capped at MAX_RETRY_AFTER; otherwise
+    exponential backoff with full jitter so retries from many requests do
+    not arrive together.
+    """
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_AFTER)
+    return random.uniform(0, FETCH_BACKOFF * (2 ** (attempt - 1)))
+
+
+class AsyncFetcher:
+    """Owns the event loop thread and the pooled aiohttp session."""
+
+    def __init__(self, concurrency=FETCH_CONCURRENCY, per_host=FETCH_PER_HOST, timeout=10,
+                 retries=FETCH_RETRIES, host_interval=FETCH_HOST_INTERVAL, headers=None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.host_interval = host_interval
+        self.headers = headers
+        self._loop = None
+        self._session = None
+        self._semaphore = None
+        self._next_start = {}  # host -> loop time the next request may start
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'ok': 0, 'retries': 0, 'failed': 0, 'bytes': 0}
+
+    # Event loop plumbing
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='async-fetch', daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._open(), self._loop).result()
+        return self._loop
+
+    async def _open(self):
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host,
+                                         keepalive_timeout=30, ttl_dns_cache=300)
+        self._session = aiohttp.ClientSession(
+            connector=connector, headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout, connect=FETCH_CONNECT_TIMEOUT))
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    def run(self, coroutine):
+        """Runs a coroutine on the fetch loop and waits for its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_started()).result()
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+    # Fetching
+
+    async def _wait_for_host(self, url, interval=None):
+        """Spaces request starts to one host by host_interval seconds, or `interval` if longer."""
+        interval = max(self.host_interval, interval or 0)
+        if interval <= 0:
+            return
+        host = urlparse(url).netloc
+        now = self._loop.time()
+        start = max(now, self._next_start.get(host, now))
+        self._next_start[host] = start + interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def fetch(self, url, timeout=None, host_interval=None):
+        """Returns the page body as text, or None after the last failed attempt."""
+        import aiohttp
+
+        options = {'timeout': aiohttp.ClientTimeout(total=timeout, connect=FETCH_CONNECT_TIMEOUT)} if timeout else {}
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            await self._wait_for_host(url, host_interval)
+            async with self._semaphore:
+                self.stats['requests'] += 1
+                try:
+                    async with self._session.get(url, **options) as response:
+                        if response.status == 200:
+                            body = await response.text(errors='replace')
+                            self.stats['ok'] += 1
+                            self.stats['bytes'] += len(body)
+                            return body
+                        if response.status not in RETRY_STATUSES:
+                            logging.info(f"Fetch of {url} returned status {response.status}")
+                            break
+                        retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+                        reason = f"status {response.status}"
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    reason = repr(e)
+            if attempt == self.retries:
+                logging.warning(f"Giving up on {url} after {attempt + 1} attempts ({reason})")
+                break
+            self.stats['retries'] += 1
+            # Sleep outside the semaphore so waiting retries do not hold a slot
+            await asyncio.sleep(backoff_delay(attempt + 1, retry_after))
+        self.stats['failed'] += 1
+        return None
+
+    async def fetch_all(self, urls, per_host=None, host_interval=None):
+        """Fetches every URL; with `per_host`, at most that many of them to one host at a time."""
+        semaphores = {}
+
+        async def fetch_limited(url):
+            if per_host is None:
+                return await self.fetch(url, host_interval=host_interval)
+            async with semaphores.setdefault(urlparse(url).netloc, asyncio.Semaphore(per_host)):
+                return await self.fetch(url, host_interval=host_interval)
+
+        return await asyncio.gather(*(fetch_limited(url) for url in urls))
+
+    def fetch_html(self, url, timeout=None):
+        return self.run(self.fetch(url, timeout))
+
+    def fetch_many(self, urls, per_host=None, host_interval=None):
+        """Fetches every URL concurrently; returns {url: html or None}.
+
+        `per_host` and `host_interval` tighten the session's per-host limits
+        for this batch, e.g. to the refresh jobs' politeness settings.
+        """
+        urls = list(dict.fromkeys(urls))
+        return dict(zip(urls, self.run(self.fetch_all(urls, per_host, host_interval))))
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher():
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            from fast_extract import HEADERS, HTTP_TIMEOUT
+            _fetcher = AsyncFetcher(timeout=HTTP_TIMEOUT, headers=HEADERS)
+            atexit.register(_fetcher.close)
+    return _fetcher
+
+
+def fetcher_stats():
+    """Counters of the shared fetcher; empty before first use."""
+    return dict(_fetcher.stats) if _fetcher is not None else {}
+
+register_stats('trackit_fetch', 'Async HTTP fetch engine counters.', fetcher_stats)
+
+
+def fetch_html(url, timeout=None):
+    return get_fetcher().fetch_html(url, timeout)
+
+
+def fetch_many(urls, per_host=None, host_interval=None):
+    return get_fetcher().fetch_many(urls, per_host, host_interval)
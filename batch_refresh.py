@@ -0,0 +1,109 @@
+# batch_refresh.py
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from urllib.parse import urlparse
+from price_store import PRODUCT_TABLES, record_prices
+
+REFRESH_WORKERS = int(os.environ.get('TRACKIT_REFRESH_WORKERS', 4))
+REFRESH_CHUNK_SIZE = int(os.environ.get('TRACKIT_REFRESH_CHUNK_SIZE', 50))
+# At most this many requests in flight per domain...
+DOMAIN_CONCURRENCY = int(os.environ.get('TRACKIT_REFRESH_DOMAIN_CONCURRENCY', 2))
+# ...and at least this many seconds between request starts to the same domain
+DOMAIN_MIN_INTERVAL = float(os.environ.get('TRACKIT_REFRESH_DOMAIN_INTERVAL', 1.0))
+
+
+class DomainThrottle:
+    """Per-domain concurrency cap plus a minimum spacing between requests."""
+
+    def __init__(self, concurrency=DOMAIN_CONCURRENCY, min_interval=DOMAIN_MIN_INTERVAL):
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_start = {}
+
+    @contextmanager
+    def slot(self, url):
+        domain = urlparse(url).netloc
+        with self._lock:
+            semaphore = self._semaphores.setdefault(domain, threading.BoundedSemaphore(self.concurrency))
+        with semaphore:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start.get(domain, now))
+                self._next_start[domain] = start + self.min_interval
+            if start > now:
+                time.sleep(start - now)
+            yield
+
+
+def refresh_platform(conn, platform, scrape, srnos, workers=REFRESH_WORKERS, chunk_size=REFRESH_CHUNK_SIZE,
+                     throttle=None, run_date=None, scrape_many=None, on_chunk=None):
+    """Re-scrapes the given products of a platform and records today's prices.
+
+    `scrape(link)` must return (price, name), like functions.scrape_amazon.
+    Products are scraped by a pool of `workers` threads, throttled per
+    domain, and written one chunk at a time in a single transaction.
+    `on_chunk(conn, srnos)` runs inside that transaction, so whatever it
+    records commits together with the chunk's prices.
+    With `scrape_many(links, throttle)` -> {link: (price, name)}, each chunk
+    is scraped in one concurrent batch instead, under the same per-domain
+    `throttle`.
+    Returns a dict of counters.
+    """
+    table = PRODUCT_TABLES[platform]
+    run_date = run_date or str(date.today())
+    throttle = throttle or DomainThrottle()
+
+    srnos = list(srnos)
+    placeholders = ', '.join('?' * len(srnos))
+    products = conn.execute(f'SELECT srno, link FROM {table} WHERE srno IN ({placeholders}) ORDER BY srno',
+                            srnos).fetchall() if srnos else []
+    stats = {'products': len(products), 'refreshed': 0, 'failed': 0}
+    started_at = time.monotonic()
+
+    def scrape_one(product):
+        srno, link = product[0], product[1]
+        try:
+            with throttle.slot(link):
+                price, name = scrape(link)
+            return srno, price
+        except Exception as e:
+            logging.error(f"Failed to refresh {platform} product {srno} ({link}): {e}")
+            return srno, None
+
+    def scrape_chunk(chunk):
+        try:
+            scraped = scrape_many([link for srno, link in chunk], throttle)
+        except Exception as e:
+            logging.error(f"Failed to refresh a chunk of {len(chunk)} {platform} products: {e}")
+            scraped = {}
+        return [(srno, scraped.get(link, (None, None))[0]) for srno, link in chunk]
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'refresh-{platform}') as executor:
+        for offset in range(0, len(products), chunk_size):
+            chunk = products[offset:offset + chunk_size]
+            if scrape_many is not None:
+                results = scrape_chunk(chunk)
+            else:
+                results = list(executor.map(scrape_one, chunk))
+            observations = [(platform, srno, price, run_date) for srno, price in results]
+
+            with conn:
+                written = record_prices(conn, observations)
+                if on_chunk is not None:
+                    on_chunk(conn, [srno for srno, link in chunk])
+
+            stats['refreshed'] += written
+            stats['failed'] += len(chunk) - written
+            logging.info(f"{platform} refresh: {offset + len(chunk)}/{len(products)} products done.")
+
+    stats['seconds'] = round(time.monotonic() - started_at, 2)
+    logging.info(f"{platform} refresh finished: {stats}")
+    return stats
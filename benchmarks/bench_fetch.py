@@ -0,0 +1,107 @@
+# benchmarks/bench_fetch.py
+#
+# Compares the ways pages can be fetched over plain HTTP against the local
+# fixture server: one requests.get per page, the shared requests session on a
+# thread pool (the old bulk refresh), and the asyncio engine in async_fetch.py.
+#
+#     python benchmarks/bench_fetch.py [--pages 300] [--latency 50] [--fail-rate 0] [--pad-kb 100]
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fast_extract import HEADERS, HTTP_TIMEOUT, get_session, _fetch_html_requests
+from async_fetch import AsyncFetcher
+from fixture_server import spawn_server
+
+
+def fixture_urls(base_url, pages):
+    """Product pages spread evenly over the three retailers."""
+    urls = []
+    for i in range(pages):
+        retailer = ('amazon', 'flipkart', 'reliance')[i % 3]
+        if retailer == 'amazon':
+            urls.append(f"{base_url}/amazon/dp/B0FX{i:05d}")
+        else:
+            urls.append(f"{base_url}/{retailer}/fixture-phone-{i}/p/itmfx{i}")
+    return urls
+
+
+def fetch_sequential(urls):
+    import requests
+
+    pages = []
+    for url in urls:
+        try:
+            response = requests.get(url, headers=HEADERS, timeout=HTTP_TIMEOUT)
+            pages.append(response.text if response.status_code == 200 else None)
+        except requests.RequestException:
+            pages.append(None)
+    return pages
+
+
+def fetch_threaded(urls, workers):
+    get_session()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_fetch_html_requests, urls))
+
+
+def fetch_async(urls, fetcher):
+    results = fetcher.fetch_many(urls)
+    return [results[url] for url in urls]
+
+
+def measure(name, fetch, urls):
+    started = time.perf_counter()
+    pages = fetch(urls)
+    seconds = time.perf_counter() - started
+    ok = sum(1 for page in pages if page)
+    return {'engine': name, 'pages': len(urls), 'ok': ok, 'seconds': round(seconds, 3),
+            'pages_per_second': round(len(urls) / seconds, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the HTTP fetch engines.')
+    parser.add_argument('--pages', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=50, help='server latency per response in milliseconds')
+    parser.add_argument('--fail-rate', type=float, default=0)
+    parser.add_argument('--pad-kb', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=4, help='threads for the threaded requests engine')
+    parser.add_argument('--sequential-pages', type=int, default=60, help='pages for the slow sequential engine')
+    args = parser.parse_args()
+
+    process, base_url = spawn_server(args.latency, args.fail_rate, args.pad_kb)
+    fetcher = AsyncFetcher(headers=HEADERS, timeout=HTTP_TIMEOUT)
+    try:
+        urls = fixture_urls(base_url, args.pages)
+        # Warm-up so connection setup and imports are not counted once per engine
+        fetch_threaded(urls[:3], args.workers)
+        fetch_async(urls[:3], fetcher)
+
+        results = [
+            measure('requests-sequential', fetch_sequential, urls[:args.sequential_pages]),
+            measure(f'requests-threads-{args.workers}', lambda batch: fetch_threaded(batch, args.workers), urls),
+            measure('async', lambda batch: fetch_async(batch, fetcher), urls),
+        ]
+        report = {
+            'base_url': base_url,
+            'latency_ms': args.latency,
+            'fail_rate': args.fail_rate,
+            'pad_kb': args.pad_kb,
+            'results': results,
+            'async_stats': fetcher.stats,
+        }
+        print(json.dumps(report, indent=2))
+    finally:
+        fetcher.close()
+        process.terminate()
+
+
+if __name__ == '__main__':
+    main()
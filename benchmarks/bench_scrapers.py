@@ -0,0 +1,226 @@
+# benchmarks/bench_scrapers.py
+#
+# Replays the fixture pages through every scraper, over plain HTTP and in the
+# headless browser, and reports pages/sec, p50/p95 latency, peak RSS and how
+# many fields came out right. Each extractor/backend pair runs in its own
+# process, so its peak RSS is its own. Pass a previous report to --compare to
+# flag slowdowns and broken selectors before a deploy.
+#
+#     python benchmarks/bench_scrapers.py [--pages 50] [--backends http,browser] [--out report.json]
+#     python benchmarks/bench_scrapers.py --compare report.json   # exits 1 on regressions
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fixture_server import spawn_server, fixture_price
+
+# name: (kind, retailer, {backend: scraper}). 'http' on a product page is the
+# plain-HTTP tier of extract_product(), which scrape_amazon / scrape_flipkart
+# share; the other scrapers are looked up in functions.py by name.
+EXTRACTORS = {
+    'amazon_product': ('product', 'amazon', {'http': 'http_tier', 'browser': 'scrape_amazon_product_browser'}),
+    'flipkart_product': ('product', 'flipkart', {'http': 'http_tier', 'browser': 'scrape_flipkart_product_browser'}),
+    'reliance_product': ('product', 'reliance', {'http': 'http_tier', 'browser': 'scrape_reliance_product_browser'}),
+    'amazon_refresh': ('refresh', 'amazon', {'browser': 'scrape_amazon_browser'}),
+    'flipkart_refresh': ('refresh', 'flipkart', {'browser': 'scrape_flipkart_browser'}),
+    'flipkart_search': ('search', 'flipkart', {'http': 'find_flipkart_link'}),
+    'reliance_search': ('search', 'reliance', {'browser': 'get_first_product_details'}),
+}
+
+# Fields checked for each kind of extractor
+FIELDS = {
+    'product': ('name', 'price', 'image'),
+    'refresh': ('name', 'price'),
+    'search': ('name', 'price', 'link'),
+}
+
+# A case regresses when throughput, p95 latency or peak RSS worsen by more than this share
+DEFAULT_TOLERANCE = 0.2
+
+
+def case_input(base_url, kind, retailer, i):
+    """Returns (scraper argument, product id as the page shows it) for page number i."""
+    if kind == 'search':
+        return f"Fixture Phone {i} Midnight Black 128 GB", str(i)
+    if retailer == 'amazon':
+        product_id = f"B0FX{i:05d}"
+        return f"{base_url}/amazon/dp/{product_id}", product_id
+    product_id = f"itmfx{i}"
+    return f"{base_url}/{retailer}/fixture-phone-{i}/p/{product_id}", product_id
+
+
+def check_fields(kind, retailer, result, product_id):
+    """Returns {field: extracted correctly} for one scraper result."""
+    from price_store import parse_price_paise
+
+    if isinstance(result, str) or result is None:
+        # find_flipkart_link returns only the link
+        result = {'link': result}
+    expected_name = f"Fixture Phone {product_id}"
+    checks = {
+        'name': (result.get('name') or '').strip().startswith(expected_name + ' '),
+        'price': parse_price_paise(result.get('price')) == fixture_price(product_id) * 100,
+        'image': product_id in (result.get('image') or ''),
+        'link': bool(re.search(rf'/p/itmfx{re.escape(product_id)}\b', result.get('link') or '')),
+    }
+    fields = FIELDS[kind]
+    if kind == 'search' and retailer == 'flipkart':
+        fields = ('link',)
+    return {field: checks[field] for field in fields}
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(round(share * (len(values) - 1))), len(values) - 1)]
+
+
+def run_case(extractor, backend, base_url, pages):
+    """Runs one extractor/backend pair in this process and returns its results."""
+    os.environ.setdefault('TRACKIT_FLIPKART_BASE_URL', f"{base_url}/flipkart")
+    os.environ.setdefault('TRACKIT_RELIANCE_BASE_URL', f"{base_url}/reliance")
+    import functions
+    from fast_extract import fetch_html, PARSERS
+
+    kind, retailer, backends = EXTRACTORS[extractor]
+    name = backends[backend]
+    if name == 'http_tier':
+        def scrape(url):
+            html = fetch_html(url)
+            return PARSERS[retailer](html, url) if html is not None else {}
+    else:
+        scrape = getattr(functions, name)
+        # Bypass the scrape caches so every page is really fetched
+        scrape = getattr(scrape, 'uncached', scrape)
+
+    if backend == 'browser':
+        from driver_pool import checkout_driver, checkin_driver
+        try:
+            checkin_driver(checkout_driver())
+        except Exception as e:
+            return {'skipped': f"browser unavailable: {e.__class__.__name__}"}
+
+    scrape(case_input(base_url, kind, retailer, pages)[0])  # warm-up, not measured
+
+    latencies, correct = [], {}
+    started = time.perf_counter()
+    for i in range(pages):
+        argument, product_id = case_input(base_url, kind, retailer, i)
+        page_started = time.perf_counter()
+        result = scrape(argument)
+        latencies.append(time.perf_counter() - page_started)
+        for field, ok in check_fields(kind, retailer, result, product_id).items():
+            correct[field] = correct.get(field, 0) + ok
+    seconds = time.perf_counter() - started
+
+    report = {
+        'pages': pages,
+        'pages_per_second': round(pages / seconds, 2),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'field_accuracy': {field: round(count / pages, 3) for field, count in correct.items()},
+    }
+    report['accuracy'] = round(statistics.mean(report['field_accuracy'].values()), 3)
+    if backend == 'browser':
+        from driver_pool import get_driver_pool
+        get_driver_pool().close()
+        # Largest single browser process, once the pool has been shut down
+        report['peak_browser_rss_mb'] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    return report
+
+
+def run_case_process(extractor, backend, base_url, pages):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--case', f"{extractor}/{backend}",
+         '--base-url', base_url, '--pages', str(pages)],
+        cwd=ROOT, capture_output=True, text=True)
+    if output.returncode != 0:
+        return {'error': output.stderr.strip().splitlines()[-1] if output.stderr.strip() else f"exit {output.returncode}"}
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def compare(report, previous, tolerance=DEFAULT_TOLERANCE):
+    """Lists what got worse since `previous`: throughput, p95, peak RSS or any field's accuracy."""
+    regressions = []
+    for case, current in report['cases'].items():
+        before = previous.get('cases', {}).get(case)
+        if not before or 'pages_per_second' not in before:
+            continue
+        if 'error' in current:
+            regressions.append(f"{case}: failed ({current['error']})")
+        if 'pages_per_second' not in current:
+            continue
+        if current['pages_per_second'] < before['pages_per_second'] * (1 - tolerance):
+            regressions.append(f"{case}: {before['pages_per_second']} -> {current['pages_per_second']} pages/s")
+        for metric in ('p95_ms', 'peak_rss_mb'):
+            if current[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f"{case}: {metric} {before[metric]} -> {current[metric]}")
+        for field, accuracy in current['field_accuracy'].items():
+            if accuracy < before['field_accuracy'].get(field, 0):
+                regressions.append(f"{case}: {field} accuracy {before['field_accuracy'][field]} -> {accuracy}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks every scraper against the recorded fixture pages.')
+    parser.add_argument('--pages', type=int, default=50, help='pages per extractor and backend')
+    parser.add_argument('--backends', default='http,browser')
+    parser.add_argument('--extractors', default=','.join(EXTRACTORS))
+    parser.add_argument('--latency', type=float, default=0, help='fixture server latency in milliseconds')
+    parser.add_argument('--pad-kb', type=int, default=100)
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--compare', help='previous JSON report to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        # Child process: one extractor/backend pair
+        extractor, backend = args.case.split('/')
+        print(json.dumps(run_case(extractor, backend, args.base_url, args.pages)))
+        return
+
+    backends = args.backends.split(',')
+    process, base_url = spawn_server(args.latency, 0, args.pad_kb)
+    try:
+        cases = {}
+        for extractor in args.extractors.split(','):
+            for backend in EXTRACTORS[extractor][2]:
+                if backend in backends:
+                    cases[f"{extractor}/{backend}"] = run_case_process(extractor, backend, base_url, args.pages)
+    finally:
+        process.terminate()
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'pages': args.pages,
+        'latency_ms': args.latency,
+        'pad_kb': args.pad_kb,
+        'cases': cases,
+    }
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report['regressions'] = regressions
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_startup.py
+#
+# Measures how long a fresh interpreter takes to import app.py and to answer
+# its first request, and which modules dominate the import.
+#
+#     python benchmarks/bench_startup.py [--runs 5]
+
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/')
+first_request = time.perf_counter()
+app.predictor_loader.wait(120)
+print(json.dumps({
+    'import_seconds': imported - started,
+    'first_request_seconds': first_request - started,
+    'status': response.status_code,
+    'predictor_ready_seconds': app.predictor_loader.load_seconds,
+}))
+'''
+
+
+def run_probe():
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(limit=10):
+    """Top modules by cumulative import time, from `python -X importtime`."""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    rows = []
+    for line in output.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)', line)
+        if match:
+            rows.append((int(match.group(2)), match.group(4).strip()))
+    rows.sort(reverse=True)
+    return [{'module': module, 'cumulative_ms': round(us / 1000, 1)} for us, module in rows[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [run_probe() for _ in range(args.runs)]
+    report = {
+        'runs': args.runs,
+        'import_seconds_median': round(statistics.median(r['import_seconds'] for r in runs), 3),
+        'first_request_seconds_median': round(statistics.median(r['first_request_seconds'] for r in runs), 3),
+        'predictor_ready_seconds_median': round(statistics.median(r['predictor_ready_seconds'] or 0 for r in runs), 3),
+        'slowest_imports': slowest_imports(),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# benchmarks/fixture_server.py
+#
+# Local HTTP server that replays the retailer pages under benchmarks/fixtures,
+# so fetchers and parsers can be benchmarked without touching the real sites.
+#
+#     python benchmarks/fixture_server.py [--port 8765] [--latency 50] [--fail-rate 0.05]
+#
+# Routes (the product id is substituted into the page, and the price is
+# derived from it so results can be checked):
+#
+#     /amazon/dp/<id>
+#     /flipkart/<slug>/p/<id>
+#     /flipkart/search?q=...    (results for the first number in q)
+#     /reliance/<slug>/p/<id>
+#     /reliance/search?q=...    (results for the first number in q)
+
+import os
+import re
+import time
+import random
+import argparse
+import sys
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+ROUTES = [
+    (re.compile(r'^/amazon/dp/(\w+)$'), 'amazon_product.html'),
+    (re.compile(r'^/flipkart/search$'), 'flipkart_search.html'),
+    (re.compile(r'^/flipkart/[\w-]+/p/(\w+)$'), 'flipkart_product.html'),
+    (re.compile(r'^/reliance/search$'), 'reliance_search.html'),
+    (re.compile(r'^/reliance/[\w-]+/p/(\w+)$'), 'reliance_product.html'),
+]
+
+
+def fixture_price(product_id):
+    """Deterministic price in rupees for a product id, so scraped prices can be verified."""
+    digits = re.sub(r'\D', '', product_id) or '0'
+    return 5000 + int(digits) * 137 % 45000
+
+
+def render(filename, product_id, pad_kb=0):
+    with open(os.path.join(FIXTURES, filename), encoding='utf-8') as f:
+        page = f.read()
+    price = fixture_price(product_id)
+    page = (page.replace('__ID__', product_id)
+                .replace('__PRICE_RAW__', str(price))
+                .replace('__PRICE__', f"{price:,}")
+                .replace('__MRP__', f"{price * 6 // 5:,}"))
+    # Real product pages are hundreds of kilobytes; padding makes transfer and parse costs realistic
+    return page.replace('__PADDING__', 'x' * (pad_kb * 1024))
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real sites
+    latency = 0.0
+    fail_rate = 0.0
+    pad_kb = 0
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_rate and random.random() < self.fail_rate:
+            self._send(503, b'busy', {'Retry-After': '1'})
+            return
+        for pattern, filename in ROUTES:
+            match = pattern.match(path)
+            if match:
+                if match.groups():
+                    product_id = match.group(1)
+                else:
+                    # Search results are built around the first number in the query
+                    query = parse_qs(parsed.query).get('q', [''])[0]
+                    product_id = (re.findall(r'\d+', query) or ['0'])[0]
+                self._send(200, render(filename, product_id, self.pad_kb).encode('utf-8'))
+                return
+        self._send(404, b'not found')
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0, latency_ms=0, fail_rate=0.0, pad_kb=0):
+    """Starts the server in a daemon thread; returns (server, base_url)."""
+    handler = type('Handler', (FixtureHandler,), {'latency': latency_ms / 1000, 'fail_rate': fail_rate, 'pad_kb': pad_kb})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fixture-server', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def spawn_server(latency_ms=0, fail_rate=0.0, pad_kb=0):
+    """Starts the server in a child process, so it does not share the caller's GIL.
+
+    Returns (process, base_url); terminate the process when done.
+    """
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--port', '0', '--latency', str(latency_ms),
+         '--fail-rate', str(fail_rate), '--pad-kb', str(pad_kb)],
+        stdout=subprocess.PIPE, text=True)
+    base_url = process.stdout.readline().strip().rsplit(' ', 1)[-1]
+    return process, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves recorded retailer pages locally.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds added to every response')
+    parser.add_argument('--fail-rate', type=float, default=0, help='share of requests answered 503 with Retry-After')
+    parser.add_argument('--pad-kb', type=int, default=0, help='kilobytes of padding added to every page')
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.port, args.latency, args.fail_rate, args.pad_kb)
+    print(f"Serving fixtures at {base_url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
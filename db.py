@@ -0,0 +1,210 @@
+# db.py
+
+import os
+import queue
+import sqlite3
+import logging
+import threading
+import time
+from metrics import Histogram, register_stats
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+USERS_DB = os.environ.get('TRACKIT_USERS_DB', os.path.join(basedir, 'users.db'))
+PRICE_HISTORY_DB = os.environ.get('TRACKIT_PRICE_HISTORY_DB', os.path.join(basedir, 'databases_price_history.db'))
+
+# Idle connections kept open per database file
+POOL_SIZE = int(os.environ.get('TRACKIT_DB_POOL_SIZE', 8))
+# Prepared statements kept per connection
+STATEMENT_CACHE_SIZE = int(os.environ.get('TRACKIT_DB_STATEMENT_CACHE', 256))
+BUSY_TIMEOUT = float(os.environ.get('TRACKIT_DB_BUSY_TIMEOUT', 30))  # seconds
+
+# WAL lets the nightly refresher write while the web tier reads; NORMAL
+# sync is durable across application crashes and only fsyncs at checkpoints
+PRAGMAS = (
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -int(os.environ.get('TRACKIT_DB_CACHE_KB', 20000))),
+    ('mmap_size', int(os.environ.get('TRACKIT_DB_MMAP_BYTES', 256 * 1024 * 1024))),
+    ('temp_store', 'MEMORY'),
+)
+
+
+DB_QUERY_SECONDS = Histogram('trackit_db_query_seconds', 'SQLite statement latency by database and statement type.',
+                             ('db', 'statement'))
+
+# Statement types get their own label value; anything else counts as OTHER
+STATEMENT_TYPES = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH', 'PRAGMA', 'CREATE', 'BEGIN', 'COMMIT'}
+
+
+def statement_type(sql):
+    words = sql.lstrip().split(None, 1)
+    verb = words[0].upper() if words else ''
+    return verb if verb in STATEMENT_TYPES else 'OTHER'
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records how long each execute() takes.
+
+    For a SELECT this covers preparing the statement and stepping to the
+    first row; fetching the rest is not included.
+    """
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, db=self.connection.db_name,
+                                     statement=statement_type(sql))
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, db=self.connection.db_name,
+                                     statement=statement_type(sql))
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements are timed through TimedCursor."""
+
+    db_name = 'unknown'
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute() does not go through cursor(), so route it there
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def configure(conn):
+    """Applies the journal mode and tuning pragmas to a new connection."""
+    try:
+        mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+        if mode.lower() != 'wal':
+            logging.warning(f"SQLite journal mode is {mode}, not WAL")
+    except sqlite3.OperationalError as e:
+        logging.warning(f"Could not switch to WAL mode: {e}")
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name}={value}')
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def open_connection(path, **kwargs):
+    """Opens a standalone connection with the same settings as the pooled ones."""
+    kwargs.setdefault('timeout', BUSY_TIMEOUT)
+    kwargs.setdefault('cached_statements', STATEMENT_CACHE_SIZE)
+    kwargs.setdefault('factory', InstrumentedConnection)
+    conn = sqlite3.connect(path, **kwargs)
+    if isinstance(conn, InstrumentedConnection):
+        conn.db_name = os.path.splitext(os.path.basename(path))[0] or path
+    return configure(conn)
+
+
+class PooledConnection(InstrumentedConnection):
+    """Connection whose close() hands it back to its pool instead of closing it."""
+
+    pool = None
+    checked_out = False
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        elif self.checked_out:
+            self.pool.release(self)
+
+    def really_close(self):
+        super().close()
+
+
+class ConnectionPool:
+    """Keeps up to `size` idle connections to one database file."""
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self.stats = {'opened': 0, 'reused': 0}
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+            self.stats['reused'] += 1
+        except queue.Empty:
+            # A connection is used by one thread at a time but may move between threads
+            conn = open_connection(self.path, factory=PooledConnection, check_same_thread=False)
+            conn.pool = self
+            self.stats['opened'] += 1
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        if not conn.checked_out:
+            return  # Already released
+        conn.checked_out = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            conn.really_close()
+            return
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.really_close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().really_close()
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path):
+    # Relative names are resolved against the project, not the working directory
+    path = os.path.join(basedir, path)
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+
+def connect(path):
+    """Returns a pooled connection to `path`; close() returns it to the pool."""
+    return get_pool(path).acquire()
+
+
+def get_users_db_connection():
+    """Connect to the users database."""
+    return connect(USERS_DB)
+
+
+def get_price_history_db_connection():
+    """Connect to the price history database."""
+    return connect(PRICE_HISTORY_DB)
+
+
+def pool_stats():
+    return {os.path.basename(path): dict(pool.stats, idle=pool._idle.qsize()) for path, pool in _pools.items()}
+
+register_stats('trackit_db_pool', 'SQLite connection pool counters.', pool_stats, label='db')
+
+
+def close_all():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
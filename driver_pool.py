@@ -0,0 +1,199 @@
+# driver_pool.py
+
+import os
+import atexit
+import logging
+import threading
+from metrics import Histogram, register_stats
+
+# selenium and webdriver_manager are imported on first use; they are slow to
+# import and most requests are answered without a browser
+
+# Pool tuning, overridable from the environment
+DRIVER_POOL_SIZE = int(os.environ.get('TRACKIT_DRIVER_POOL_SIZE', 3))
+DRIVER_MAX_PAGES = int(os.environ.get('TRACKIT_DRIVER_MAX_PAGES', 50))
+DRIVER_CHECKOUT_TIMEOUT = float(os.environ.get('TRACKIT_DRIVER_CHECKOUT_TIMEOUT', 60))
+
+CHECKOUT_SECONDS = Histogram('trackit_browser_checkout_seconds', 'Time to get a browser from the pool, including starting one.')
+
+
+def selenium_helpers():
+    """Returns selenium's (By, WebDriverWait, expected_conditions), imported on first use."""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    return By, WebDriverWait, EC
+
+
+def chrome_options():
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  # Run headlessly (no GUI)
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--window-size=1920,1080")
+    return chrome_options
+
+
+class DriverPool:
+    """A bounded pool of headless Chrome instances.
+
+    The chromedriver binary is resolved once. Browsers are handed out with
+    checkout() and returned with checkin(), which resets them for the next
+    caller. A browser is quit and replaced after `max_pages` uses, or as
+    soon as it stops responding.
+    """
+
+    def __init__(self, size=DRIVER_POOL_SIZE, max_pages=DRIVER_MAX_PAGES,
+                 checkout_timeout=DRIVER_CHECKOUT_TIMEOUT):
+        self.size = size
+        self.max_pages = max_pages
+        self.checkout_timeout = checkout_timeout
+        # One condition guards both the idle browsers and the slot count, so a
+        # waiter wakes when a browser is returned or a slot is freed
+        self._available = threading.Condition()
+        self._idle = []  # most recently used last
+        self._live = 0  # idle + checked out
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._driver_path = None
+        self.stats = {'started': 0, 'recycled': 0, 'crashed': 0, 'checkouts': 0}
+
+    def driver_path(self):
+        from webdriver_manager.chrome import ChromeDriverManager
+
+        with self._lock:
+            if self._driver_path is None:
+                self._driver_path = ChromeDriverManager().install()
+                logging.info(f"Resolved chromedriver at {self._driver_path}")
+        return self._driver_path
+
+    def _start_driver(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+
+        service = Service(self.driver_path())
+        driver = webdriver.Chrome(service=service, options=chrome_options())
+        self._pages[id(driver)] = 0
+        self.stats['started'] += 1
+        return driver
+
+    def _reserve_slot(self):
+        with self._available:
+            if self._live >= self.size:
+                return False
+            self._live += 1
+            return True
+
+    def _release_slot(self):
+        with self._available:
+            self._live -= 1
+            self._available.notify()
+
+    def _put_idle(self, driver):
+        with self._available:
+            self._idle.append(driver)
+            self._available.notify()
+
+    def warm(self, count=None):
+        """Starts browsers until `count` (default: the pool size) are live."""
+        count = self.size if count is None else min(count, self.size)
+        while self._live < count and self._reserve_slot():
+            try:
+                self._put_idle(self._start_driver())
+            except Exception:
+                self._release_slot()
+                raise
+        logging.info(f"Browser pool warmed with {self._live} instance(s).")
+
+    def checkout(self):
+        """Returns an idle browser, starting one if the pool is not full yet."""
+        with CHECKOUT_SECONDS.time():
+            driver = self._checkout()
+        self.stats['checkouts'] += 1
+        return driver
+
+    def _checkout(self):
+        # Wait for an idle browser, or a free slot to start a new one in
+        with self._available:
+            if not self._available.wait_for(lambda: self._idle or self._reserve_slot(), self.checkout_timeout):
+                raise TimeoutError(f"No browser became available within {self.checkout_timeout}s")
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return self._start_driver()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def checkin(self, driver, broken=False):
+        """Returns a browser to the pool, recycling it if it is worn out or dead."""
+        self._pages[id(driver)] = self._pages.get(id(driver), 0) + 1
+        if broken or not self._reset(driver):
+            self.stats['crashed'] += 1
+            self._discard(driver)
+        elif self._pages[id(driver)] >= self.max_pages:
+            self.stats['recycled'] += 1
+            self._discard(driver)
+        else:
+            self._put_idle(driver)
+
+    def _reset(self, driver):
+        """Clears per-visit state; returns False if the browser is unresponsive."""
+        from selenium.common.exceptions import WebDriverException
+
+        try:
+            driver.delete_all_cookies()
+            driver.get('about:blank')
+            return True
+        except WebDriverException as err:
+            logging.warning(f"Browser failed to reset, recycling it: {err}")
+            return False
+
+    def _discard(self, driver):
+        self._pages.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as err:
+            logging.warning(f"Error while quitting browser: {err}")
+        finally:
+            self._release_slot()
+
+    def close(self):
+        """Quits every idle browser."""
+        with self._available:
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            self._discard(driver)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_driver_pool():
+    """Returns the process-wide browser pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool()
+            atexit.register(_pool.close)
+    return _pool
+
+
+def pool_stats():
+    """Counters of the browser pool plus live and idle browsers; empty before first use."""
+    if _pool is None:
+        return {}
+    return dict(_pool.stats, live=_pool._live, idle=len(_pool._idle))
+
+register_stats('trackit_browser_pool', 'Headless browser pool counters and sizes.', pool_stats)
+
+
+def checkout_driver():
+    return get_driver_pool().checkout()
+
+
+def checkin_driver(driver):
+    get_driver_pool().checkin(driver)
@@ -0,0 +1,180 @@
+# export.py
+#
+# Streams price history out of the database in chunks, so an export of any
+# length uses the same memory:
+#
+#     python export.py --format csv --platform amazon --start 2024-01-01 > prices.csv
+
+import io
+import csv
+import sys
+import json
+import time
+import logging
+import argparse
+from price_store import PRODUCT_TABLES
+
+EXPORT_COLUMNS = ['platform', 'product_id', 'name', 'link', 'observed_at', 'price']
+CHUNK_SIZE = 5000
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class ExportStats:
+    def __init__(self):
+        self.rows = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+        logging.info(f"Exported {self.rows} rows in {self.seconds:.2f}s ({self.rows_per_second:.0f} rows/s)")
+
+
+def iter_row_chunks(conn, platforms=None, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """Yields lists of export rows, `chunk_size` at a time.
+
+    Rows are read in primary key order, so SQLite never sorts or buffers the
+    whole result. `start` and `end` are inclusive observed_at dates.
+    """
+    for platform in platforms or PRODUCT_TABLES:
+        cursor = conn.execute(f'''
+            SELECT o.platform, o.product_id, p.name, p.link, o.observed_at, o.price_paise / 100.0
+            FROM price_observations o
+            JOIN {PRODUCT_TABLES[platform]} p ON p.srno = o.product_id
+            WHERE o.platform = ? AND o.observed_at >= ? AND o.observed_at <= ? AND o.price_paise IS NOT NULL
+            ORDER BY o.product_id, o.observed_at
+        ''', (platform, start or '', end or '9999-12-31'))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [tuple(row) for row in rows]
+
+
+def _csv_chunks(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _jsonl_chunks(chunks):
+    for rows in chunks:
+        yield ''.join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + '\n' for row in rows).encode()
+
+
+class _StreamSink:
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _parquet_chunks(chunks):
+    # Optional dependency, only needed for Parquet exports
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([('platform', pa.string()), ('product_id', pa.int64()), ('name', pa.string()),
+                        ('link', pa.string()), ('observed_at', pa.string()), ('price', pa.float64())])
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        # Each chunk becomes one row group
+        for rows in chunks:
+            writer.write_table(pa.Table.from_pylist([dict(zip(EXPORT_COLUMNS, row)) for row in rows], schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def format_available(fmt):
+    if fmt == 'parquet':
+        import importlib.util
+        return importlib.util.find_spec('pyarrow') is not None
+    return fmt in FORMATS
+
+
+FORMAT_WRITERS = {
+    'csv': _csv_chunks,
+    'jsonl': _jsonl_chunks,
+    'parquet': _parquet_chunks,
+}
+
+
+def export_price_history(conn, fmt='csv', platforms=None, start=None, end=None, chunk_size=CHUNK_SIZE, stats=None):
+    """Generator of encoded export chunks (bytes), ready to write to a file or a response."""
+    if fmt not in FORMAT_WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    stats = stats if stats is not None else ExportStats()
+
+    def counted(chunks):
+        for rows in chunks:
+            stats.rows += len(rows)
+            yield rows
+
+    try:
+        yield from FORMAT_WRITERS[fmt](counted(iter_row_chunks(conn, platforms, start, end, chunk_size)))
+    finally:
+        stats.finish()
+
+
+if __name__ == '__main__':
+    from db import get_price_history_db_connection
+
+    parser = argparse.ArgumentParser(description='Export price history.')
+    parser.add_argument('--format', choices=FORMAT_WRITERS, default='csv')
+    parser.add_argument('--platform', choices=PRODUCT_TABLES, action='append')
+    parser.add_argument('--start', help='first observed_at date (YYYY-MM-DD)')
+    parser.add_argument('--end', help='last observed_at date (YYYY-MM-DD)')
+    parser.add_argument('--out', help='output file (default: stdout)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    conn = get_price_history_db_connection()
+    out = open(args.out, 'wb') if args.out else sys.stdout.buffer
+    try:
+        for chunk in export_price_history(conn, args.format, args.platform, args.start, args.end):
+            out.write(chunk)
+    finally:
+        if args.out:
+            out.close()
+        conn.close()
@@ -0,0 +1,250 @@
+# fast_extract.py
+
+import os
+import logging
+import threading
+import importlib.util
+
+HTTP_TIMEOUT = float(os.environ.get('TRACKIT_HTTP_TIMEOUT', 10))
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
+    'Accept-Language': 'en-US,en;q=0.5',
+}
+
+# lxml is several times faster than the stdlib parser; use it when installed
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+# Fields a product page must yield before the browser can be skipped
+REQUIRED_FIELDS = ('name', 'price')
+
+# Plain-HTTP fetches go through the asyncio engine (async_fetch.py) when
+# aiohttp is installed; TRACKIT_FETCH_ENGINE=requests forces the blocking session
+FETCH_ENGINE = os.environ.get('TRACKIT_FETCH_ENGINE', 'async' if importlib.util.find_spec('aiohttp') else 'requests')
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Returns the shared keep-alive session used for every plain-HTTP fetch."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+            _session.headers.update(HEADERS)
+    return _session
+
+
+def fetch_html(url, timeout=HTTP_TIMEOUT):
+    """Fetches a page over plain HTTP; returns its HTML or None."""
+    if FETCH_ENGINE == 'async':
+        from async_fetch import get_fetcher
+        return get_fetcher().fetch_html(url, timeout)
+    return _fetch_html_requests(url, timeout)
+
+
+def fetch_many(urls, throttle=None):
+    """Fetches many pages concurrently; returns {url: html or None}.
+
+    With a batch_refresh.DomainThrottle, its per-domain concurrency and
+    spacing apply to the batch.
+    """
+    urls = list(dict.fromkeys(urls))
+    if FETCH_ENGINE == 'async':
+        from async_fetch import get_fetcher
+        if throttle is None:
+            return get_fetcher().fetch_many(urls)
+        return get_fetcher().fetch_many(urls, per_host=throttle.concurrency, host_interval=throttle.min_interval)
+
+    def fetch(url):
+        if throttle is None:
+            return _fetch_html_requests(url)
+        with throttle.slot(url):
+            return _fetch_html_requests(url)
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return dict(zip(urls, executor.map(fetch, urls)))
+
+
+def _fetch_html_requests(url, timeout=HTTP_TIMEOUT):
+    import requests
+
+    try:
+        response = get_session().get(url, timeout=timeout)
+    except requests.RequestException as e:
+        logging.warning(f"HTTP fetch failed for {url}: {e}")
+        return None
+    if response.status_code != 200:
+        logging.info(f"HTTP fetch of {url} returned status {response.status_code}")
+        return None
+    return response.text
+
+
+def _text(soup, selector):
+    tag = soup.select_one(selector)
+    if tag is None:
+        return None
+    # Amazon keeps the full, screen-reader price in a hidden span
+    offscreen = tag.select_one('.a-offscreen')
+    text = (offscreen or tag).get_text(strip=True)
+    return text or None
+
+
+def _attr(soup, selector, attribute):
+    tag = soup.select_one(selector)
+    if tag is None:
+        return None
+    return tag.get(attribute) or None
+
+
+def parse_amazon_product(html, url):
+    """Extracts the same fields as the browser scraper from an Amazon product page."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, HTML_PARSER)
+    star_rating = _text(soup, 'a.a-popover-trigger.a-declarative > span.a-size-base.a-color-base')
+    return {
+        'name': _text(soup, '#productTitle') or 'N/A',
+        'price': (_text(soup, 'span.a-price.aok-align-center.reinventPricePriceToPayMargin.priceToPay')
+                  or _text(soup, '#priceblock_dealprice') or 'N/A'),
+        'image': _attr(soup, '#landingImage', 'src') or 'N/A',
+        'star_rating': star_rating + " out of 5 stars" if star_rating else 'N/A',
+        'reviews': _text(soup, '#acrCustomerReviewText') or 'N/A',
+        'link': url,
+    }
+
+
+def parse_flipkart_product(html, url):
+    """Extracts the same fields as the browser scraper from a Flipkart product page."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, HTML_PARSER)
+    return {
+        'name': _text(soup, 'span.VU-ZEz') or 'N/A',
+        'price': _text(soup, 'div.Nx9bqj.CxhGGd') or 'N/A',
+        'image': _attr(soup, 'img._396cs4', 'src') or 'N/A',
+        'link': url,
+    }
+
+
+def _json_ld_product(soup):
+    """Returns the schema.org Product object embedded in the page, if any."""
+    import json
+
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            data = json.loads(script.string or '')
+        except ValueError:
+            continue
+        for item in data if isinstance(data, list) else data.get('@graph', [data]):
+            if isinstance(item, dict) and item.get('@type') == 'Product':
+                return item
+    return {}
+
+
+def parse_reliance_product(html, url):
+    """Extracts name, price and image from a Reliance Digital product page."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, HTML_PARSER)
+    product = _json_ld_product(soup)
+    offers = product.get('offers') or {}
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+    price = offers.get('price') or _attr(soup, 'meta[property="product:price:amount"]', 'content')
+    image = product.get('image')
+    if isinstance(image, list):
+        image = image[0] if image else None
+    return {
+        'name': product.get('name') or _attr(soup, 'meta[property="og:title"]', 'content') or 'N/A',
+        'price': f"₹{price}" if price else 'N/A',
+        'image': image or _attr(soup, 'meta[property="og:image"]', 'content') or 'N/A',
+        'link': url,
+    }
+
+
+PARSERS = {
+    'amazon': parse_amazon_product,
+    'flipkart': parse_flipkart_product,
+    'reliance': parse_reliance_product,
+}
+
+
+def has_required_fields(details):
+    return all(details.get(field) not in (None, '', 'N/A') for field in REQUIRED_FIELDS)
+
+
+def extract_product(retailer, url, browser_fallback):
+    """Scrapes a product page, trying plain HTTP before the headless browser.
+
+    `browser_fallback(url)` is only called when the HTTP tier cannot produce
+    every field in REQUIRED_FIELDS. The returned dict records which tier
+    answered under 'tier' ('http' or 'browser').
+    """
+    html = fetch_html(url)
+    if html is not None:
+        details = PARSERS[retailer](html, url)
+        if has_required_fields(details):
+            details['tier'] = 'http'
+            logging.info(f"Scraped {retailer} product over HTTP: {details['name']}")
+            return details
+        logging.info(f"HTTP tier could not read {retailer} page {url}; falling back to the browser.")
+
+    details = browser_fallback(url)
+    details['tier'] = 'browser'
+    return details
+
+
+def extract_products(retailer, urls, browser_fallback, fallback_workers=4, throttle=None, warm_browsers=None):
+    """Batch version of extract_product(): returns {url: details}.
+
+    Every page is fetched concurrently first; only the pages the HTTP tier
+    could not read go to `browser_fallback`, `fallback_workers` at a time.
+    Before they do, `warm_browsers(count)` (e.g. DriverPool.warm) can start
+    the browsers they will need. Pages whose fallback raises are logged and
+    left out, so one failure does not lose the pages already read.
+    `throttle` (a DomainThrottle) limits both the fetches and the fallbacks
+    per domain.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from contextlib import nullcontext
+
+    def fallback(url):
+        try:
+            with throttle.slot(url) if throttle is not None else nullcontext():
+                return browser_fallback(url)
+        except Exception as e:
+            logging.error(f"Browser fallback failed for {retailer} page {url}: {e}")
+            return None
+
+    results, fallbacks = {}, []
+    for url, html in fetch_many(urls, throttle).items():
+        details = PARSERS[retailer](html, url) if html is not None else None
+        if details is not None and has_required_fields(details):
+            details['tier'] = 'http'
+            results[url] = details
+        else:
+            fallbacks.append(url)
+
+    if fallbacks:
+        logging.info(f"HTTP tier could not read {len(fallbacks)} {retailer} pages; falling back to the browser.")
+        if warm_browsers is not None:
+            try:
+                warm_browsers(min(len(fallbacks), fallback_workers))
+            except Exception as e:
+                logging.warning(f"Could not warm browsers for the {retailer} fallback: {e}")
+        with ThreadPoolExecutor(max_workers=fallback_workers) as executor:
+            for url, details in zip(fallbacks, executor.map(fallback, fallbacks)):
+                if details is not None:
+                    details['tier'] = 'browser'
+                    results[url] = details
+    return results
@@ -3,46 +3,38 @@
 import sqlite3
 import logging
 import os
-import json
 import re
-from datetime import date , datetime , timedelta
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import requests
-from bs4 import BeautifulSoup
-import time
-import pandas as pd
-import numpy as np
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from db import connect, get_users_db_connection, get_price_history_db_connection
+from price_store import PRODUCT_TABLES, platform_for_table, get_products
+from driver_pool import checkout_driver, checkin_driver, get_driver_pool, selenium_helpers
+from fast_extract import extract_product, extract_products, fetch_html, parse_reliance_product, HTML_PARSER
+from watchlist import platform_for_column, add_to_watchlist, remove_from_watchlist
+from mailer import enqueue_digests, new_run_id
+from scrape_cache import cached, canonical_url, normalize_name, SEARCH_TTL, SEARCH_STALE_TTL
+from product_matching import rank_candidates, MATCH_THRESHOLD
+from metrics import instrument_scraper
+
+# selenium, requests, BeautifulSoup, pandas and numpy are imported inside the
+# functions that need them, so importing this module (and app.py) stays cheap
+
+# Overridable so searches can be pointed at a local fixture server
+FLIPKART_BASE_URL = os.environ.get('TRACKIT_FLIPKART_BASE_URL', 'https://www.flipkart.com')
+RELIANCE_BASE_URL = os.environ.get('TRACKIT_RELIANCE_BASE_URL', 'https://www.reliancedigital.in')
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, filename='scraper.log',
                     format='%(asctime)s:%(levelname)s:%(message)s')
 
 # Scraper functions
-def create_driver():
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")  # Run headlessly (no GUI)
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--window-size=1920,1080")
-    
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    return driver
-
+@cached('amazon_product', key=canonical_url)
+@instrument_scraper('amazon')
 def scrape_amazon_product(url):
-    driver = create_driver()
+    return extract_product('amazon', url, scrape_amazon_product_browser)
+
+@instrument_scraper('amazon')
+def scrape_amazon_product_browser(url):
+    By, WebDriverWait, EC = selenium_helpers()
+    driver = checkout_driver()
     product_details = {}
 
     try:
@@ -98,42 +90,65 @@ def scrape_amazon_product(url):
     except Exception as err:
         logging.error(f"An error occurred while scraping Amazon: {err}")
     finally:
-        driver.quit()
+        checkin_driver(driver)
 
     return product_details
 
+@cached('flipkart_search', key=normalize_name, ttl=SEARCH_TTL, stale_ttl=SEARCH_STALE_TTL)
+@instrument_scraper('flipkart')
 def find_flipkart_link(product_name):
+    from bs4 import BeautifulSoup
+
     words = product_name.split()[:5]
     query = '+'.join(words)
-    url = f'https://www.flipkart.com/search?q={query}'
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
-        'Accept-Language': 'en-US,en;q=0.5',
-    }
+    url = f'{FLIPKART_BASE_URL}/search?q={query}'
 
-    response = requests.get(url, headers=headers)
+    html = fetch_html(url)
 
-    if response.status_code == 200:
+    if html is not None:
         logging.info("Flipkart search request successful!")
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = BeautifulSoup(html, HTML_PARSER)
     
         logging.info(f"{url}")
 
-        # Flipkart often has multiple product links; adjust as necessary
+        # Flipkart lists several product links; rank them against the Amazon title
+        candidates = {}
         for link in soup.find_all('a', href=True):
             if 'p/' in link['href']:
-                product_link = 'https://www.flipkart.com' + link['href']
-                logging.info(f"Found Flipkart product link: {product_link}")
-                return product_link
-
-        logging.warning("No product links found on Flipkart.")
-        return None
+                product_link = FLIPKART_BASE_URL + link['href']
+                title = link.get('title') or link.get_text(' ', strip=True)
+                key = canonical_url(product_link)
+                if key not in candidates:
+                    candidates[key] = {'url': product_link, 'name': title}
+                elif title and not candidates[key]['name']:
+                    candidates[key]['name'] = title
+
+        if not candidates:
+            logging.warning("No product links found on Flipkart.")
+            return None
+
+        ranked = rank_candidates(product_name, list(candidates.values()))
+        if ranked and ranked[0][0] >= MATCH_THRESHOLD:
+            score, best = ranked[0]
+            logging.info(f"Best Flipkart match ({score:.2f}): {best['name']}")
+        else:
+            best = next(iter(candidates.values()))
+            logging.info("No Flipkart result resembles the product; using the first one.")
+        logging.info(f"Found Flipkart product link: {best['url']}")
+        return best['url']
     else:
-        logging.error(f"Failed to retrieve the Flipkart search page. Status code: {response.status_code}")
+        logging.error("Failed to retrieve the Flipkart search page.")
         return None
 
+@cached('flipkart_product', key=canonical_url)
+@instrument_scraper('flipkart')
 def scrape_flipkart_product(url):
-    driver = create_driver()
+    return extract_product('flipkart', url, scrape_flipkart_product_browser)
+
+@instrument_scraper('flipkart')
+def scrape_flipkart_product_browser(url):
+    By, WebDriverWait, EC = selenium_helpers()
+    driver = checkout_driver()
     product_details = {}
 
     try:
@@ -173,12 +188,16 @@ def scrape_flipkart_product(url):
     except Exception as err:
         logging.error(f"An error occurred while scraping Flipkart: {err}")
     finally:
-        driver.quit()
+        checkin_driver(driver)
 
     return product_details
 
+@cached('reliance_search', key=normalize_name)
+@instrument_scraper('reliance')
 def get_first_product_details(query):
-    driver = create_driver()
+    """Searches Reliance Digital and returns the result that best matches `query`."""
+    By, WebDriverWait, EC = selenium_helpers()
+    driver = checkout_driver()
     product_details = {}
 
     try:
@@ -186,190 +205,137 @@ def get_first_product_details(query):
         words = query.split()[:7]
         limited_query = '%20'.join(words)
         limited_query = re.sub(r'[(){}[\]]', '', limited_query)
-        url = f"https://www.reliancedigital.in/search?q={limited_query}:relevance"
+        url = f"{RELIANCE_BASE_URL}/search?q={limited_query}:relevance"
         logging.info(f"Visiting Reliance Digital URL: {url}")
         driver.get(url)
-        time.sleep(5)  # Wait for the page to load
 
-        wait = WebDriverWait(driver, 10)  # Increased wait time
+        # Waits only as long as the results take to render
+        wait = WebDriverWait(driver, 10)
 
         # Wait for the product elements to be present
         try:
-            # Adjust selector for the product title
-            title_element = wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "p.sp__name"))  # Selector for product name
-            )
-            product_details['name'] = title_element.text.strip()
-            logging.info(f"Product Title: {product_details['name']}")
+            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "p.sp__name")))  # Selector for product name
+            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "div.StyledPriceBoxM__PriceWrapper-sc-1l9ms6f-0 span:nth-of-type(2)")))
         except Exception as e:
-            product_details['name'] = 'N/A'
-            logging.warning("Product title element not found.")
-
-        # Extract price
-        try:
-            # Updated selector for price
-            price_element = wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "div.StyledPriceBoxM__PriceWrapper-sc-1l9ms6f-0 span:nth-of-type(2)"))  # Select the second span containing the price
-            )
-            product_details['price'] = price_element.text.strip()
+            logging.warning("Reliance Digital results did not render.")
+
+        # Read every result card, then keep the one closest to the query
+        candidates = []
+        for card in driver.find_elements(By.CSS_SELECTOR, "div.sp"):
+            candidate = {}
+            for field, selector, read in (
+                ('name', "p.sp__name", lambda element: element.text.strip()),
+                ('price', "div.StyledPriceBoxM__PriceWrapper-sc-1l9ms6f-0 span:nth-of-type(2)", lambda element: element.text.strip()),  # The second span holds the price
+                ('link', "a[href*='/']", lambda element: element.get_attribute('href').strip()),
+            ):
+                try:
+                    candidate[field] = read(card.find_element(By.CSS_SELECTOR, selector))
+                except Exception:
+                    candidate[field] = 'N/A'
+            if candidate['name'] != 'N/A':
+                candidates.append(candidate)
+
+        if candidates:
+            score, product_details = rank_candidates(query, candidates)[0]
+            logging.info(f"Best Reliance Digital match ({score:.2f}): {product_details['name']}")
             logging.info(f"Price: {product_details['price']}")
-        except Exception as e:
-            product_details['price'] = 'N/A'
-            logging.warning("Price element not found.")
-        
-        try:
-            # Selector for product link
-            link_element = wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "div.sp a[href*='/']"))  # Adjusted to find the link in the correct div
-            )
-            product_details['link'] = f"{link_element.get_attribute('href').strip()}"  # Complete the URL
             logging.info(f"Product Link: {product_details['link']}")
-        except Exception as e:
-            product_details['link'] = 'N/A'
-            logging.warning("Product link element not found.")
+        else:
+            product_details = {'name': 'N/A', 'price': 'N/A', 'link': 'N/A'}
+            logging.warning("No Reliance Digital results found.")
 
     except Exception as e:
         logging.error("Error occurred while scraping Reliance Digital: " + str(e))
 
     finally:
-        driver.quit()
+        checkin_driver(driver)
+
+    return product_details
+
+@cached('reliance_product', key=canonical_url)
+@instrument_scraper('reliance')
+def scrape_reliance_product(url):
+    return extract_product('reliance', url, scrape_reliance_product_browser)
+
+@instrument_scraper('reliance')
+def scrape_reliance_product_browser(url):
+    driver = checkout_driver()
+    product_details = {}
+
+    try:
+        logging.info(f"Navigating to Reliance Digital URL: {url}")
+        driver.get(url)
+        product_details = parse_reliance_product(driver.page_source, url)
+    except Exception as err:
+        logging.error(f"An error occurred while scraping Reliance Digital: {err}")
+    finally:
+        checkin_driver(driver)
 
     return product_details
 
 # Watchlist management functions
 
-import sqlite3
-import json
+def get_user_id(conn, email):
+    cursor = conn.execute("SELECT id FROM User WHERE email = ?", (email,))
+    user = cursor.fetchone()
+    return user['id'] if user else None
 
 def remove_item(email, columnname, srno):
-    conn = sqlite3.connect('users.db')  # Ensure correct database path
-    cursor = conn.cursor()
+    conn = get_users_db_connection()
     
     try:
-        # Fetch the current data from the correct column
-        cursor.execute(f"SELECT {columnname} FROM User WHERE email = ?", (email,))
-        cell_data = cursor.fetchone()
-
-        if cell_data and cell_data[0]:  # Check if data exists and is not null
-            try:
-                data_list = json.loads(cell_data[0])  # Load existing JSON data
-            except json.JSONDecodeError:
-                data_list = []  # Initialize to empty if JSON is malformed
-            
-            if srno in data_list:
-                data_list.remove(srno)  # Remove the item
-                # Update the column in the User table
-                cursor.execute(
-                    f"UPDATE User SET {columnname} = ? WHERE email = ?", 
-                    (json.dumps(data_list), email)
-                )
-                conn.commit()
-                print(f"Item {srno} removed successfully from {columnname}.")
-            else:
-                print(f"Item {srno} not found in the list.")
+        user_id = get_user_id(conn, email)
+        if user_id is None:
+            logging.warning(f"No user found for {email}.")
+        elif remove_from_watchlist(conn, user_id, platform_for_column(columnname), srno):
+            conn.commit()
+            logging.info(f"Item {srno} removed successfully from {columnname}.")
         else:
-            print("No data found for the given email or column.")
+            logging.info(f"Item {srno} not found in the list.")
     
     except sqlite3.Error as e:
-        print(f"Database Error: {e}")
+        logging.error(f"Database Error: {e}")
     
     finally:
         conn.close()
 
 def add_item(email, columnname, srno):
-    conn = sqlite3.connect('users.db')  # Ensure correct database path
-    cursor = conn.cursor()
+    conn = get_users_db_connection()
     
     try:
-        # Fetch the current data
-        cursor.execute(f"SELECT {columnname} FROM user WHERE email = ?", (email,))
-        cell_data = cursor.fetchone()
-
-        if cell_data and cell_data[0]:  # Check if data exists and is not null
-            try:
-                data_list = json.loads(cell_data[0])  # Load existing JSON data
-            except json.JSONDecodeError:
-                data_list = []  # Initialize to empty if JSON is malformed
-        else:
-            data_list = []  # Initialize to empty if no data exists
-        
-        if srno not in data_list:
-            data_list.append(srno)
-            cursor.execute(
-                f"UPDATE user SET {columnname} = ? WHERE email = ?", 
-                (json.dumps(data_list), email)
-            )
+        user_id = get_user_id(conn, email)
+        if user_id is None:
+            logging.warning(f"No user found for {email}.")
+        elif add_to_watchlist(conn, user_id, platform_for_column(columnname), srno):
             conn.commit()
-            print(f"Item {srno} added successfully.")
+            logging.info(f"Item {srno} added successfully.")
         else:
-            print(f"Item {srno} is already in the list.")
+            logging.info(f"Item {srno} is already in the list.")
     
     except sqlite3.Error as e:
-        print(f"Error: {e}")
+        logging.error(f"Error: {e}")
     
     finally:
         conn.close()
 
-def does_user_have(usermail, columnname, srno):
-    conn = get_users_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"SELECT {columnname} FROM user WHERE email = ?", (usermail,))
-    data = cursor.fetchone()
-    conn.close()
-
-    if data[columnname] is None:
-        return False
-
-    data_list = json.loads(data[columnname])
-
-    return True
-
 # Notification functions
 
-def notify(tablename):
+def notify(tablename, min_drop_abs=0, min_drop_pct=0, new_low_only=False):
     """
     Checks for price drops in the specified table.
+    A product has dropped when its latest price is below the previous one by
+    at least the given thresholds (rupees / percent), optionally only when
+    it is a new all-time low.
     Returns a list of srnos with price drops.
     """
+    from price_drops import detect_price_drops
+
+    platform = platform_for_table(tablename)
     conn = get_price_history_db_connection()
-    cursor = conn.cursor()
     try:
-        # Fetch all products
-        cursor.execute(f"SELECT srno, name FROM {tablename}")
-        products = cursor.fetchall()
-
-        price_drops = []
-
-        for product in products:
-            srno = product['srno']
-            name = product['name']
-
-            # Fetch price history (assuming you have columns like date_1, date_2, ..., date_n)
-            cursor.execute(f"PRAGMA table_info({tablename})")
-            columns_info = cursor.fetchall()
-            price_columns = [col['name'] for col in columns_info if col['name'].startswith('date_')]
-
-            cursor.execute(f"SELECT {', '.join(price_columns)} FROM {tablename} WHERE srno = ?", (srno,))
-            price_row = cursor.fetchone()
-
-            # Extract and clean prices
-            prices = [row for row in price_row if row is not None and row != 'N/A']
-            cleaned_prices = []
-            for price in prices:
-                try:
-                    cleaned_prices.append(float(price.replace('₹', '').replace(',', '').strip()))
-                except:
-                    continue
-
-            # Check for price drops
-            if len(cleaned_prices) < 2:
-                continue  # Not enough data
-
-            price_changes = np.diff(cleaned_prices)
-            if any(change < 0 for change in price_changes):
-                price_drops.append(srno)
-
-        return price_drops
+        drops = detect_price_drops(conn, platform, min_drop_abs=min_drop_abs,
+                                   min_drop_pct=min_drop_pct, new_low_only=new_low_only)
+        return [int(srno) for srno in drops['product_id']]
 
     except Exception as e:
         logging.error(f"Error in notify function: {e}")
@@ -377,70 +343,28 @@ def notify(tablename):
     finally:
         conn.close()
 
-def send_mail(to_email):
+def queue_price_drop_alerts(alerts):
     """
-    Sends an email notification to the specified email address.
+    Queues one digest per user listing every watched product that dropped.
+    `alerts` is the {email: [(platform, srno), ...]} result of plan_alerts.
+    The caller sends them, with get_dispatcher().drain() or start().
     """
-    from_email = "your_email@example.com"  # Replace with your email
-    password = "your_email_password"        # Replace with your email password or app-specific password
-
-    # Create a multipart email message
-    msg = MIMEMultipart()
-    msg['From'] = from_email
-    msg['To'] = to_email
-    msg['Subject'] = "Price Drop Alert! 🎉"
-
-    body = '''
-    Hey there,
-
-    Good news! 📉
-
-    One of the products you're tracking has just dropped in price. Check your dashboard to see the updated price.
-
-    Don't miss out on this great deal!
-
-    Best regards,
-    TrackIT Team
-    '''
-
-    # Attach the email body to the message
-    msg.attach(MIMEText(body, 'plain'))
-
+    conn = get_price_history_db_connection()
     try:
-        # Connect to the Gmail SMTP server
-        server = smtplib.SMTP('smtp.gmail.com', 587)  # For Gmail
-        server.starttls()  # Upgrade to a secure connection
-        server.login(from_email, password)  # Log in to your email account
-
-        # Send the email
-        server.send_message(msg)
-        logging.info(f"Email sent successfully to {to_email}.")
-
-    except Exception as e:
-        logging.error(f"Failed to send email to {to_email}: {e}")
-
+        products = {
+            platform: get_products(conn, platform, {srno for items in alerts.values() for p, srno in items if p == platform})
+            for platform in PRODUCT_TABLES
+        }
     finally:
-        # Close the server connection
-        server.quit()
-
-
-# Database connection functions
+        conn.close()
 
-def get_users_db_connection():
-    """Connect to the users database."""
-    basedir = os.path.abspath(os.path.dirname(__file__))
-    users_db_path = os.path.join(basedir, 'users.db')
-    conn = sqlite3.connect(users_db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    digests = {
+        user_email: [dict(products[platform].get(srno, {}), platform=platform, srno=srno) for platform, srno in items]
+        for user_email, items in alerts.items()
+    }
+    enqueue_digests(new_run_id(), digests)
+    return len(digests)
 
-def get_price_history_db_connection():
-    """Connect to the price history database."""
-    basedir = os.path.abspath(os.path.dirname(__file__))
-    price_history_db_path = os.path.join(basedir, 'databases_price_history.db')
-    conn = sqlite3.connect(price_history_db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
 
 # Functions to add new products to the databases
 
@@ -503,101 +427,22 @@ def make_list(tablename,columname):
     return data_list
 
 
-def send_alert_mail():
-    user=make_list("user","email")
-    nf=notify("flipkart_data")
-
-    for i in user :
-        for j in nf :
-            if does_user_have(i,"srno_f",j):
-                send_mail(i,"srno_f",j)
-                break
-
-    nf=notify("amazon_data")
-
-    for i in user :
-        for j in nf :
-            if does_user_have(i,"srno_a",j):
-                send_mail(i,"srno_a",j)
-                break
-
-def update_table_values_amazon():
-    add_column("amazon_data")
-    date_=str(date.today())
-
-    conn = sqlite3.connect("databases_price_history.db")
-    cursor = conn.cursor()
-    column_data=[]
-
-    try :
-        cursor.execute(f"select link from amazon_data")
-        rows=cursor.fetchall()
-        column_data = [row[0] for row in rows]
-
-        for i in column_data:
-            price,name =scrape_amazon(i)
-            
-            query = f'''
-                    update amazon_data
-                    set  \"{date_}\" = ?
-                    where link = ?
-                    '''
-            cursor.execute(query,(price,i))
-            conn.commit()
-    finally:
-        # Close the database connection
-        conn.close()
-
-#fn to update flipkart_data table value ( will also add a column of todays date )
-
-def update_table_values_flipkart():
-    add_column("flipkart_data")
-    date_=str(date.today())
-
-    conn = sqlite3.connect("databases_price_history.db")
-    cursor = conn.cursor()
-    column_data=[]
-
-    try :
-        cursor.execute(f"select link from flipkart_data")
-        rows=cursor.fetchall()
-        column_data = [row[0] for row in rows]
-
-        for i in column_data:
-            price , name =scrape_flipkart(i)
-            
-            query = f'''
-                    update flipkart_data
-                    set  \"{date_}\" = ?
-                    where link = ?
-                    '''
-            cursor.execute(query,(price,i))
-            conn.commit()
-    finally:
-        # Close the database connection
-        conn.close()
-
-
-def add_column(tablename):
-
-    date__= str(date.today())
-    
-    try:
-        conn = sqlite3.connect("databases_price_history.db")
-        cursor = conn.cursor()
-        cursor.execute(f"""
-            alter table {tablename}
-            add column "{date__}" int default 0 """ 
-        )
-    except sqlite3.Error as e:
-        print(f"An error occurred: {e}")
-    
-    finally:
-        if conn:
-            conn.close()
-
+@instrument_scraper('flipkart')
 def scrape_flipkart(url):
-    driver = create_driver()
+    product = extract_product('flipkart', url, scrape_flipkart_browser)
+    return product['price'], product['name']
+
+def scrape_flipkart_many(urls, throttle=None):
+    """Scrapes many Flipkart pages concurrently; returns {url: (price, name)}."""
+    products = extract_products('flipkart', urls, scrape_flipkart_browser, throttle=throttle,
+                                warm_browsers=get_driver_pool().warm)
+    return {url: (product['price'], product['name']) for url, product in products.items()}
+
+@instrument_scraper('flipkart')
+def scrape_flipkart_browser(url):
+    By, WebDriverWait, EC = selenium_helpers()
+    driver = checkout_driver()
+    price, name = 'N/A', 'N/A'
     try:
         logging.info(f"Navigating to Flipkart URL: {url}")
         driver.get(url)
@@ -635,16 +480,28 @@ def scrape_flipkart(url):
         driver.save_screenshot(screenshot_path)
         logging.info(f"Screenshot saved to {screenshot_path}")
     finally:
-        driver.quit()
+        checkin_driver(driver)
 
-    return price,name
+    return {'price': price, 'name': name}
 
 # fn to scrape amazon
 
+@instrument_scraper('amazon')
 def scrape_amazon(url):
-    driver = create_driver()
-    product_details = {}
-    
+    product = extract_product('amazon', url, scrape_amazon_browser)
+    return product['price'], product['name']
+
+def scrape_amazon_many(urls, throttle=None):
+    """Scrapes many Amazon pages concurrently; returns {url: (price, name)}."""
+    products = extract_products('amazon', urls, scrape_amazon_browser, throttle=throttle,
+                                warm_browsers=get_driver_pool().warm)
+    return {url: (product['price'], product['name']) for url, product in products.items()}
+
+@instrument_scraper('amazon')
+def scrape_amazon_browser(url):
+    By, WebDriverWait, EC = selenium_helpers()
+    driver = checkout_driver()
+    price, name = 'N/A', 'N/A'
 
     try:
         logging.info(f"Navigating to Amazon URL: {url}")
@@ -678,32 +535,45 @@ def scrape_amazon(url):
         driver.save_screenshot(screenshot_path)
         logging.info(f"Screenshot saved to {screenshot_path}")
     finally:
-        driver.quit()
-    return price,name
+        checkin_driver(driver)
+    return {'price': price, 'name': name}
 
 
 
 def db_to_excel(db_name, table_name, excel_file_name):
-   
-    conn = sqlite3.connect(db_name)
+    import pandas as pd
+
+    conn = connect(db_name)
     
     try:
-        query = f"SELECT * FROM {table_name}"
-        df = pd.read_sql_query(query, conn)
+        platform = platform_for_table(table_name)
+        products = pd.read_sql_query(f"SELECT srno, name, link FROM {table_name}", conn)
+        history = pd.read_sql_query(
+            "SELECT product_id, observed_at, price_paise FROM price_observations WHERE platform = ?",
+            conn, params=(platform,))
+
+        # One column per day in the spreadsheet, prices in rupees
+        prices = history.pivot(index='product_id', columns='observed_at', values='price_paise') / 100
+        df = products.merge(prices, left_on='srno', right_index=True, how='left')
         
         df.to_excel(excel_file_name, index=False)
-        print(f"Table '{table_name}' has been successfully exported to '{excel_file_name}'.")
+        logging.info(f"Table '{table_name}' has been successfully exported to '{excel_file_name}'.")
     
     except Exception as e:
-        print(f"An error occurred: {e}")
+        logging.error(f"An error occurred: {e}")
     
     finally:
         conn.close()
 
 
 def update():
-    update_table_values_amazon()
-    update_table_values_flipkart()
-    print(notify("flipkart_data"))
-    print(notify("amazon_data"))
-    send_alert_mail()
\ No newline at end of file
+    """The nightly job: one pass of the adaptive refresh (scheduler.py).
+
+    Scrapes the products that are due, within the hourly budget, and sends
+    the alerts for the ones that dropped before returning. Products still
+    due afterwards are logged as a warning; scheduler.py covers them.
+    """
+    from scheduler import run_forever
+
+    run_forever({'amazon': scrape_amazon, 'flipkart': scrape_flipkart}, once=True,
+                batch_scrapers={'amazon': scrape_amazon_many, 'flipkart': scrape_flipkart_many})
\ No newline at end of file
@@ -0,0 +1,428 @@
+# job_queue.py
+#
+# Persistent job queue in SQLite, worked by a pool of processes, so slow
+# scrapes and email fan-outs do not hold web request threads. Handlers are
+# registered with @handler(kind) in jobs.py and can publish() progress events
+# while they run. The web app starts a pool on first use; to run the workers
+# separately instead:
+#
+#     python job_queue.py            # run the worker pool
+#     python job_queue.py nightly    # queue the nightly refresh and alerts (functions.update)
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import multiprocessing
+from db import connect
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+JOBS_DB = os.environ.get('TRACKIT_JOBS_DB', os.path.join(basedir, 'jobs.db'))
+JOB_WORKERS = int(os.environ.get('TRACKIT_JOB_WORKERS', 3))
+# Workers that only take interactive jobs, so a nightly backlog cannot starve users
+INTERACTIVE_WORKERS = int(os.environ.get('TRACKIT_INTERACTIVE_WORKERS', 1))
+# Start the worker pool inside the web process; set to 0 when running `python job_queue.py`
+EMBEDDED_WORKERS = os.environ.get('TRACKIT_EMBEDDED_WORKERS', '1') == '1'
+JOB_MAX_ATTEMPTS = int(os.environ.get('TRACKIT_JOB_MAX_ATTEMPTS', 3))
+JOB_RETENTION = float(os.environ.get('TRACKIT_JOB_RETENTION', 24 * 3600))  # seconds finished jobs are kept
+POLL_INTERVAL = 0.2
+
+# Priority classes, claimed lowest first, each with its own queue depth limit
+PRIORITIES = {'interactive': 0, 'nightly': 10}
+QUEUE_DEPTH = {
+    'interactive': int(os.environ.get('TRACKIT_INTERACTIVE_QUEUE_DEPTH', 100)),
+    'nightly': int(os.environ.get('TRACKIT_NIGHTLY_QUEUE_DEPTH', 1000)),
+}
+
+class QueueFull(Exception):
+    """Raised by enqueue() when a priority class already has its maximum of queued jobs."""
+
+
+HANDLERS = {}
+
+# Per job kind: jobs queued under a dedupe key (leaders) and requests that
+# joined one already queued or running (shared), i.e. the work saved
+dedupe_stats = {}
+_dedupe_lock = threading.Lock()
+
+
+def handler(kind):
+    """Registers a job handler: func(**payload) returning something JSON-serialisable."""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def _count_dedupe(kind, stat):
+    with _dedupe_lock:
+        dedupe_stats.setdefault(kind, {'leaders': 0, 'shared': 0})[stat] += 1
+
+
+def get_jobs_connection():
+    return connect(JOBS_DB)
+
+
+def init_jobs(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            priority INTEGER NOT NULL,
+            dedupe_key TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            result TEXT,
+            error TEXT,
+            worker TEXT,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority, id)')
+    # At most one queued or running job per dedupe key
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key)
+        WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running')
+    ''')
+    # Progress published by running jobs, read back in order by id
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS job_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id, id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS worker_metrics (
+            worker TEXT PRIMARY KEY,
+            snapshot TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def enqueue(conn, kind, payload=None, priority='interactive', dedupe_key=None):
+    """Queues a job and returns its id.
+
+    With `dedupe_key`, a queued or running job with the same key is reused
+    instead, so a product being scraped is not scraped twice. Raises
+    QueueFull when the priority class is at its depth limit.
+    """
+    level = PRIORITIES[priority]
+    with conn:
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO jobs (kind, payload, priority, dedupe_key, created_at)
+            SELECT ?, ?, ?, ?, ?
+            WHERE (SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND priority = ?) < ?
+        ''', (kind, json.dumps(payload or {}), level, dedupe_key, time.time(), level, QUEUE_DEPTH[priority]))
+    if cursor.rowcount:
+        if dedupe_key is not None:
+            _count_dedupe(kind, 'leaders')
+        return cursor.lastrowid
+    if dedupe_key is not None:
+        row = conn.execute("SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running')",
+                           (dedupe_key,)).fetchone()
+        if row:
+            _count_dedupe(kind, 'shared')
+            return row[0]
+    raise QueueFull(f"{priority} queue is full ({QUEUE_DEPTH[priority]} jobs)")
+
+
+def claim(conn, worker, max_priority=None):
+    """Marks the most urgent queued job as running and returns it, or None."""
+    max_priority = max(PRIORITIES.values()) if max_priority is None else max_priority
+    with conn:
+        # RETURNING rows are read in full before the commit
+        rows = conn.execute('''
+            UPDATE jobs SET status = 'running', started_at = ?, worker = ?, attempts = attempts + 1
+            WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND priority <= ? ORDER BY priority, id LIMIT 1)
+            RETURNING id, kind, payload
+        ''', (time.time(), worker, max_priority)).fetchall()
+    return rows[0] if rows else None
+
+
+def finish(conn, job_id, result=None, error=None):
+    with conn:
+        conn.execute('UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?',
+                     ('failed' if error else 'done', json.dumps(result), error, time.time(), job_id))
+
+
+def get_job(conn, job_id):
+    """Returns the job as a dict (result decoded), or None."""
+    row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job['payload'] = json.loads(job['payload'])
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    if job['status'] == 'queued':
+        job['position'] = conn.execute('''
+            SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority < ? OR (priority = ? AND id < ?))
+        ''', (job['priority'], job['priority'], job_id)).fetchone()[0]
+    return job
+
+
+def publish(job_id, event, data):
+    """Records a progress event for a job; does nothing without one (job_id None).
+
+    Safe to call from any thread of the worker.
+    """
+    if job_id is None:
+        return
+    conn = get_jobs_connection()
+    try:
+        with conn:
+            conn.execute('INSERT INTO job_events (job_id, event, data, created_at) VALUES (?, ?, ?, ?)',
+                         (job_id, event, json.dumps(data), time.time()))
+    finally:
+        conn.close()
+
+
+def get_events(conn, job_id, after=0):
+    """Returns the job's events with an id above `after`, oldest first, data decoded."""
+    return [dict(id=row['id'], event=row['event'], data=json.loads(row['data']))
+            for row in conn.execute('SELECT id, event, data FROM job_events WHERE job_id = ? AND id > ? ORDER BY id',
+                                    (job_id, after))]
+
+
+def requeue_worker_jobs(conn, worker):
+    """Puts the running jobs of a dead worker back in the queue, or fails them after JOB_MAX_ATTEMPTS."""
+    with conn:
+        conn.execute('''
+            UPDATE jobs SET status = 'failed', error = 'worker died', finished_at = ?
+            WHERE status = 'running' AND worker = ? AND attempts >= ?
+        ''', (time.time(), worker, JOB_MAX_ATTEMPTS))
+        requeued = conn.execute("UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND worker = ?",
+                                (worker,)).rowcount
+    if requeued:
+        logging.warning(f"Requeued {requeued} job(s) of dead worker {worker}.")
+    return requeued
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def requeue_orphans(conn):
+    """Requeues running jobs whose worker process no longer exists, e.g. after a restart."""
+    workers = [row[0] for row in conn.execute("SELECT DISTINCT worker FROM jobs WHERE status = 'running'")]
+    return sum(requeue_worker_jobs(conn, worker) for worker in workers
+               if not (worker or '').isdigit() or not _pid_alive(int(worker)))
+
+
+def purge_finished(conn, retention=JOB_RETENTION):
+    with conn:
+        purged = conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                              (time.time() - retention,)).rowcount
+        conn.execute('DELETE FROM job_events WHERE job_id NOT IN (SELECT id FROM jobs)')
+    return purged
+
+
+def queue_stats(conn=None):
+    """Returns {priority class: {'queued': n, 'running': n, 'oldest_queued_seconds': s}}."""
+    own = conn is None
+    conn = conn or get_jobs_connection()
+    try:
+        init_jobs(conn)
+        stats = {name: {'queued': 0, 'running': 0, 'oldest_queued_seconds': 0.0} for name in PRIORITIES}
+        names = {level: name for name, level in PRIORITIES.items()}
+        for priority, status, count, oldest in conn.execute('''
+            SELECT priority, status, COUNT(*), MIN(created_at) FROM jobs
+            WHERE status IN ('queued', 'running') GROUP BY priority, status
+        '''):
+            name = names.get(priority, str(priority))
+            stats.setdefault(name, {'queued': 0, 'running': 0, 'oldest_queued_seconds': 0.0})[status] = count
+            if status == 'queued':
+                stats[name]['oldest_queued_seconds'] = round(time.time() - oldest, 1)
+        return stats
+    finally:
+        if own:
+            conn.close()
+
+
+# Workers
+
+def save_worker_metrics(conn, worker):
+    """Stores this process's metrics so the web process can include them in /metrics."""
+    from metrics import snapshot
+
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO worker_metrics (worker, snapshot, updated_at) VALUES (?, ?, ?)',
+                     (worker, json.dumps(snapshot()), time.time()))
+
+
+def worker_metric_snapshots():
+    conn = get_jobs_connection()
+    try:
+        init_jobs(conn)
+        return [json.loads(row[0]) for row in conn.execute('SELECT snapshot FROM worker_metrics')]
+    finally:
+        conn.close()
+
+
+_current_job = None
+
+
+def current_job():
+    """The id of the job this worker is running, for handlers that publish() progress."""
+    return _current_job
+
+
+def run_job(conn, job):
+    global _current_job
+    func = HANDLERS.get(job['kind'])
+    started = time.perf_counter()
+    _current_job = job['id']
+    try:
+        if func is None:
+            raise LookupError(f"No handler for job kind {job['kind']!r}")
+        result = func(**json.loads(job['payload']))
+    except Exception as e:
+        logging.error(f"Job {job['id']} ({job['kind']}) failed: {e}")
+        finish(conn, job['id'], error=f"{e.__class__.__name__}: {e}")
+        return
+    finally:
+        _current_job = None
+    finish(conn, job['id'], result=result)
+    logging.info(f"Job {job['id']} ({job['kind']}) done in {time.perf_counter() - started:.2f}s")
+
+
+def worker_main(max_priority=None, stop=None):
+    """Worker process loop: claim, run, repeat."""
+    import jobs  # registers the handlers
+
+    worker = f"{os.getpid()}"
+    conn = get_jobs_connection()
+    init_jobs(conn)
+    logging.info(f"Job worker {worker} started (priorities <= {max_priority}).")
+    while stop is None or not stop.is_set():
+        job = claim(conn, worker, max_priority)
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        run_job(conn, job)
+        save_worker_metrics(conn, worker)
+
+
+class WorkerPool:
+    """Keeps JOB_WORKERS worker processes alive; the first INTERACTIVE_WORKERS take interactive jobs only."""
+
+    def __init__(self, workers=JOB_WORKERS, interactive_workers=INTERACTIVE_WORKERS):
+        self.workers = workers
+        self.interactive_workers = min(interactive_workers, workers)
+        # Spawned, not forked: the web process has threads and open connections
+        self._context = multiprocessing.get_context('spawn')
+        self._stop = self._context.Event()
+        self._processes = []
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'started': 0, 'restarted': 0}
+
+    def _start_process(self, index):
+        max_priority = PRIORITIES['interactive'] if index < self.interactive_workers else None
+        process = self._context.Process(target=worker_main, args=(max_priority, self._stop),
+                                        name=f'job-worker-{index}', daemon=True)
+        process.start()
+        return process
+
+    def _supervise(self):
+        conn = get_jobs_connection()
+        try:
+            while not self._stop.wait(5):
+                for index, process in enumerate(self._processes):
+                    if not process.is_alive():
+                        logging.warning(f"Job worker {process.pid} exited with {process.exitcode}; restarting it.")
+                        requeue_worker_jobs(conn, str(process.pid))
+                        self._processes[index] = self._start_process(index)
+                        self.stats['restarted'] += 1
+                purge_finished(conn)
+        finally:
+            conn.close()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return self
+            conn = get_jobs_connection()
+            try:
+                init_jobs(conn)
+                requeue_orphans(conn)
+                # Counters restart with the workers
+                with conn:
+                    conn.execute('DELETE FROM worker_metrics')
+            finally:
+                conn.close()
+            self._processes = [self._start_process(index) for index in range(self.workers)]
+            self.stats['started'] += len(self._processes)
+            self._thread = threading.Thread(target=self._supervise, name='job-supervisor', daemon=True)
+            self._thread.start()
+            logging.info(f"Started {self.workers} job worker(s).")
+        return self
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def ensure_workers():
+    """Starts the embedded worker pool once, unless workers run as their own service."""
+    global _pool
+    if not EMBEDDED_WORKERS:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool().start()
+    return _pool
+
+
+def submit(kind, payload=None, priority='interactive', dedupe_key=None):
+    """Queues a job from the web process, making sure something will run it."""
+    conn = get_jobs_connection()
+    try:
+        init_jobs(conn)
+        job_id = enqueue(conn, kind, payload, priority, dedupe_key)
+    finally:
+        conn.close()
+    ensure_workers()
+    return job_id
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] == ['nightly']:
+        conn = get_jobs_connection()
+        init_jobs(conn)
+        logging.info(f"Queued job {enqueue(conn, 'nightly_update', {}, 'nightly', dedupe_key='nightly_update')}")
+        conn.close()
+    else:
+        # Through the module, so workers run job_queue.worker_main rather than __main__'s copy
+        import job_queue
+        pool = job_queue.WorkerPool().start()
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pool.stop()
@@ -0,0 +1,167 @@
+# jobs.py
+#
+# Job handlers run by the job_queue worker processes. Each takes the job's
+# payload as keyword arguments and returns a JSON-serialisable result.
+# run_scrape publishes each retailer's result as soon as it has it, for the
+# result page's event stream.
+
+import os
+import time
+import logging
+from functions import scrape_amazon_product, notify, queue_price_drop_alerts, update
+from price_store import record_price
+from retailers import start_lookups, collect_lookups
+from watchlist import plan_alerts
+from startup import BackgroundLoader
+from db import get_users_db_connection, get_price_history_db_connection
+from mailer import get_dispatcher
+from metrics import Histogram
+from job_queue import handler, publish, current_job
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+SCRAPE_STAGE_SECONDS = Histogram('trackit_scrape_stage_seconds',
+                                 'Time spent in each stage of a scrape job; prediction is part of price_history.', ('stage',))
+
+
+# Load the model trained offline by train_model.py in the background;
+# scrapes report "Prediction unavailable" until it is ready
+def load_predictor():
+    from predictor import PricePredictionModel
+
+    model_dir = os.environ.get('TRACKIT_MODEL_DIR', os.path.join(basedir, 'models'))
+    predictor = PricePredictionModel.load_latest(model_dir)
+    if predictor is None:
+        logging.warning("No trained model found; run `python train_model.py`. Predictions are unavailable.")
+    else:
+        logging.info("PricePredictionModel initialized successfully.")
+    return predictor
+
+predictor_loader = BackgroundLoader('predictor', load_predictor).start()
+
+
+def lookup_result(future):
+    """A finished retailer lookup's details; {} when it failed (collect_lookups logs why)."""
+    try:
+        return future.result()
+    except Exception:
+        return {}
+
+
+@handler('scrape')
+def run_scrape(url):
+    """Scrapes a product on every retailer and returns the result page context.
+
+    Publishes 'amazon', 'flipkart', 'reliance' and 'prediction' events as
+    each part is ready.
+    """
+    job_id = current_job()
+    with SCRAPE_STAGE_SECONDS.time(stage='amazon'):
+        amazon_data = scrape_amazon_product(url)
+    publish(job_id, 'amazon', amazon_data)
+    product_name = amazon_data.get('name', 'N/A')
+    current_price = amazon_data['price']
+    product_link = amazon_data['link']
+
+    # Flipkart and Reliance only need the product name; search them while
+    # the price history and prediction are worked out below. Each is
+    # published when it finishes, so a slow retailer does not hold back the other.
+    lookups_started_at, lookups = start_lookups(product_name)
+    for retailer, future in lookups.items():
+        future.add_done_callback(lambda future, retailer=retailer: publish(job_id, retailer, lookup_result(future)))
+
+    prediction = "Prediction unavailable"
+    predictor = predictor_loader.get()
+
+    history_started = time.perf_counter()
+    conn = get_price_history_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('SELECT srno FROM amazon_data WHERE name = ?', (product_name,))
+        product = cursor.fetchone()
+
+        if product:
+            # Record today's price for the product
+            record_price(conn, 'amazon', product['srno'], current_price)
+            conn.commit()
+
+            # Only this product's history is read back; features are computed
+            # exactly as in training
+            predictions = {}
+            if predictor:
+                try:
+                    with SCRAPE_STAGE_SECONDS.time(stage='prediction'):
+                        predictions = predictor.predict_products(conn, 'amazon', [product['srno']])
+                except Exception as e:
+                    logging.error(f"Error during prediction: {e}")
+
+            # Check if sufficient data is available for prediction
+            if product['srno'] in predictions:
+                prediction = predictions[product['srno']]
+            else:
+                logging.warning("Insufficient data for prediction.")
+                prediction = -1  # Default value
+
+        else:
+            # Insert new product data into the database; another process may
+            # have inserted the same link first, so read the srno back by link
+            cursor.execute('INSERT OR IGNORE INTO amazon_data (name, link) VALUES (?, ?)', (product_name, product_link))
+            cursor.execute('SELECT srno FROM amazon_data WHERE link = ?', (product_link,))
+            record_price(conn, 'amazon', cursor.fetchone()['srno'], current_price)
+            conn.commit()
+
+    except Exception as e:
+        logging.error(f"Error processing prediction: {e}")
+
+
+    conn.close()
+    SCRAPE_STAGE_SECONDS.observe(time.perf_counter() - history_started, stage='price_history')
+
+    prediction_value = int(prediction) if str(prediction).isdigit() else -1
+    publish(job_id, 'prediction', dict(prediction=prediction_value, prediction_unavailable=predictor is None))
+
+    # Fetch additional details, rendering slow retailers as pending
+    with SCRAPE_STAGE_SECONDS.time(stage='retailers'):
+        retailer_results = collect_lookups(lookups_started_at, lookups)
+    for retailer, details in retailer_results.items():
+        # A lookup that finished since publishes its own result
+        if details.get('status') == 'pending' and not lookups[retailer].done():
+            publish(job_id, retailer, details)
+    flipkart_data = retailer_results['flipkart']
+    reliance_product_data = retailer_results['reliance']
+
+    return dict(
+        amazon=amazon_data,
+        flipkart=flipkart_data,
+        reliance=reliance_product_data,
+        prediction=prediction_value,
+        prediction_unavailable=predictor is None
+        )
+
+
+@handler('send_notifications')
+def run_send_notifications():
+    """Queues a digest for every user watching a dropped product and sends them."""
+    price_drops = {
+        'amazon': notify("amazon_data"),
+        'flipkart': notify("flipkart_data"),
+    }
+
+    # Only users watching a dropped product are loaded
+    conn_users = get_users_db_connection()
+    try:
+        alerts = plan_alerts(conn_users, price_drops)
+    finally:
+        conn_users.close()
+
+    queued = queue_price_drop_alerts(alerts)
+    get_dispatcher().drain()
+    return {'queued': queued}
+
+
+@handler('nightly_update')
+def run_nightly_update():
+    """The nightly price refresh and alerts (functions.update)."""
+    update()
+    return {'finished_at': time.time()}
@@ -0,0 +1,337 @@
+# mailer.py
+
+import os
+import json
+import time
+import queue
+import random
+import smtplib
+import logging
+import threading
+from datetime import datetime
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from db import connect
+from metrics import Histogram, register_stats
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+# SMTP settings; point these at a local aiosmtpd / debugging server when testing
+SMTP_HOST = os.environ.get('TRACKIT_SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('TRACKIT_SMTP_PORT', 587))
+SMTP_STARTTLS = os.environ.get('TRACKIT_SMTP_STARTTLS', '1') == '1'
+SMTP_USER = os.environ.get('TRACKIT_SMTP_USER', 'your_email@example.com')  # Replace with your email
+SMTP_PASSWORD = os.environ.get('TRACKIT_SMTP_PASSWORD', 'your_email_password')  # Empty to skip login
+MAIL_FROM = os.environ.get('TRACKIT_MAIL_FROM', SMTP_USER)
+
+MAIL_QUEUE_DB = os.environ.get('TRACKIT_MAIL_QUEUE_DB', os.path.join(basedir, 'mail_queue.db'))
+SMTP_POOL_SIZE = int(os.environ.get('TRACKIT_SMTP_POOL_SIZE', 2))
+MAIL_BATCH_SIZE = int(os.environ.get('TRACKIT_MAIL_BATCH_SIZE', 50))
+MAIL_MAX_ATTEMPTS = int(os.environ.get('TRACKIT_MAIL_MAX_ATTEMPTS', 5))
+MAIL_RETRY_BASE = float(os.environ.get('TRACKIT_MAIL_RETRY_BASE', 30))  # seconds, doubled per attempt
+# Seconds after which a claimed message is assumed lost with its sender and
+# claimed again; far longer than a batch takes to send
+MAIL_CLAIM_TIMEOUT = float(os.environ.get('TRACKIT_MAIL_CLAIM_TIMEOUT', 3600))
+
+MAIL_SEND_SECONDS = Histogram('trackit_mail_send_seconds', 'Time to hand one digest to the SMTP server, by outcome.', ('outcome',))
+
+
+# Durable send queue
+
+def get_queue_connection():
+    return connect(MAIL_QUEUE_DB)
+
+
+def init_mail_queue(conn):
+    """Creates the queue table. One row per (run, recipient) is the digest."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS mail_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT NOT NULL,
+            to_email TEXT NOT NULL,
+            items TEXT NOT NULL DEFAULT '[]',
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            claimed_at REAL,
+            sent_at REAL,
+            UNIQUE (run_id, to_email)
+        )
+    ''')
+    # Queues created before claims were timed
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(mail_queue)').fetchall()]
+    if 'claimed_at' not in columns:
+        conn.execute('ALTER TABLE mail_queue ADD COLUMN claimed_at REAL')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_mail_queue_due ON mail_queue (status, next_attempt_at)')
+    conn.commit()
+
+
+def new_run_id():
+    """Identifies one notification run; each user gets at most one digest per run."""
+    return datetime.now().strftime('%Y%m%d%H%M%S%f')
+
+
+def enqueue_digests(run_id, digests):
+    """Queues one digest per recipient for this run, in a single transaction.
+
+    `digests` maps email to a list of product dicts (platform, srno, name,
+    link). A recipient already queued for the run gets the new products
+    merged into their pending digest instead of a second message.
+    """
+    conn = get_queue_connection()
+    try:
+        init_mail_queue(conn)
+        now = time.time()
+        with conn:
+            for to_email, items in digests.items():
+                row = conn.execute('SELECT id, items, status FROM mail_queue WHERE run_id = ? AND to_email = ?',
+                                   (run_id, to_email)).fetchone()
+                if row is None:
+                    conn.execute('''
+                        INSERT INTO mail_queue (run_id, to_email, items, next_attempt_at, created_at)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (run_id, to_email, json.dumps(items), now, now))
+                elif row['status'] == 'pending':
+                    merged = json.loads(row['items'])
+                    seen = {(item.get('platform'), item.get('srno')) for item in merged}
+                    merged.extend(item for item in items if (item.get('platform'), item.get('srno')) not in seen)
+                    conn.execute('UPDATE mail_queue SET items = ? WHERE id = ?', (json.dumps(merged), row['id']))
+                # Digests already sent for this run are never sent twice
+    finally:
+        conn.close()
+
+
+def claim_batch(conn, limit=MAIL_BATCH_SIZE, claim_timeout=MAIL_CLAIM_TIMEOUT):
+    """Marks up to `limit` due messages as sending and returns them.
+
+    Messages claimed more than `claim_timeout` seconds ago were left behind
+    by a sender that died, and are claimed again.
+    """
+    now = time.time()
+    # IMMEDIATE takes the write lock up front so two senders never claim the same rows
+    conn.execute('BEGIN IMMEDIATE')
+    with conn:
+        recovered = conn.execute('''
+            UPDATE mail_queue SET status = 'pending'
+            WHERE status = 'sending' AND (claimed_at IS NULL OR claimed_at < ?)
+        ''', (now - claim_timeout,)).rowcount
+        if recovered:
+            logging.warning(f"Requeued {recovered} message(s) claimed by a sender that never finished.")
+        rows = conn.execute('''
+            SELECT * FROM mail_queue WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY next_attempt_at LIMIT ?
+        ''', (now, limit)).fetchall()
+        conn.executemany("UPDATE mail_queue SET status = 'sending', claimed_at = ? WHERE id = ?",
+                         [(now, row['id']) for row in rows])
+    return rows
+
+
+def mark_sent(conn, message_id):
+    with conn:
+        conn.execute("UPDATE mail_queue SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                     (time.time(), message_id))
+
+
+def mark_failed(conn, message_id, attempts, error):
+    """Schedules a retry with jittered exponential backoff, or gives up."""
+    attempts += 1
+    if attempts >= MAIL_MAX_ATTEMPTS:
+        status, next_attempt_at = 'failed', time.time()
+    else:
+        delay = MAIL_RETRY_BASE * (2 ** (attempts - 1))
+        status, next_attempt_at = 'pending', time.time() + delay * random.uniform(0.8, 1.2)
+    with conn:
+        conn.execute('''
+            UPDATE mail_queue SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?
+        ''', (status, attempts, next_attempt_at, str(error), message_id))
+
+
+# Message building
+
+def build_digest(to_email, items):
+    """Builds the price drop alert listing every product that dropped."""
+    msg = MIMEMultipart()
+    msg['From'] = MAIL_FROM
+    msg['To'] = to_email
+    msg['Subject'] = "Price Drop Alert! 🎉"
+
+    if items:
+        product_lines = '\n'.join(f"    - {item.get('name', 'A tracked product')} ({item.get('platform', '').title()}): {item.get('link', '')}"
+                                  for item in items)
+        summary = f"These products you're tracking have just dropped in price:\n\n{product_lines}\n\n    Check your dashboard to see the updated prices."
+    else:
+        summary = "One of the products you're tracking has just dropped in price. Check your dashboard to see the updated price."
+
+    body = f'''
+    Hey there,
+
+    Good news! 📉
+
+    {summary}
+
+    Don't miss out on this great deal!
+
+    Best regards,
+    TrackIT Team
+    '''
+
+    # Attach the email body to the message
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+# Connection pool
+
+class SMTPPool:
+    """Keeps logged-in SMTP connections open between messages and batches."""
+
+    def __init__(self, size=SMTP_POOL_SIZE, host=None, port=None):
+        self.size = size
+        self.host = host or SMTP_HOST
+        self.port = port or SMTP_PORT
+        self._idle = queue.LifoQueue()
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if SMTP_STARTTLS:
+            server.starttls()  # Upgrade to a secure connection
+        if SMTP_PASSWORD:
+            server.login(SMTP_USER, SMTP_PASSWORD)
+        logging.info(f"Opened SMTP connection to {self.host}:{self.port}")
+        return server
+
+    def acquire(self):
+        """Returns a live connection, reusing an idle one when it still answers."""
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._quit(server)
+
+    def release(self, server, broken=False):
+        if broken or self._idle.qsize() >= self.size:
+            self._quit(server)
+        else:
+            self._idle.put(server)
+
+    def _quit(self, server):
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                self._quit(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+# Dispatcher
+
+class MailDispatcher:
+    """Sends queued digests in batches from a background thread."""
+
+    def __init__(self, pool=None, batch_size=MAIL_BATCH_SIZE, poll_interval=5):
+        self.pool = pool or SMTPPool()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'sent': 0, 'failed': 0, 'batches': 0}
+
+    def send_batch(self, conn):
+        """Sends one batch of due messages; returns how many were claimed."""
+        rows = claim_batch(conn, self.batch_size)
+        if not rows:
+            return 0
+        self.stats['batches'] += 1
+        server = None
+        for row in rows:
+            started = time.perf_counter()
+            try:
+                if server is None:
+                    server = self.pool.acquire()
+                server.send_message(build_digest(row['to_email'], json.loads(row['items'])))
+                MAIL_SEND_SECONDS.observe(time.perf_counter() - started, outcome='sent')
+                mark_sent(conn, row['id'])
+                self.stats['sent'] += 1
+                logging.info(f"Email sent successfully to {row['to_email']}.")
+            except Exception as e:
+                MAIL_SEND_SECONDS.observe(time.perf_counter() - started, outcome='failed')
+                logging.error(f"Failed to send email to {row['to_email']}: {e}")
+                mark_failed(conn, row['id'], row['attempts'], e)
+                self.stats['failed'] += 1
+                if server is not None and isinstance(e, (smtplib.SMTPServerDisconnected, OSError)):
+                    self.pool.release(server, broken=True)
+                    server = None
+        if server is not None:
+            self.pool.release(server)
+        return len(rows)
+
+    def drain(self):
+        """Sends everything that is due now, in the calling thread."""
+        conn = get_queue_connection()
+        try:
+            init_mail_queue(conn)
+            while self.send_batch(conn):
+                pass
+        finally:
+            conn.close()
+
+    def _run(self):
+        conn = get_queue_connection()
+        init_mail_queue(conn)
+        while True:
+            try:
+                while self.send_batch(conn):
+                    pass
+            except Exception as e:
+                logging.error(f"Mail dispatcher error: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self):
+        """Starts the background sender once; later calls just wake it up."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='mail-dispatcher', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = MailDispatcher()
+    return _dispatcher
+
+
+def dispatcher_stats():
+    return dict(_dispatcher.stats) if _dispatcher is not None else {}
+
+register_stats('trackit_mail', 'Mail dispatcher counters.', dispatcher_stats)
+
+
+if __name__ == '__main__':
+    # python mailer.py  -- send whatever is queued and exit
+    logging.basicConfig(level=logging.INFO)
+    dispatcher = get_dispatcher()
+    dispatcher.drain()
+    dispatcher.pool.close()
+    print(dispatcher.stats)
@@ -0,0 +1,264 @@
+# metrics.py
+#
+# In-process counters and latency histograms, rendered in the Prometheus text
+# format by the /metrics route. Modules define the metrics they record;
+# stats dicts kept elsewhere (browser pool, caches, connection pools) are
+# registered with register_stats() and read when the page is rendered.
+# Worker processes publish snapshot()s that are added in at render time.
+
+import time
+import bisect
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+
+# Seconds; covers everything from a cached SQLite read to a slow browser scrape
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_metrics = []
+_stats = []
+_snapshot_sources = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count per label combination."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.labels), 0)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def render(self, snapshots=()):
+        with self._lock:
+            merged = dict(self._values)
+        for values in snapshots:
+            for key, value in values:
+                merged[tuple(key)] = merged.get(tuple(key), 0) + value
+        for key, value in sorted(merged.items()):
+            yield f"{self.name}_total{_format_labels(zip(self.labels, key))} {_format_value(value)}"
+
+
+class Histogram:
+    """Observations bucketed by value, with their sum and count, per label combination."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes how long the block takes, including when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(str(labels[name]) for name in self.labels))
+        return sum(entry[0]) if entry else 0
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+    def render(self, snapshots=()):
+        with self._lock:
+            merged = {key: [list(counts), total] for key, (counts, total) in self._values.items()}
+        for values in snapshots:
+            for key, (counts, total) in values:
+                entry = merged.setdefault(tuple(key), [[0] * len(counts), 0.0])
+                if len(entry[0]) != len(counts):
+                    continue  # bucket layout changed between versions
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+        for key, (counts, total) in sorted(merged.items()):
+            labels = list(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+def register_stats(name, help, func, label=None):
+    """Exposes a stats dict as gauges, read each time /metrics is rendered.
+
+    Names already registered are ignored, so modules can register their own
+    stats at import time.
+
+    `func()` returns {stat: number}, or with `label`, {key: {stat: number}};
+    every number becomes `name{<label>="key",stat="..."}`.
+    """
+    if all(registered[0] != name for registered in _stats):
+        _stats.append((name, help, func, label))
+
+
+def _stats_samples(name, func, label):
+    """Returns [(labels, value)] for one registered stats function."""
+    try:
+        stats = func() or {}
+    except Exception as e:
+        logging.warning(f"Could not read stats for {name}: {e}")
+        return []
+    samples = []
+    groups = stats.items() if label else [(None, stats)]
+    for key, values in groups:
+        for stat, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            samples.append(((((label, str(key)),) if label else ()) + (('stat', stat),), value))
+    return samples
+
+
+def snapshot():
+    """Returns every metric's raw values and stats, JSON-serialisable, for another process to merge."""
+    return {
+        'metrics': {metric.name: metric.snapshot() for metric in _metrics},
+        'stats': {name: [[list(map(list, labels)), value] for labels, value in _stats_samples(name, func, label)]
+                  for name, help, func, label in _stats},
+    }
+
+
+def register_snapshot_source(func):
+    """Adds `func()` -> [snapshot(), ...] from other processes to what render() reports."""
+    _snapshot_sources.append(func)
+
+
+def _collect_snapshots():
+    snapshots = []
+    for func in _snapshot_sources:
+        try:
+            snapshots.extend(func())
+        except Exception as e:
+            logging.warning(f"Could not read metric snapshots: {e}")
+    return snapshots
+
+
+def render():
+    """Returns every metric in the Prometheus text exposition format.
+
+    Values published by other processes are added to this process's own.
+    """
+    lines = []
+    snapshots = _collect_snapshots()
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render([snapshot['metrics'][metric.name] for snapshot in snapshots
+                                    if metric.name in snapshot.get('metrics', {})]))
+    for name, help, func, label in _stats:
+        merged = dict(_stats_samples(name, func, label))
+        for snapshot in snapshots:
+            for labels, value in snapshot.get('stats', {}).get(name, []):
+                labels = tuple(map(tuple, labels))
+                merged[labels] = merged.get(labels, 0) + value
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in sorted(merged.items()))
+    return '\n'.join(lines) + '\n'
+
+
+# Scrapers
+
+SCRAPE_SECONDS = Histogram('trackit_scrape_seconds', 'Scraper call latency by scraper, retailer and outcome.',
+                           ('scraper', 'retailer', 'outcome'))
+
+MISSING = (None, '', 'N/A')
+
+
+def scrape_outcome(result):
+    """Classifies a scraper's return value as found, price_missing or not_found.
+
+    Scrapers return a details dict, a (price, name) tuple or, for searches
+    that only find a link, the link itself.
+    """
+    if isinstance(result, tuple):
+        price, name = result
+    elif isinstance(result, dict):
+        price, name = result.get('price'), result.get('name')
+    else:
+        return 'not_found' if result in MISSING else 'found'
+    if name in MISSING:
+        return 'not_found'
+    if price in MISSING:
+        return 'price_missing'
+    return 'found'
+
+
+def error_outcome(error):
+    # selenium's TimeoutException, requests' Timeout and the builtin TimeoutError
+    return 'timeout' if isinstance(error, TimeoutError) or 'Timeout' in type(error).__name__ else 'crash'
+
+
+def instrument_scraper(retailer):
+    """Decorator recording each call's latency in SCRAPE_SECONDS, labelled by outcome."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                SCRAPE_SECONDS.observe(time.perf_counter() - started, scraper=func.__name__,
+                                       retailer=retailer, outcome=error_outcome(e))
+                raise
+            SCRAPE_SECONDS.observe(time.perf_counter() - started, scraper=func.__name__,
+                                   retailer=retailer, outcome=scrape_outcome(result))
+            return result
+        return wrapper
+    return decorator
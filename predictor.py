@@ -3,40 +3,83 @@ import numpy as np
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
+import hashlib
 import logging
+import os
+import time
+import joblib
+from metrics import Counter, Histogram
+
+# Name of the file in a model directory that points at the current artifact
+LATEST_POINTER = 'LATEST'
+ARTIFACT_PREFIX = 'price_model-'
+
+# Trees added by each incremental update, and the forest size past which
+# train_model.py retrains from scratch instead (a full fit has 100 trees)
+INCREMENT_TREES = 20
+MODEL_MAX_TREES = int(os.environ.get('TRACKIT_MODEL_MAX_TREES', 300))
+
+FEATURE_COLUMNS = ['price_std', 'price_change']
+
+PREDICTION_SECONDS = Histogram('trackit_prediction_seconds', 'Latency of one batched model prediction.')
+PREDICTED_PRODUCTS = Counter('trackit_predicted_products', 'Products the model has scored.')
+
+
+def clean_prices(values):
+    """Converts scraped price strings ('₹1,299.00', 'N/A') to floats in one pass; unparseable become NaN."""
+    cleaned = np.char.replace(np.char.replace(np.asarray(values, dtype=str), '₹', ''), ',', '')
+    return pd.to_numeric(pd.Series(np.char.strip(cleaned)), errors='coerce').to_numpy(dtype=float)
+
+
+def compute_features(observations):
+    """Per-product price statistics and model features from long-format observations.
+
+    `observations` has product_id and either price_paise (integer paise) or
+    price (scraped strings). Returns a DataFrame indexed by product_id with
+    count, avg_price, price_std, min, max and price_change, using column
+    reductions only. Products with fewer than two prices are dropped.
+    """
+    if 'price_paise' in observations:
+        rupees = observations['price_paise'].to_numpy(dtype=float) / 100
+    else:
+        rupees = clean_prices(observations['price'])
+    valid = np.isfinite(rupees) & (rupees > 0)
+    rupees = pd.Series(rupees[valid], index=observations['product_id'].to_numpy()[valid])
+
+    # Calculate price trends per product
+    features = rupees.groupby(level=0).agg(['count', 'mean', 'std', 'min', 'max'])
+    features.index.name = 'product_id'
+
+    # Drop products with insufficient price data
+    features = features[features['count'] >= 2].rename(columns={'mean': 'avg_price', 'std': 'price_std'})
+    features['price_change'] = np.where(features['max'] > 0, (features['max'] - features['min']) / features['max'], 0)
+    return features
+
+
+def dataset_version(conn, platform='amazon'):
+    """Short hash identifying the observations a model was trained on."""
+    row = conn.execute('''
+        SELECT COUNT(*), MAX(observed_at), SUM(price_paise) FROM price_observations
+        WHERE platform = ? AND price_paise IS NOT NULL
+    ''', (platform,)).fetchone()
+    return hashlib.sha1(f"{platform}|{row[0]}|{row[1]}|{row[2]}".encode()).hexdigest()[:12]
 
 
 class PricePredictionModel:
-    def __init__(self, dataset):
+    def __init__(self, dataset=None):
         self.dataset = dataset
         self.model = None
         self.scaler = None
+        self.version = None
+        self.watermark = None  # newest observed_at the model has seen
 
     def preprocess_data(self):
         """Preprocess data: clean prices and create features."""
         try:
-            # Clean prices in all columns except the first two (name, link)
-            price_columns = [col for col in self.dataset.columns if col.startswith("2024-")]
-            
-            def clean_price(price):
-                if isinstance(price, str):
-                    price = price.replace('₹', '').replace(',', '').strip()
-                try:
-                    return float(price) if float(price) > 0 else None
-                except ValueError:
-                    return None
-            
-            self.dataset[price_columns] = self.dataset[price_columns].map(clean_price)
-
-            # Drop rows with insufficient price data
-            self.dataset.dropna(subset=price_columns, thresh=2, inplace=True)
-
-            # Calculate price trends
-            self.dataset['avg_price'] = self.dataset[price_columns].mean(axis=1)
-            self.dataset['price_std'] = self.dataset[price_columns].std(axis=1)
-            self.dataset['price_change'] = self.dataset[price_columns].apply(
-                lambda row: (row.max() - row.min()) / row.max() if row.max() else 0, axis=1
-            )
+            # Either features read from product_features, or long-format
+            # observations (one product_id, observed_at, price row each)
+            if 'price_std' not in self.dataset:
+                self.dataset = compute_features(self.dataset)
             
             # Calculate price drop probability
             self.dataset['price_drop_prob'] = np.where(
@@ -58,7 +101,7 @@ class PricePredictionModel:
         """Train a model to predict price drop probability."""
         try:
             # Features and target
-            X = self.dataset[['price_std', 'price_change']]
+            X = self.dataset[FEATURE_COLUMNS]
             y = self.dataset[target_column]
 
             # Split data
@@ -82,19 +125,119 @@ class PricePredictionModel:
     def predict(self, input_data):
         """Predict price drop probability based on input features."""
         try:
-            # Ensure input is a valid list or numpy array
-            input_features = np.array(input_data).reshape(1, -1)
-            
-            # Transform input features
-            input_scaled = self.scaler.transform(input_features)
-            
-            # Predict probability of price drop
-            prediction = self.model.predict(input_scaled)[0]
-            
-            # Clip prediction between 0 and 100
-            prediction = max(0, min(int(prediction), 100))
-            
-            return prediction
+            return int(self.predict_batch([input_data])[0])
         except Exception as e:
             logging.error(f"Error during prediction: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def predict_batch(self, features):
+        """Predict drop probabilities (0-100 ints) for many products in one model call.
+
+        `features` is an (n, 2) array of [price_std, price_change] rows or a
+        DataFrame with those columns.
+        """
+        if isinstance(features, pd.DataFrame):
+            features = features[FEATURE_COLUMNS].to_numpy()
+        features = np.asarray(features, dtype=float).reshape(-1, len(FEATURE_COLUMNS))
+        if not len(features):
+            return np.empty(0, dtype=int)
+        with PREDICTION_SECONDS.time():
+            # Named columns match what the scaler was fitted on
+            predictions = self.model.predict(self.scaler.transform(pd.DataFrame(features, columns=FEATURE_COLUMNS)))
+        PREDICTED_PRODUCTS.inc(len(features))
+        # Truncate like int() did, then clip between 0 and 100
+        return np.clip(np.trunc(predictions), 0, 100).astype(int)
+
+    def predict_products(self, conn, platform, product_ids):
+        """Returns {product_id: drop probability} for products with at least two prices.
+
+        Features come precomputed from product_features; no history is read.
+        """
+        from product_features import load_features
+
+        product_ids = list(product_ids)
+        if not product_ids:
+            return {}
+        features = load_features(conn, platform, product_ids=product_ids)
+        features = features.dropna(subset=FEATURE_COLUMNS)
+        if features.empty:
+            return {}
+        return dict(zip(features.index.tolist(), self.predict_batch(features).tolist()))
+
+    def update_model(self, new_dataset, n_new_trees=INCREMENT_TREES, target_column="price_drop_prob"):
+        """Incrementally train on products that have new observations.
+
+        `new_dataset` holds the observations of those products only. New
+        trees are grown on them and added to the forest; the scaler is kept
+        as-is so the existing trees stay valid. Returns False, leaving the
+        model unchanged, when there is too little new data.
+        """
+        self.dataset = new_dataset
+        self.preprocess_data()
+        if len(self.dataset) < 2:
+            logging.info("Not enough new products for an incremental update.")
+            return False
+
+        X = self.scaler.transform(self.dataset[FEATURE_COLUMNS])
+        y = self.dataset[target_column]
+
+        self.model.set_params(warm_start=True, n_estimators=self.model.n_estimators + n_new_trees)
+        self.model.fit(X, y)
+        logging.info(f"Model updated with {len(self.dataset)} products; forest now has {self.model.n_estimators} trees.")
+        return True
+
+    def save(self, model_dir, version, watermark):
+        """Write the fitted scaler and model as a joblib artifact and mark it as latest."""
+        os.makedirs(model_dir, exist_ok=True)
+        filename = f"{ARTIFACT_PREFIX}{version}.joblib"
+        joblib.dump({
+            'scaler': self.scaler,
+            'model': self.model,
+            'version': version,
+            'watermark': watermark,
+            'trained_at': time.time(),
+        }, os.path.join(model_dir, filename))
+
+        # Swap the pointer atomically so readers never see a half-written name
+        pointer_tmp = os.path.join(model_dir, LATEST_POINTER + '.tmp')
+        with open(pointer_tmp, 'w') as f:
+            f.write(filename)
+        os.replace(pointer_tmp, os.path.join(model_dir, LATEST_POINTER))
+
+        self.version, self.watermark = version, watermark
+        logging.info(f"Saved model artifact {filename}")
+        prune_artifacts(model_dir, keep=filename)
+        return os.path.join(model_dir, filename)
+
+    @classmethod
+    def load_latest(cls, model_dir):
+        """Load the latest saved artifact, or return None if there is none."""
+        try:
+            with open(os.path.join(model_dir, LATEST_POINTER)) as f:
+                filename = f.read().strip()
+        except FileNotFoundError:
+            return None
+
+        # Large numpy arrays inside the forest are memory-mapped, not copied
+        artifact = joblib.load(os.path.join(model_dir, filename), mmap_mode='r')
+        predictor = cls()
+        predictor.scaler = artifact['scaler']
+        predictor.model = artifact['model']
+        predictor.version = artifact['version']
+        predictor.watermark = artifact['watermark']
+        logging.info(f"Loaded model artifact {filename}")
+        return predictor
+
+
+def prune_artifacts(model_dir, keep):
+    """Deletes every saved artifact except `keep`, the one LATEST points at.
+
+    A process still serving an older artifact keeps its memory map; where
+    the file cannot be deleted yet it is left for the next run.
+    """
+    for filename in os.listdir(model_dir):
+        if filename.startswith(ARTIFACT_PREFIX) and filename.endswith('.joblib') and filename != keep:
+            try:
+                os.remove(os.path.join(model_dir, filename))
+            except OSError as e:
+                logging.warning(f"Could not delete old model artifact {filename}: {e}")
@@ -0,0 +1,89 @@
+# price_drops.py
+
+import numpy as np
+import pandas as pd
+
+DROP_COLUMNS = ['product_id', 'previous', 'current', 'drop_abs', 'drop_pct', 'new_low']
+
+
+def _product_id_range(conn, platform):
+    row = conn.execute('SELECT MIN(product_id), MAX(product_id) FROM price_observations WHERE platform = ?',
+                       (platform,)).fetchone()
+    return row[0], row[1]
+
+
+def iter_observation_chunks(conn, platform, chunk_products=5000):
+    """Yields long-format DataFrames covering `chunk_products` product ids each.
+
+    Every product's whole series lands in the same chunk, sorted by date.
+    """
+    first_id, last_id = _product_id_range(conn, platform)
+    if first_id is None:
+        return
+    for low in range(first_id, last_id + 1, chunk_products):
+        chunk = pd.read_sql_query('''
+            SELECT product_id, price_paise FROM price_observations
+            WHERE platform = ? AND product_id >= ? AND product_id < ?
+            ORDER BY product_id, observed_at
+        ''', conn, params=(platform, low, low + chunk_products))
+        if not chunk.empty:
+            yield chunk
+
+
+def latest_changes(observations):
+    """Computes each product's latest price change in one vectorized pass.
+
+    `observations` must be sorted by (product_id, observed_at). Returns one
+    row per product with at least two valid prices, in rupees.
+    """
+    prices = pd.to_numeric(observations['price_paise'], errors='coerce').to_numpy(dtype=float) / 100
+    product_ids = observations['product_id'].to_numpy()
+
+    valid = np.isfinite(prices) & (prices > 0)
+    prices, product_ids = prices[valid], product_ids[valid]
+    if len(prices) < 2:
+        return pd.DataFrame(columns=DROP_COLUMNS)
+
+    same_as_previous = np.concatenate(([False], product_ids[1:] == product_ids[:-1]))
+    is_latest = np.concatenate((product_ids[1:] != product_ids[:-1], [True]))
+
+    # Lowest price seen before each observation, within the same product
+    running_min = pd.Series(prices).groupby(product_ids).cummin().to_numpy()
+    prior_min = np.concatenate(([np.nan], running_min[:-1]))
+
+    latest = is_latest & same_as_previous
+    previous = np.concatenate(([np.nan], prices[:-1]))[latest]
+    current = prices[latest]
+    drop_abs = previous - current
+
+    return pd.DataFrame({
+        'product_id': product_ids[latest],
+        'previous': previous,
+        'current': current,
+        'drop_abs': drop_abs,
+        'drop_pct': drop_abs / previous * 100,
+        'new_low': current < prior_min[latest],
+    })
+
+
+def detect_price_drops(conn, platform, min_drop_abs=0, min_drop_pct=0, new_low_only=False,
+                       chunk_products=5000):
+    """Finds products whose latest price is below the one before it.
+
+    A drop must be at least `min_drop_abs` rupees and `min_drop_pct`
+    percent; with `new_low_only` it must also be a new all-time low.
+    Returns a DataFrame with DROP_COLUMNS.
+    """
+    drops = []
+    for chunk in iter_observation_chunks(conn, platform, chunk_products):
+        changes = latest_changes(chunk)
+        mask = ((changes['drop_abs'] > 0)
+                & (changes['drop_abs'] >= min_drop_abs)
+                & (changes['drop_pct'] >= min_drop_pct))
+        if new_low_only:
+            mask &= changes['new_low']
+        drops.append(changes[mask])
+
+    if not drops:
+        return pd.DataFrame(columns=DROP_COLUMNS)
+    return pd.concat(drops, ignore_index=True)
@@ -0,0 +1,119 @@
+# price_series.py
+
+import os
+import hashlib
+from datetime import date, timedelta
+from price_store import get_price_history, get_price_history_stamp
+from scrape_cache import LRUCache
+
+DEFAULT_POINTS = 60
+MAX_POINTS = 1000
+SERIES_CACHE_SIZE = int(os.environ.get('TRACKIT_SERIES_CACHE_SIZE', 512))
+
+DOWNSAMPLERS = {}
+
+
+def downsampler(name):
+    def register(func):
+        DOWNSAMPLERS[name] = func
+        return func
+    return register
+
+
+@downsampler('lttb')
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets: keeps the points that preserve the shape of the line.
+
+    `points` is a list of (x, y) sorted by x. Returns at most `threshold`
+    points, always including the first and last.
+    """
+    if threshold >= len(points) or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (len(points) - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+
+        # Average of the next bucket is the third corner of the triangle
+        next_start, next_end = end, min(int((i + 2) * bucket_size) + 1, len(points))
+        next_bucket = points[next_start:next_end] or [points[-1]]
+        avg_x = sum(x for x, _ in next_bucket) / len(next_bucket)
+        avg_y = sum(y for _, y in next_bucket) / len(next_bucket)
+
+        ax, ay = points[a]
+        best, best_area = start, -1
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+@downsampler('minmax')
+def minmax(points, threshold):
+    """Keeps the lowest and highest price of each bucket, so no drop or spike is lost."""
+    if threshold >= len(points) or threshold < 2:
+        return list(points)
+
+    buckets = threshold // 2
+    size = len(points) / buckets
+    sampled = []
+    for i in range(buckets):
+        bucket = points[int(i * size):int((i + 1) * size)]
+        if not bucket:
+            continue
+        low = min(bucket, key=lambda point: point[1])
+        high = max(bucket, key=lambda point: point[1])
+        sampled.extend(sorted({low, high}))
+    return sampled
+
+
+def window_start(days):
+    return (date.today() - timedelta(days=days)).isoformat() if days else None
+
+
+_series_cache = LRUCache(SERIES_CACHE_SIZE)
+
+
+def series_etag(platform, srno, start, points, method, stamp):
+    count, last_observed_at, total = stamp
+    raw = f"{platform}:{srno}:{start}:{points}:{method}:{count}:{last_observed_at}:{total}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def get_price_series(conn, platform, srno, days=None, points=DEFAULT_POINTS, method='lttb'):
+    """Returns (etag, last_observed_at, payload) for a product's downsampled price series.
+
+    The ETag covers the window, the point count and the product's latest
+    observation, so it changes exactly when the series would. Series are
+    cached in memory under their ETag.
+    """
+    points = max(2, min(int(points), MAX_POINTS))
+    start = window_start(days)
+    stamp = get_price_history_stamp(conn, platform, srno, start)
+    etag = series_etag(platform, srno, start, points, method, stamp)
+
+    entry = _series_cache.get(etag)
+    if entry is not None:
+        return etag, stamp[1], entry[0]
+
+    history = get_price_history(conn, platform, srno, start=start)
+    series = [(date.fromisoformat(observed_at).toordinal(), price_paise / 100) for observed_at, price_paise in history]
+    sampled = DOWNSAMPLERS[method](series, points)
+    payload = {
+        'platform': platform,
+        'srno': srno,
+        'start': start,
+        'method': method,
+        'total_points': len(series),
+        'points': [[date.fromordinal(x).isoformat(), price] for x, price in sampled],
+    }
+    _series_cache.set(etag, payload)
+    return etag, stamp[1], payload
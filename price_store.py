@@ -0,0 +1,355 @@
+# price_store.py
+
+import re
+import sqlite3
+import logging
+import os
+import sys
+from datetime import date
+from product_features import (init_product_features, update_product_features, update_product_features_many,
+                              rebuild_product_features, chunked)
+
+# Product catalogue tables, keyed by platform
+PRODUCT_TABLES = {
+    'amazon': 'amazon_data',
+    'flipkart': 'flipkart_data',
+}
+
+# Legacy per-day price columns look like "2024-10-08"
+DATE_COLUMN_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def platform_for_table(tablename):
+    """Maps a product table name (e.g. 'amazon_data') to its platform key."""
+    for platform, table in PRODUCT_TABLES.items():
+        if table == tablename:
+            return platform
+    raise ValueError(f"Unknown product table: {tablename}")
+
+
+def parse_price_paise(price):
+    """Converts a scraped price ('₹1,299.00', '1299', 1299) to integer paise.
+
+    Returns None for missing or non-positive prices ('N/A', 0, '').
+    """
+    if price is None:
+        return None
+    if isinstance(price, str):
+        price = price.replace('₹', '').replace(',', '').strip()
+    try:
+        value = float(price)
+    except (ValueError, TypeError):
+        return None
+    if value <= 0:
+        return None
+    return int(round(value * 100))
+
+
+def init_price_store(conn):
+    """Creates the product tables and the price observations table."""
+    cursor = conn.cursor()
+    for table in PRODUCT_TABLES.values():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                srno INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                link TEXT NOT NULL UNIQUE
+            )
+        ''')
+    # One row per (platform, product, day); the primary key doubles as the
+    # composite index every history read goes through.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS price_observations (
+            product_id INTEGER NOT NULL,
+            platform TEXT NOT NULL,
+            observed_at TEXT NOT NULL,
+            price_paise INTEGER,
+            PRIMARY KEY (platform, product_id, observed_at)
+        ) WITHOUT ROWID
+    ''')
+    conn.commit()
+    init_product_features(conn)
+
+
+def _write_observation(conn, platform, product_id, observed_at, price_paise):
+    """Writes one observation and folds it into the product's running features."""
+    replaced = conn.execute('''
+        SELECT price_paise FROM price_observations WHERE platform = ? AND product_id = ? AND observed_at = ?
+    ''', (platform, product_id, observed_at)).fetchone()
+    conn.execute('''
+        INSERT OR REPLACE INTO price_observations (product_id, platform, observed_at, price_paise)
+        VALUES (?, ?, ?, ?)
+    ''', (product_id, platform, observed_at, price_paise))
+    update_product_features(conn, platform, product_id, observed_at, price_paise, replaced[0] if replaced else None)
+
+
+def record_price(conn, platform, product_id, price, observed_at=None):
+    """Stores today's (or `observed_at`'s) price for a product.
+
+    A second observation on the same day replaces the first. Unparseable
+    prices are skipped. The caller is responsible for committing.
+    Returns True if a row was written.
+    """
+    price_paise = parse_price_paise(price)
+    if price_paise is None:
+        return False
+    _write_observation(conn, platform, product_id, observed_at or str(date.today()), price_paise)
+    return True
+
+
+def record_prices(conn, observations):
+    """Stores many prices in the caller's transaction.
+
+    `observations` is an iterable of (platform, product_id, price, observed_at)
+    tuples; observed_at may be None for today. Unparseable prices are skipped,
+    and a later price for the same product and day replaces an earlier one.
+    The prices being replaced are read in one query per day and chunk of
+    products, the rows are written with one executemany, and
+    product_features is updated in bulk. The caller is responsible for
+    committing. Returns the number of rows written.
+    """
+    today = str(date.today())
+    prices = {}
+    for platform, product_id, price, observed_at in observations:
+        price_paise = parse_price_paise(price)
+        if price_paise is not None:
+            prices[(platform, product_id, observed_at or today)] = price_paise
+    if not prices:
+        return 0
+
+    replaced = _stored_prices(conn, prices)
+    conn.executemany('''
+        INSERT OR REPLACE INTO price_observations (product_id, platform, observed_at, price_paise)
+        VALUES (?, ?, ?, ?)
+    ''', [(product_id, platform, observed_at, price_paise)
+          for (platform, product_id, observed_at), price_paise in prices.items()])
+
+    writes = {}
+    for key, price_paise in prices.items():
+        platform, product_id, observed_at = key
+        writes.setdefault(platform, []).append((product_id, observed_at, price_paise, replaced.get(key)))
+    for platform, platform_writes in writes.items():
+        update_product_features_many(conn, platform, platform_writes)
+    return len(prices)
+
+
+def _stored_prices(conn, keys):
+    """Returns {(platform, product_id, observed_at): price_paise} for the keys already stored."""
+    days = {}
+    for platform, product_id, observed_at in keys:
+        days.setdefault((platform, observed_at), []).append(product_id)
+    stored = {}
+    for (platform, observed_at), product_ids in days.items():
+        for chunk in chunked(product_ids):
+            rows = conn.execute(f'''
+                SELECT product_id, price_paise FROM price_observations
+                WHERE platform = ? AND observed_at = ? AND product_id IN ({', '.join('?' * len(chunk))})
+            ''', [platform, observed_at] + chunk)
+            stored.update(((platform, product_id, observed_at), price_paise) for product_id, price_paise in rows)
+    return stored
+
+
+def get_price_history(conn, platform, product_id, start=None):
+    """Returns [(observed_at, price_paise), ...] for one product, oldest first.
+
+    With `start` (an observed_at date), only observations from that date on.
+    """
+    cursor = conn.execute('''
+        SELECT observed_at, price_paise FROM price_observations
+        WHERE platform = ? AND product_id = ? AND observed_at >= ? AND price_paise IS NOT NULL
+        ORDER BY observed_at
+    ''', (platform, product_id, start or ''))
+    return [(row[0], row[1]) for row in cursor.fetchall()]
+
+
+def get_price_history_stamp(conn, platform, product_id, start=None):
+    """Returns (count, latest observed_at, price total) of a product's history.
+
+    The stamp changes whenever the history does, including a same-day price
+    replacement, without reading the rows back.
+    """
+    row = conn.execute('''
+        SELECT COUNT(*), MAX(observed_at), TOTAL(price_paise) FROM price_observations
+        WHERE platform = ? AND product_id = ? AND observed_at >= ? AND price_paise IS NOT NULL
+    ''', (platform, product_id, start or '')).fetchone()
+    return row[0], row[1], row[2]
+
+
+def get_products(conn, platform, srnos):
+    """Returns {srno: {'srno', 'name', 'link'}} for the given products in one query."""
+    srnos = list(srnos)
+    if not srnos:
+        return {}
+    placeholders = ', '.join('?' * len(srnos))
+    cursor = conn.execute(f'SELECT srno, name, link FROM {PRODUCT_TABLES[platform]} WHERE srno IN ({placeholders})',
+                          srnos)
+    return {row[0]: {'srno': row[0], 'name': row[1], 'link': row[2]} for row in cursor.fetchall()}
+
+
+def get_product_summaries(conn, platform, srnos):
+    """Returns what a watchlist view needs for the given products, in one query.
+
+    Each item has srno, name, link, price and previous_price (rupees, or
+    None), change (price - previous_price) and observed_at (date of the
+    latest price). Items come back in the order of `srnos`; unknown srnos
+    are skipped.
+    """
+    srnos = list(srnos)
+    if not srnos:
+        return []
+    placeholders = ', '.join('?' * len(srnos))
+    # Each subquery is a seek on the (platform, product_id, observed_at) key
+    cursor = conn.execute(f'''
+        SELECT p.srno, p.name, p.link,
+            (SELECT price_paise FROM price_observations o
+             WHERE o.platform = ? AND o.product_id = p.srno ORDER BY o.observed_at DESC LIMIT 1),
+            (SELECT price_paise FROM price_observations o
+             WHERE o.platform = ? AND o.product_id = p.srno ORDER BY o.observed_at DESC LIMIT 1 OFFSET 1),
+            (SELECT MAX(observed_at) FROM price_observations o
+             WHERE o.platform = ? AND o.product_id = p.srno)
+        FROM {PRODUCT_TABLES[platform]} p
+        WHERE p.srno IN ({placeholders})
+    ''', [platform, platform, platform] + srnos)
+
+    products = {}
+    for srno, name, link, price_paise, previous_paise, observed_at in cursor.fetchall():
+        price = price_paise / 100 if price_paise is not None else None
+        previous_price = previous_paise / 100 if previous_paise is not None else None
+        products[srno] = {
+            'srno': srno,
+            'name': name,
+            'link': link,
+            'price': price,
+            'previous_price': previous_price,
+            'change': price - previous_price if price is not None and previous_price is not None else None,
+            'observed_at': observed_at,
+        }
+    return [products[srno] for srno in srnos if srno in products]
+
+
+def load_observations(conn, platform, since=None, product_ids=None):
+    """Loads observations for a platform as a long-format DataFrame.
+
+    With `since` (an observed_at date), only products observed after that
+    date are loaded, with their full history. With `product_ids`, only
+    those products are loaded.
+    """
+    import pandas as pd
+
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        placeholders = ', '.join('?' * len(product_ids))
+        return pd.read_sql_query(f'''
+            SELECT product_id, observed_at, price_paise FROM price_observations
+            WHERE platform = ? AND price_paise IS NOT NULL AND product_id IN ({placeholders})
+            ORDER BY product_id, observed_at
+        ''', conn, params=[platform] + product_ids)
+    if since is None:
+        return pd.read_sql_query('''
+            SELECT product_id, observed_at, price_paise FROM price_observations
+            WHERE platform = ? AND price_paise IS NOT NULL
+            ORDER BY product_id, observed_at
+        ''', conn, params=(platform,))
+    return pd.read_sql_query('''
+        SELECT product_id, observed_at, price_paise FROM price_observations
+        WHERE platform = ? AND price_paise IS NOT NULL
+          AND product_id IN (
+              SELECT DISTINCT product_id FROM price_observations
+              WHERE platform = ? AND observed_at > ?
+          )
+        ORDER BY product_id, observed_at
+    ''', conn, params=(platform, platform, since))
+
+
+def latest_observed_at(conn, platform):
+    row = conn.execute('SELECT MAX(observed_at) FROM price_observations WHERE platform = ?', (platform,)).fetchone()
+    return row[0]
+
+
+# One-shot migration from the one-column-per-day layout
+
+def _table_exists(conn, table):
+    row = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    return row is not None
+
+
+def migrate_wide_table(conn, platform, batch_size=1000):
+    """Moves the per-day columns of one product table into price_observations
+    and rebuilds the table without them. Returns the number of observations copied.
+    """
+    table = PRODUCT_TABLES[platform]
+    if not _table_exists(conn, table):
+        return 0
+
+    columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    date_columns = [col[1] for col in columns if DATE_COLUMN_RE.match(col[1])]
+    if not date_columns:
+        logging.info(f"{table} has no per-day columns, nothing to migrate.")
+        return 0
+    extra_columns = [col for col in columns
+                     if col[1] not in ('srno', 'name', 'link') and col[1] not in date_columns]
+
+    copied = 0
+    conn.execute('BEGIN')
+    try:
+        select_columns = ', '.join(f'"{col}"' for col in date_columns)
+        cursor = conn.execute(f'SELECT srno, {select_columns} FROM {table}')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            batch = []
+            for row in rows:
+                for observed_at, price in zip(date_columns, row[1:]):
+                    price_paise = parse_price_paise(price)
+                    if price_paise is not None:
+                        batch.append((row[0], platform, observed_at, price_paise))
+            # Observations written by the new code paths win over legacy values
+            conn.executemany('''
+                INSERT OR IGNORE INTO price_observations (product_id, platform, observed_at, price_paise)
+                VALUES (?, ?, ?, ?)
+            ''', batch)
+            copied += len(batch)
+
+        extra_defs = ''.join(f',\n                "{col[1]}" {col[2]}' for col in extra_columns)
+        keep_columns = ', '.join(['srno', 'name', 'link'] + [f'"{col[1]}"' for col in extra_columns])
+        conn.execute(f'''
+            CREATE TABLE {table}__narrow (
+                srno INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                link TEXT NOT NULL UNIQUE{extra_defs}
+            )
+        ''')
+        conn.execute(f'INSERT INTO {table}__narrow ({keep_columns}) SELECT {keep_columns} FROM {table}')
+        conn.execute(f'DROP TABLE {table}')
+        conn.execute(f'ALTER TABLE {table}__narrow RENAME TO {table}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    logging.info(f"Migrated {copied} observations from {len(date_columns)} columns of {table}.")
+    return copied
+
+
+def migrate_wide_tables(conn):
+    """Migrates every product table. Safe to re-run."""
+    init_price_store(conn)
+    migrated = {platform: migrate_wide_table(conn, platform) for platform in PRODUCT_TABLES}
+    if any(migrated.values()):
+        rebuild_product_features(conn)
+        conn.commit()
+    return migrated
+
+
+if __name__ == '__main__':
+    # python price_store.py [path/to/databases_price_history.db]
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(basedir, 'databases_price_history.db')
+    logging.basicConfig(level=logging.INFO)
+    conn = sqlite3.connect(db_path)
+    try:
+        print(migrate_wide_tables(conn))
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
@@ -0,0 +1,259 @@
+# product_features.py
+#
+# Running price statistics per product, kept up to date as observations are
+# written so predictions and training never rescan the price history.
+
+import os
+import logging
+
+# Weight of the newest price in the exponentially weighted moving average
+EWMA_ALPHA = float(os.environ.get('TRACKIT_EWMA_ALPHA', 0.3))
+
+FEATURE_FIELDS = ['n', 'sum_paise', 'sumsq_paise', 'min_paise', 'max_paise', 'last_price_paise',
+                  'last_observed_at', 'prev_price_paise', 'prev_ewma_paise', 'ewma_paise', 'last_drop_at']
+
+# Products per `IN (...)` lookup when many writes are folded in at once
+IN_CHUNK = 500
+
+_SAVE_SQL = f'''
+    INSERT OR REPLACE INTO product_features (platform, product_id, {', '.join(FEATURE_FIELDS)})
+    VALUES (?, ?, {', '.join('?' * len(FEATURE_FIELDS))})
+'''
+
+
+def chunked(items, size=IN_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def init_product_features(conn):
+    """Creates the product_features table; fills it from history the first time."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_features'").fetchone()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS product_features (
+            platform TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            n INTEGER NOT NULL,
+            sum_paise INTEGER NOT NULL,
+            sumsq_paise INTEGER NOT NULL,
+            min_paise INTEGER NOT NULL,
+            max_paise INTEGER NOT NULL,
+            last_price_paise INTEGER NOT NULL,
+            last_observed_at TEXT NOT NULL,
+            prev_price_paise INTEGER,
+            prev_ewma_paise REAL,
+            ewma_paise REAL NOT NULL,
+            last_drop_at TEXT,
+            PRIMARY KEY (platform, product_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_product_features_observed ON product_features (platform, last_observed_at)')
+    if not exists:
+        rebuild_product_features(conn)
+    conn.commit()
+
+
+def _ewma(price_paise, previous_ewma):
+    if previous_ewma is None:
+        return float(price_paise)
+    return EWMA_ALPHA * price_paise + (1 - EWMA_ALPHA) * previous_ewma
+
+
+def _save(conn, platform, product_id, state):
+    conn.execute(_SAVE_SQL, [platform, product_id] + [state[field] for field in FEATURE_FIELDS])
+
+
+def rebuild_product(conn, platform, product_id):
+    """Recomputes one product's row from its history (one index range scan)."""
+    cursor = conn.execute('''
+        SELECT observed_at, price_paise FROM price_observations
+        WHERE platform = ? AND product_id = ? AND price_paise IS NOT NULL
+        ORDER BY observed_at
+    ''', (platform, product_id))
+    state = None
+    for observed_at, price_paise in cursor:
+        state = _append(state, observed_at, price_paise)
+    if state is None:
+        conn.execute('DELETE FROM product_features WHERE platform = ? AND product_id = ?', (platform, product_id))
+    else:
+        _save(conn, platform, product_id, state)
+
+
+def _append(state, observed_at, price_paise):
+    """Folds an observation newer than every other into the running state."""
+    if state is None:
+        return {'n': 1, 'sum_paise': price_paise, 'sumsq_paise': price_paise * price_paise,
+                'min_paise': price_paise, 'max_paise': price_paise, 'last_price_paise': price_paise,
+                'last_observed_at': observed_at, 'prev_price_paise': None, 'prev_ewma_paise': None,
+                'ewma_paise': float(price_paise), 'last_drop_at': None}
+    dropped = price_paise < state['last_price_paise']
+    state.update({
+        'n': state['n'] + 1,
+        'sum_paise': state['sum_paise'] + price_paise,
+        'sumsq_paise': state['sumsq_paise'] + price_paise * price_paise,
+        'min_paise': min(state['min_paise'], price_paise),
+        'max_paise': max(state['max_paise'], price_paise),
+        'prev_price_paise': state['last_price_paise'],
+        'prev_ewma_paise': state['ewma_paise'],
+        'ewma_paise': _ewma(price_paise, state['ewma_paise']),
+        'last_price_paise': price_paise,
+        'last_observed_at': observed_at,
+        'last_drop_at': observed_at if dropped else state['last_drop_at'],
+    })
+    return state
+
+
+def _next_state(state, observed_at, price_paise, replaced_paise):
+    """The features after one write, or None when the product must be rebuilt from history.
+
+    New latest prices and same-day corrections of the latest price are
+    O(1); a backfilled older date, or a correction that removes the current
+    min, max or last drop, needs the rebuild.
+    """
+    if state is None and replaced_paise is None:
+        return _append(None, observed_at, price_paise)
+    if state is None or observed_at < state['last_observed_at']:
+        return None
+    if observed_at > state['last_observed_at']:
+        return _append(state, observed_at, price_paise)
+    if replaced_paise is None:
+        # Same day as the latest price but nothing replaced: the row was missing
+        return None
+
+    # Correction of the latest price
+    previous = state['prev_price_paise']
+    dropped = previous is not None and price_paise < previous
+    if ((replaced_paise == state['min_paise'] and price_paise > replaced_paise)
+            or (replaced_paise == state['max_paise'] and price_paise < replaced_paise)
+            or (state['last_drop_at'] == observed_at and not dropped)):
+        # The old min, max or last drop may have been this very price
+        return None
+    state.update({
+        'sum_paise': state['sum_paise'] - replaced_paise + price_paise,
+        'sumsq_paise': state['sumsq_paise'] - replaced_paise * replaced_paise + price_paise * price_paise,
+        'min_paise': min(state['min_paise'], price_paise),
+        'max_paise': max(state['max_paise'], price_paise),
+        'last_price_paise': price_paise,
+        'ewma_paise': _ewma(price_paise, state['prev_ewma_paise']),
+        'last_drop_at': observed_at if dropped else state['last_drop_at'],
+    })
+    return state
+
+
+def update_product_features(conn, platform, product_id, observed_at, price_paise, replaced_paise=None):
+    """Folds one written observation into the product's running features.
+
+    `replaced_paise` is the price the write replaced for the same day, if any.
+    """
+    row = conn.execute(f'SELECT {", ".join(FEATURE_FIELDS)} FROM product_features WHERE platform = ? AND product_id = ?',
+                       (platform, product_id)).fetchone()
+    state = _next_state(dict(zip(FEATURE_FIELDS, row)) if row else None, observed_at, price_paise, replaced_paise)
+    if state is None:
+        rebuild_product(conn, platform, product_id)
+    else:
+        _save(conn, platform, product_id, state)
+
+
+def update_product_features_many(conn, platform, writes):
+    """Folds many written observations into their products' running features.
+
+    `writes` is [(product_id, observed_at, price_paise, replaced_paise)] in
+    write order, already stored. Features are read with one query per
+    IN_CHUNK products and saved with one executemany; the few products
+    that need it are rebuilt from history afterwards.
+    """
+    states = {}
+    for chunk in chunked(dict.fromkeys(write[0] for write in writes)):
+        rows = conn.execute(f'''
+            SELECT product_id, {", ".join(FEATURE_FIELDS)} FROM product_features
+            WHERE platform = ? AND product_id IN ({", ".join("?" * len(chunk))})
+        ''', [platform] + chunk)
+        states.update((row[0], dict(zip(FEATURE_FIELDS, row[1:]))) for row in rows)
+
+    rebuild = set()
+    for product_id, observed_at, price_paise, replaced_paise in writes:
+        if product_id in rebuild:
+            continue  # the rebuild reads every write of this batch
+        state = _next_state(states.get(product_id), observed_at, price_paise, replaced_paise)
+        if state is None:
+            rebuild.add(product_id)
+            states.pop(product_id, None)
+        else:
+            states[product_id] = state
+
+    conn.executemany(_SAVE_SQL, [[platform, product_id] + [state[field] for field in FEATURE_FIELDS]
+                                 for product_id, state in states.items()])
+    for product_id in rebuild:
+        rebuild_product(conn, platform, product_id)
+
+
+def rebuild_product_features(conn, platform=None):
+    """Recomputes every product's features from history. Returns the number of products."""
+    if platform is None:
+        conn.execute('DELETE FROM product_features')
+        cursor = conn.execute('''
+            SELECT platform, product_id, observed_at, price_paise FROM price_observations
+            WHERE price_paise IS NOT NULL ORDER BY platform, product_id, observed_at
+        ''')
+    else:
+        conn.execute('DELETE FROM product_features WHERE platform = ?', (platform,))
+        cursor = conn.execute('''
+            SELECT platform, product_id, observed_at, price_paise FROM price_observations
+            WHERE platform = ? AND price_paise IS NOT NULL ORDER BY product_id, observed_at
+        ''', (platform,))
+
+    rebuilt = 0
+    key, state = None, None
+    for row_platform, product_id, observed_at, price_paise in cursor:
+        if (row_platform, product_id) != key:
+            if state is not None:
+                _save(conn, key[0], key[1], state)
+                rebuilt += 1
+            key, state = (row_platform, product_id), None
+        state = _append(state, observed_at, price_paise)
+    if state is not None:
+        _save(conn, key[0], key[1], state)
+        rebuilt += 1
+    logging.info(f"Rebuilt features for {rebuilt} products.")
+    return rebuilt
+
+
+def load_features(conn, platform, product_ids=None, since=None):
+    """Model features read from product_features, shaped like predictor.compute_features().
+
+    Returns a DataFrame indexed by product_id with count, avg_price,
+    price_std, min, max, price_change (rupees) plus last_price, ewma and
+    last_drop_at. Products with fewer than two prices are left out. With
+    `since`, only products observed after that date.
+    """
+    import numpy as np
+    import pandas as pd
+
+    query = 'SELECT product_id, n, sum_paise, sumsq_paise, min_paise, max_paise, last_price_paise, ewma_paise, last_drop_at FROM product_features WHERE platform = ? AND n >= 2'
+    params = [platform]
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        query += f" AND product_id IN ({', '.join('?' * len(product_ids))})"
+        params += product_ids
+    if since is not None:
+        query += ' AND last_observed_at > ?'
+        params.append(since)
+    rows = pd.read_sql_query(query, conn, params=params, index_col='product_id')
+
+    n = rows['n'].astype(float)
+    mean = rows['sum_paise'].astype(float) / n
+    # Sample variance from the running sums, in paise^2; clipped against rounding below zero
+    variance = np.clip((rows['sumsq_paise'].astype(float) - rows['sum_paise'].astype(float) * mean) / (n - 1), 0, None)
+    features = pd.DataFrame({
+        'count': rows['n'],
+        'avg_price': mean / 100,
+        'price_std': np.sqrt(variance) / 100,
+        'min': rows['min_paise'] / 100,
+        'max': rows['max_paise'] / 100,
+        'last_price': rows['last_price_paise'] / 100,
+        'ewma': rows['ewma_paise'] / 100,
+        'last_drop_at': rows['last_drop_at'],
+    }, index=rows.index)
+    features['price_change'] = np.where(features['max'] > 0, (features['max'] - features['min']) / features['max'], 0)
+    return features
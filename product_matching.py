@@ -0,0 +1,172 @@
+# product_matching.py
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import defaultdict
+
+# A candidate needs at least this similarity to the Amazon title to be picked
+MATCH_THRESHOLD = float(os.environ.get('TRACKIT_MATCH_THRESHOLD', 0.45))
+# A stored mapping is reused for a differently-worded title above this similarity
+FUZZY_REUSE_THRESHOLD = float(os.environ.get('TRACKIT_MATCH_REUSE_THRESHOLD', 0.9))
+
+
+# Similarity
+
+def tokens(text):
+    return re.findall(r'[a-z0-9]+', (text or '').lower())
+
+
+def trigrams(text):
+    joined = ' '.join(tokens(text))
+    return {joined[i:i + 3] for i in range(len(joined) - 2)}
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def similarity(a, b):
+    """Blend of word overlap and character-trigram overlap, from 0 to 1."""
+    return 0.5 * _jaccard(set(tokens(a)), set(tokens(b))) + 0.5 * _jaccard(trigrams(a), trigrams(b))
+
+
+class NgramIndex:
+    """Trigram inverted index for finding the titles closest to a query."""
+
+    def __init__(self):
+        self._postings = defaultdict(set)
+        self._texts = {}
+
+    def add(self, key, text):
+        self._texts[key] = text
+        for gram in trigrams(text):
+            self._postings[gram].add(key)
+
+    def search(self, text, limit=5):
+        """Returns [(score, key), ...], best first."""
+        candidates = set()
+        for gram in trigrams(text):
+            candidates |= self._postings.get(gram, set())
+        scored = sorted(((similarity(text, self._texts[key]), key) for key in candidates), reverse=True)
+        return scored[:limit]
+
+    def __len__(self):
+        return len(self._texts)
+
+
+def rank_candidates(query, candidates):
+    """Orders search results ({'name', 'url', ...}) by similarity to `query`.
+
+    Returns [(score, candidate), ...], best first.
+    """
+    index = NgramIndex()
+    for position, candidate in enumerate(candidates):
+        index.add(position, candidate.get('name') or '')
+    return [(score, candidates[position]) for score, position in index.search(query, limit=len(candidates))]
+
+
+# Stored mappings
+
+def source_key(name):
+    return ' '.join(tokens(name))
+
+
+def init_matching(conn):
+    """Creates the table of Amazon title -> other retailer mappings."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS product_matches (
+            source_key TEXT NOT NULL,
+            retailer TEXT NOT NULL,
+            url TEXT NOT NULL,
+            name TEXT,
+            score REAL NOT NULL,
+            confirmed INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (source_key, retailer)
+        )
+    ''')
+    conn.commit()
+
+
+_indexes = {}
+# Guards _indexes and every index in it, which request and job threads share
+_indexes_lock = threading.Lock()
+
+
+def _confirmed_index(conn, retailer):
+    """In-memory index of confirmed source titles, loaded once per process.
+
+    Call with _indexes_lock held, and keep holding it while using the index.
+    """
+    index = _indexes.get(retailer)
+    if index is None:
+        index = NgramIndex()
+        cursor = conn.execute('SELECT source_key FROM product_matches WHERE retailer = ? AND confirmed = 1',
+                              (retailer,))
+        for (key,) in cursor.fetchall():
+            index.add(key, key)
+        _indexes[retailer] = index
+    return index
+
+
+def find_known_match(conn, retailer, product_name):
+    """Returns the confirmed mapping for this title (or a near-identical one), or None."""
+    init_matching(conn)
+    key = source_key(product_name)
+    row = conn.execute('''
+        SELECT url, name, score FROM product_matches
+        WHERE source_key = ? AND retailer = ? AND confirmed = 1
+    ''', (key, retailer)).fetchone()
+    if row is None:
+        with _indexes_lock:
+            nearest = _confirmed_index(conn, retailer).search(key, limit=1)
+        if nearest and nearest[0][0] >= FUZZY_REUSE_THRESHOLD:
+            row = conn.execute('''
+                SELECT url, name, score FROM product_matches
+                WHERE source_key = ? AND retailer = ? AND confirmed = 1
+            ''', (nearest[0][1], retailer)).fetchone()
+    if row is None:
+        return None
+    return {'url': row[0], 'name': row[1], 'score': row[2]}
+
+
+def save_match(conn, retailer, product_name, url, name, score, confirmed=False):
+    """Stores the best candidate for a title; a confirmed mapping is not overwritten by an unconfirmed one."""
+    init_matching(conn)
+    key = source_key(product_name)
+    conn.execute('''
+        INSERT INTO product_matches (source_key, retailer, url, name, score, confirmed, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (source_key, retailer) DO UPDATE SET
+            url = excluded.url, name = excluded.name, score = excluded.score,
+            confirmed = excluded.confirmed, updated_at = excluded.updated_at
+        WHERE excluded.confirmed = 1 OR product_matches.confirmed = 0
+    ''', (key, retailer, url, name, score, int(confirmed), time.time()))
+    conn.commit()
+    if confirmed:
+        with _indexes_lock:
+            index = _indexes.get(retailer)
+            if index is not None:
+                index.add(key, key)
+
+
+def confirm_match(conn, retailer, product_name, details):
+    """Confirms a mapping once the matched page has been scraped and its name agrees.
+
+    Returns True if the mapping is now confirmed.
+    """
+    name = details.get('name')
+    url = details.get('link')
+    if not name or name == 'N/A' or not url or url == 'N/A':
+        return False
+    score = similarity(product_name, name)
+    if score < MATCH_THRESHOLD:
+        logging.info(f"Not confirming {retailer} match '{name}' for '{product_name}' (score {score:.2f})")
+        return False
+    save_match(conn, retailer, product_name, url, name, score, confirmed=True)
+    return True
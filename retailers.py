@@ -0,0 +1,110 @@
+# retailers.py
+
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as LookupTimeout
+from functions import find_flipkart_link, scrape_flipkart_product, get_first_product_details, scrape_reliance_product
+from db import get_price_history_db_connection
+from product_matching import find_known_match, confirm_match
+
+# Per-retailer deadlines in seconds, counted from when the lookups are started
+RETAILER_DEADLINES = {
+    'flipkart': float(os.environ.get('TRACKIT_FLIPKART_DEADLINE', 20)),
+    'reliance': float(os.environ.get('TRACKIT_RELIANCE_DEADLINE', 25)),
+}
+
+# Shown in place of a retailer that has not answered by its deadline
+PENDING_RESULT = {'name': 'Pending', 'price': 'N/A', 'link': '', 'status': 'pending'}
+
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('TRACKIT_LOOKUP_WORKERS', 8)),
+                               thread_name_prefix='retailer-lookup')
+
+
+def _known_match(retailer, product_name):
+    conn = get_price_history_db_connection()
+    try:
+        return find_known_match(conn, retailer, product_name)
+    finally:
+        conn.close()
+
+
+def _confirm(retailer, product_name, details):
+    conn = get_price_history_db_connection()
+    try:
+        confirm_match(conn, retailer, product_name, details)
+    except Exception as e:
+        logging.warning(f"Could not store {retailer} match for '{product_name}': {e}")
+    finally:
+        conn.close()
+
+
+def _has_name(details):
+    return bool(details) and details.get('name') not in (None, '', 'N/A')
+
+
+def lookup_flipkart(product_name):
+    """Scrapes the product's Flipkart page, searching only when no match is stored."""
+    known = _known_match('flipkart', product_name)
+    if known:
+        details = scrape_flipkart_product(known['url'])
+        if _has_name(details):
+            return details
+        logging.info(f"Stored Flipkart match {known['url']} did not scrape; searching again.")
+
+    flipkart_product_url = find_flipkart_link(product_name)
+    if not flipkart_product_url:
+        return {}
+    details = scrape_flipkart_product(flipkart_product_url)
+    _confirm('flipkart', product_name, details)
+    return details
+
+
+def lookup_reliance(product_name):
+    """Scrapes the product's Reliance Digital page, searching only when no match is stored."""
+    known = _known_match('reliance', product_name)
+    if known:
+        details = scrape_reliance_product(known['url'])
+        if _has_name(details):
+            return details
+        logging.info(f"Stored Reliance Digital match {known['url']} did not scrape; searching again.")
+
+    details = get_first_product_details(product_name)
+    _confirm('reliance', product_name, details)
+    return details
+
+
+RETAILER_LOOKUPS = {
+    'flipkart': lookup_flipkart,
+    'reliance': lookup_reliance,
+}
+
+
+def start_lookups(product_name):
+    """Submits every retailer lookup at once.
+
+    Returns (started_at, {retailer: future}) to pass to collect_lookups().
+    """
+    futures = {retailer: _executor.submit(lookup, product_name)
+               for retailer, lookup in RETAILER_LOOKUPS.items()}
+    return time.monotonic(), futures
+
+
+def collect_lookups(started_at, futures, deadlines=RETAILER_DEADLINES):
+    """Waits for each lookup until its own deadline.
+
+    Lookups that miss their deadline are returned as PENDING_RESULT and keep
+    running in the background; failed lookups are returned as {}.
+    """
+    results = {}
+    for retailer, future in futures.items():
+        remaining = started_at + deadlines.get(retailer, 20) - time.monotonic()
+        try:
+            results[retailer] = future.result(timeout=max(remaining, 0))
+        except LookupTimeout:
+            logging.warning(f"{retailer} lookup missed its deadline; rendering it as pending.")
+            results[retailer] = dict(PENDING_RESULT)
+        except Exception as e:
+            logging.error(f"{retailer} lookup failed: {e}")
+            results[retailer] = {}
+    return results
@@ -0,0 +1,259 @@
+# scheduler.py
+#
+# Adaptive price refresh. Instead of re-scraping every product once a day,
+# each product gets its own next-check time from how volatile its price is,
+# how many users watch it and how likely the model thinks a drop is, and the
+# scheduler never scrapes more than a fixed budget per hour. This is the only
+# refresh path: the nightly job (functions.update) runs one pass. Watchers are
+# alerted after every pass, for products whose price fell since their last check.
+#
+#     python scheduler.py          # run forever
+#     python scheduler.py --once   # one pass, then exit
+#
+# Prices are kept one per product per day, so a second check on the same day
+# replaces that day's price.
+
+import os
+import sys
+import time
+import math
+import logging
+from price_store import PRODUCT_TABLES
+from product_features import load_features, chunked
+from batch_refresh import refresh_platform
+
+MIN_INTERVAL = float(os.environ.get('TRACKIT_REFRESH_MIN_INTERVAL', 3600))  # hottest products
+MAX_INTERVAL = float(os.environ.get('TRACKIT_REFRESH_MAX_INTERVAL', 24 * 3600))  # quietest products
+SCRAPE_BUDGET_PER_HOUR = int(os.environ.get('TRACKIT_SCRAPE_BUDGET_PER_HOUR', 200))
+SYNC_EVERY = float(os.environ.get('TRACKIT_SCHEDULE_SYNC_EVERY', 900))  # seconds between priority recomputes
+TICK = float(os.environ.get('TRACKIT_SCHEDULER_TICK', 60))
+
+# A coefficient of variation at or above this counts as fully volatile
+VOLATILE_CV = 0.1
+# Watcher counts are scored on a log scale up to this many watchers
+WATCHERS_CAP = 50
+# How much each signal contributes to the priority score
+WEIGHTS = {'volatility': 0.4, 'watchers': 0.3, 'drop_probability': 0.3}
+
+
+def init_schedule(conn):
+    """Creates the refresh_schedule table, a priority queue ordered by next_check_at."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS refresh_schedule (
+            platform TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            priority REAL NOT NULL DEFAULT 0,
+            interval REAL NOT NULL,
+            next_check_at REAL NOT NULL,
+            last_checked_at REAL,
+            PRIMARY KEY (platform, product_id)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_refresh_schedule_due ON refresh_schedule (next_check_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_refresh_schedule_checked ON refresh_schedule (last_checked_at)')
+    conn.commit()
+
+
+def priority_score(volatility, watchers, drop_probability):
+    """Blends the three signals into a 0-1 score; higher means check more often.
+
+    `volatility` is the price's coefficient of variation, `watchers` the
+    number of users watching it and `drop_probability` the model's 0-100
+    prediction (None when there is no model or too little history).
+    """
+    volatility_score = min((volatility or 0) / VOLATILE_CV, 1.0)
+    watchers_score = min(math.log1p(watchers) / math.log1p(WATCHERS_CAP), 1.0)
+    drop_score = min(max((drop_probability or 0) / 100, 0.0), 1.0)
+    return (WEIGHTS['volatility'] * volatility_score + WEIGHTS['watchers'] * watchers_score
+            + WEIGHTS['drop_probability'] * drop_score)
+
+
+def interval_for(score):
+    """Maps a score to a check interval, geometrically between MAX_INTERVAL and MIN_INTERVAL."""
+    return MAX_INTERVAL * (MIN_INTERVAL / MAX_INTERVAL) ** score
+
+
+def watcher_counts(users_conn):
+    """Returns {(platform, srno): number of users watching it}."""
+    cursor = users_conn.execute('SELECT platform, srno, COUNT(*) FROM watchlist GROUP BY platform, srno')
+    return {(platform, srno): count for platform, srno, count in cursor.fetchall()}
+
+
+def sync_schedule(conn, users_conn, predictor=None, now=None):
+    """Recomputes every product's priority and interval and queues new products.
+
+    New products are due immediately. Products already queued keep their
+    last check time, so a higher priority brings the next check forward.
+    Returns the number of products scheduled.
+    """
+    now = now or time.time()
+    init_schedule(conn)
+    watchers = watcher_counts(users_conn)
+
+    rows = []
+    for platform, table in PRODUCT_TABLES.items():
+        srnos = [row[0] for row in conn.execute(f'SELECT srno FROM {table}').fetchall()]
+        features = load_features(conn, platform)
+        volatility = (features['price_std'] / features['avg_price']).to_dict()
+        drop_probability = {}
+        if predictor is not None and not features.empty:
+            drop_probability = dict(zip(features.index.tolist(), predictor.predict_batch(features).tolist()))
+        for srno in srnos:
+            score = priority_score(volatility.get(srno), watchers.get((platform, srno), 0), drop_probability.get(srno))
+            rows.append((platform, srno, score, interval_for(score), now))
+
+    with conn:
+        conn.executemany('''
+            INSERT INTO refresh_schedule (platform, product_id, priority, interval, next_check_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (platform, product_id) DO UPDATE SET
+                priority = excluded.priority,
+                interval = excluded.interval,
+                next_check_at = COALESCE(last_checked_at + excluded.interval, excluded.next_check_at)
+        ''', rows)
+    logging.info(f"Scheduled {len(rows)} products.")
+    return len(rows)
+
+
+def scrapes_in_last_hour(conn, now=None):
+    now = now or time.time()
+    return conn.execute('SELECT COUNT(*) FROM refresh_schedule WHERE last_checked_at > ?', (now - 3600,)).fetchone()[0]
+
+
+def count_due(conn, now=None):
+    now = now or time.time()
+    return conn.execute('SELECT COUNT(*) FROM refresh_schedule WHERE next_check_at <= ?', (now,)).fetchone()[0]
+
+
+def claim_due(conn, budget_per_hour=SCRAPE_BUDGET_PER_HOUR, now=None):
+    """Returns {platform: [srno, ...]} of due products that fit in this hour's budget.
+
+    When more products are due than the budget allows, the highest-priority
+    ones go first; the rest stay due for the next pass.
+    """
+    now = now or time.time()
+    remaining = budget_per_hour - scrapes_in_last_hour(conn, now)
+    if remaining <= 0:
+        return {}
+    cursor = conn.execute('''
+        SELECT platform, product_id FROM refresh_schedule
+        WHERE next_check_at <= ?
+        ORDER BY priority DESC, next_check_at
+        LIMIT ?
+    ''', (now, remaining))
+    due = {}
+    for platform, product_id in cursor.fetchall():
+        due.setdefault(platform, []).append(product_id)
+    return due
+
+
+def mark_checked(conn, platform, srnos, now=None):
+    """Moves scraped products to the back of the queue by their own interval.
+
+    The caller is responsible for committing.
+    """
+    now = now or time.time()
+    conn.executemany('''
+        UPDATE refresh_schedule SET last_checked_at = ?, next_check_at = ? + interval
+        WHERE platform = ? AND product_id = ?
+    ''', [(now, now, platform, srno) for srno in srnos])
+
+
+def last_prices(conn, platform, srnos):
+    """Returns {srno: latest price in paise} from product_features."""
+    prices = {}
+    for chunk in chunked(srnos):
+        rows = conn.execute(f'''
+            SELECT product_id, last_price_paise FROM product_features
+            WHERE platform = ? AND product_id IN ({', '.join('?' * len(chunk))})
+        ''', [platform] + chunk)
+        prices.update(rows.fetchall())
+    return prices
+
+
+def run_due(conn, scrapers, budget_per_hour=SCRAPE_BUDGET_PER_HOUR, batch_scrapers=None):
+    """Scrapes the due products within budget. `scrapers` maps platform to scrape(link) -> (price, name).
+
+    `batch_scrapers` optionally maps platform to scrape_many(links, throttle), see
+    batch_refresh.refresh_platform.
+
+    Returns {platform: refresh stats}; each platform's 'dropped' lists the
+    srnos whose price is now lower than at their previous check.
+    """
+    results = {}
+    for platform, srnos in claim_due(conn, budget_per_hour).items():
+        before = last_prices(conn, platform, srnos)
+        # Each chunk is marked checked with its prices, so an interrupted pass
+        # does not scrape it again. Failed scrapes also wait a full interval,
+        # so a broken link cannot eat the budget.
+        results[platform] = refresh_platform(conn, platform, scrapers[platform], srnos,
+                                             scrape_many=(batch_scrapers or {}).get(platform),
+                                             on_chunk=lambda conn, done: mark_checked(conn, platform, done))
+        results[platform]['dropped'] = [srno for srno, price in last_prices(conn, platform, srnos).items()
+                                        if srno in before and price < before[srno]]
+    return results
+
+
+def alert_drops(results):
+    """Emails the watchers of every product that dropped in a pass. Returns the number of digests."""
+    from db import get_users_db_connection
+    from watchlist import plan_alerts
+    from mailer import get_dispatcher
+    from functions import queue_price_drop_alerts
+
+    drops = {platform: stats['dropped'] for platform, stats in results.items() if stats.get('dropped')}
+    if not drops:
+        return 0
+    users_conn = get_users_db_connection()
+    try:
+        alerts = plan_alerts(users_conn, drops)
+    finally:
+        users_conn.close()
+    queued = queue_price_drop_alerts(alerts)
+    get_dispatcher().drain()
+    return queued
+
+
+def run_forever(scrapers, budget_per_hour=SCRAPE_BUDGET_PER_HOUR, once=False, batch_scrapers=None):
+    from db import get_price_history_db_connection, get_users_db_connection
+    from predictor import PricePredictionModel
+    from train_model import MODEL_DIR
+    from watchlist import init_watchlist
+
+    predictor = PricePredictionModel.load_latest(MODEL_DIR)
+    last_sync = 0
+    while True:
+        conn = get_price_history_db_connection()
+        try:
+            if time.time() - last_sync >= SYNC_EVERY:
+                users_conn = get_users_db_connection()
+                try:
+                    init_watchlist(users_conn)
+                    sync_schedule(conn, users_conn, predictor)
+                finally:
+                    users_conn.close()
+                last_sync = time.time()
+            results = run_due(conn, scrapers, budget_per_hour, batch_scrapers)
+            if results:
+                logging.info(f"Scheduler pass: {results}")
+                alert_drops(results)
+            # A single pass (the nightly job) cannot cover more than the hourly budget
+            left = count_due(conn) if once else 0
+            if left:
+                logging.warning(f"{left} products are still due after this pass; run scheduler.py "
+                                f"continuously or raise TRACKIT_SCRAPE_BUDGET_PER_HOUR to keep them fresh.")
+        except Exception as e:
+            logging.error(f"Scheduler pass failed: {e}")
+        finally:
+            conn.close()
+        if once:
+            return
+        time.sleep(TICK)
+
+
+if __name__ == '__main__':
+    from functions import scrape_amazon, scrape_flipkart, scrape_amazon_many, scrape_flipkart_many
+
+    logging.basicConfig(level=logging.INFO)
+    run_forever({'amazon': scrape_amazon, 'flipkart': scrape_flipkart}, once='--once' in sys.argv[1:],
+                batch_scrapers={'amazon': scrape_amazon_many, 'flipkart': scrape_flipkart_many})
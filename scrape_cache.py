@@ -0,0 +1,246 @@
+# scrape_cache.py
+
+import os
+import re
+import copy
+import json
+import time
+import sqlite3
+import logging
+import threading
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from singleflight import SingleFlight
+from db import open_connection
+from metrics import register_stats
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Fresh for TTL seconds, then served stale (and refreshed in the background)
+# for STALE_TTL more seconds before a caller has to wait for a new scrape
+PRODUCT_TTL = float(os.environ.get('TRACKIT_CACHE_PRODUCT_TTL', 600))
+PRODUCT_STALE_TTL = float(os.environ.get('TRACKIT_CACHE_PRODUCT_STALE_TTL', 3000))
+SEARCH_TTL = float(os.environ.get('TRACKIT_CACHE_SEARCH_TTL', 6 * 3600))
+SEARCH_STALE_TTL = float(os.environ.get('TRACKIT_CACHE_SEARCH_STALE_TTL', 18 * 3600))
+LRU_SIZE = int(os.environ.get('TRACKIT_CACHE_LRU_SIZE', 2048))
+# Optional cache shared between processes; unset keeps the cache in-process only
+SHARED_CACHE_DB = os.environ.get('TRACKIT_SCRAPE_CACHE_DB')
+
+TRACKING_PARAMS = re.compile(r'^(utm_.*|ref|ref_|tag|psc|th|qid|sr|sprefix|crid|keywords|lid|marketplace|store|srno|otracker.*|fm|iid|ppt|ppn|ssid|affid|affExtParam\d*)$')
+AMAZON_ASIN = re.compile(r'/(?:dp|gp/product|gp/aw/d|exec/obidos/asin|o/asin)/([A-Z0-9]{10})(?:[/?]|$)', re.IGNORECASE)
+
+
+# Keys
+
+def canonical_url(url):
+    """Reduces a product URL to a stable cache key.
+
+    Amazon links become https://www.amazon.<tld>/dp/<ASIN>, Flipkart links keep
+    their product path and pid only, and tracking parameters are dropped
+    from anything else.
+    """
+    url = url.strip()
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    if host.startswith('m.'):
+        host = 'www.' + host[2:]
+    elif not host.startswith('www.') and host.count('.') == 1:
+        host = 'www.' + host
+
+    if 'amazon.' in host:
+        match = AMAZON_ASIN.search(parts.path)
+        if match:
+            return f"https://{host}/dp/{match.group(1).upper()}"
+
+    query = [(k, v) for k, v in parse_qsl(parts.query) if not TRACKING_PARAMS.match(k)]
+    if 'flipkart.' in host:
+        query = [(k, v) for k, v in query if k == 'pid']
+    return urlunsplit(('https', host, parts.path.rstrip('/'), urlencode(sorted(query)), ''))
+
+
+def normalize_name(name):
+    """Cache key for searches by product name."""
+    return ' '.join((name or '').lower().split())
+
+
+def is_cacheable(value):
+    """Failed or partial scrapes are never cached."""
+    if not value:
+        return False
+    if isinstance(value, dict):
+        return value.get('name') not in (None, '', 'N/A') and value.get('status') != 'pending'
+    return True
+
+
+# Tiers
+
+class LRUCache:
+    """Thread-safe in-process LRU of key -> (value, stored_at)."""
+
+    def __init__(self, maxsize=LRU_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, value, stored_at=None):
+        with self._lock:
+            self._data[key] = (value, stored_at if stored_at is not None else time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Cache tier shared by every process that points at the same file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = open_connection(self.path, timeout=5)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS scrape_cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            ''')
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key):
+        try:
+            row = self._conn().execute('SELECT value, stored_at FROM scrape_cache WHERE namespace = ? AND key = ?',
+                                       (namespace, key)).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Shared scrape cache read failed: {e}")
+            return None
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def set(self, namespace, key, value, stored_at):
+        try:
+            conn = self._conn()
+            conn.execute('INSERT OR REPLACE INTO scrape_cache (namespace, key, value, stored_at) VALUES (?, ?, ?, ?)',
+                         (namespace, key, json.dumps(value), stored_at))
+            conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Shared scrape cache write failed: {e}")
+
+
+_shared_tier = SQLiteCache(SHARED_CACHE_DB) if SHARED_CACHE_DB else None
+_refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-refresh')
+
+# Every cache by namespace, for stats reporting
+CACHES = {}
+
+
+class ScrapeCache:
+    """TTL cache with stale-while-revalidate in front of one scraper."""
+
+    def __init__(self, namespace, ttl, stale_ttl, shared_tier=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.lru = LRUCache()
+        self.shared_tier = shared_tier
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        # Concurrent misses for one key wait on a single scrape
+        self.flights = SingleFlight(f"cache:{namespace}")
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'refresh_errors': 0}
+        CACHES[namespace] = self
+
+    def _lookup(self, key):
+        entry = self.lru.get(key)
+        if entry is None and self.shared_tier is not None:
+            entry = self.shared_tier.get(self.namespace, key)
+            if entry is not None:
+                self.lru.set(key, entry[0], entry[1])
+        return entry
+
+    def _store(self, key, value):
+        stored_at = time.time()
+        self.lru.set(key, value, stored_at)
+        if self.shared_tier is not None:
+            self.shared_tier.set(self.namespace, key, value, stored_at)
+
+    def _refresh(self, key, fetch):
+        try:
+            value = fetch()
+            if is_cacheable(value):
+                self._store(key, value)
+            self.stats['refreshes'] += 1
+        except Exception as e:
+            self.stats['refresh_errors'] += 1
+            logging.warning(f"Background refresh of {self.namespace}:{key} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_fetch(self, key, fetch):
+        """Returns a cached value for `key`, calling `fetch()` on a miss."""
+        entry = self._lookup(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age < self.ttl:
+                self.stats['hits'] += 1
+                return copy.deepcopy(value)
+            if age < self.ttl + self.stale_ttl:
+                self.stats['stale_hits'] += 1
+                with self._lock:
+                    start_refresh = key not in self._refreshing
+                    self._refreshing.add(key)
+                if start_refresh:
+                    _refresher.submit(self._refresh, key, fetch)
+                return copy.deepcopy(value)
+
+        self.stats['misses'] += 1
+
+        def fetch_and_store():
+            value = fetch()
+            if is_cacheable(value):
+                self._store(key, copy.deepcopy(value))
+            return value
+
+        value, shared = self.flights.do(key, fetch_and_store)
+        return copy.deepcopy(value) if shared else value
+
+
+def cached(namespace, key, ttl=PRODUCT_TTL, stale_ttl=PRODUCT_STALE_TTL):
+    """Decorator caching a single-argument scraper under `key(argument)`."""
+    def decorator(func):
+        cache = ScrapeCache(namespace, ttl, stale_ttl, _shared_tier)
+
+        @functools.wraps(func)
+        def wrapper(argument):
+            return cache.get_or_fetch(key(argument), lambda: func(argument))
+
+        wrapper.cache = cache
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+def cache_stats():
+    """Returns {namespace: counters + size} for every scraper cache."""
+    return {namespace: dict(cache.stats, size=len(cache.lru), coalesced=cache.flights.stats['shared'])
+            for namespace, cache in CACHES.items()}
+
+register_stats('trackit_scrape_cache', 'Scrape cache counters and sizes.', cache_stats, label='namespace')
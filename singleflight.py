@@ -0,0 +1,65 @@
+# singleflight.py
+
+import logging
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running wait for it and get the same result, or the
+    same exception. Nothing is remembered once the call finishes.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {'leaders': 0, 'shared': 0, 'errors': 0}
+
+    def do(self, key, func):
+        """Returns (result, shared); `shared` is True when another caller did the work."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.stats['leaders'] += 1
+            else:
+                call.waiters += 1
+                leader = False
+                self.stats['shared'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            self.stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                logging.info(f"{self.name}: {call.waiters} concurrent request(s) shared the result for {key} "
+                             f"({self.stats['shared']} saved so far)")
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,51 @@
+# startup.py
+
+import time
+import logging
+import threading
+
+
+class BackgroundLoader:
+    """Runs a slow loader in a daemon thread.
+
+    get() returns None until the loader has finished, so callers can serve
+    a degraded answer instead of waiting for it.
+    """
+
+    def __init__(self, name, load):
+        self.name = name
+        self._load = load
+        self._value = None
+        self._ready = threading.Event()
+        self._thread = None
+        self.load_seconds = None
+
+    def _run(self):
+        started_at = time.perf_counter()
+        try:
+            self._value = self._load()
+        except Exception as e:
+            logging.error(f"Background load of {self.name} failed: {e}")
+        finally:
+            self.load_seconds = time.perf_counter() - started_at
+            self._ready.set()
+            logging.info(f"{self.name} loaded in {self.load_seconds:.2f}s")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'load-{self.name}', daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def get(self):
+        """Returns the loaded value, or None while loading (or if loading failed)."""
+        return self._value if self._ready.is_set() else None
+
+    def wait(self, timeout=None):
+        """Blocks until loaded; returns the value (None on timeout or failure)."""
+        self._ready.wait(timeout)
+        return self.get()
@@ -0,0 +1,52 @@
+// static/scrape_stream.js
+// Fills in the result cards from /scrape/<id>/events as each retailer answers
+
+(function () {
+    var results = document.getElementById('scrape-results');
+    if (!results || !results.dataset.src) {
+        return;
+    }
+    var form = document.getElementById('track-form');
+    var source = new EventSource(results.dataset.src);
+
+    ['amazon', 'flipkart', 'reliance', 'prediction'].forEach(function (part) {
+        source.addEventListener(part, function (event) {
+            var data = JSON.parse(event.data);
+            document.getElementById('result-' + part).innerHTML = data.html;
+            if (form.elements[part + '_link']) {
+                form.elements[part + '_link'].value = data.link || '';
+            }
+            if (part === 'amazon') {
+                form.querySelector('button').disabled = false;
+            }
+        });
+    });
+
+    source.addEventListener('queued', function (event) {
+        var status = document.getElementById('scrape-status');
+        var position = JSON.parse(event.data).position;
+        if (status) {
+            status.textContent = position ? 'Waiting for a free scraper (' + position + ' ahead)…' : 'Waiting for a free scraper…';
+        }
+    });
+
+    source.addEventListener('running', function () {
+        var status = document.getElementById('scrape-status');
+        if (status) {
+            status.textContent = 'Looking up the product on Amazon…';
+        }
+    });
+
+    source.addEventListener('done', function () {
+        source.close();
+    });
+
+    source.addEventListener('failed', function (event) {
+        source.close();
+        var alert = document.createElement('div');
+        alert.className = 'alert alert-danger text-center mt-4';
+        alert.textContent = JSON.parse(event.data).error;
+        results.replaceWith(alert);
+        form.remove();
+    });
+})();
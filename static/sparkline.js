@@ -0,0 +1,28 @@
+// static/sparkline.js
+// Draws the price series from /api/price_history into every svg.sparkline
+
+document.querySelectorAll('svg.sparkline[data-src]').forEach(function (svg) {
+    fetch(svg.dataset.src)
+        .then(function (response) { return response.ok ? response.json() : null; })
+        .then(function (series) {
+            if (!series || series.points.length < 2) {
+                svg.style.display = 'none';
+                return;
+            }
+            var width = svg.width.baseVal.value, height = svg.height.baseVal.value, pad = 2;
+            var prices = series.points.map(function (point) { return point[1]; });
+            var low = Math.min.apply(null, prices), high = Math.max.apply(null, prices);
+            var span = high - low || 1;
+            var coords = prices.map(function (price, i) {
+                var x = pad + i * (width - 2 * pad) / (prices.length - 1);
+                var y = height - pad - (price - low) * (height - 2 * pad) / span;
+                return x.toFixed(1) + ',' + y.toFixed(1);
+            });
+            var line = document.createElementNS('http://www.w3.org/2000/svg', 'polyline');
+            line.setAttribute('points', coords.join(' '));
+            line.setAttribute('fill', 'none');
+            line.setAttribute('stroke', prices[prices.length - 1] <= prices[0] ? '#28a745' : '#dc3545');
+            line.setAttribute('stroke-width', '1.5');
+            svg.appendChild(line);
+        });
+});
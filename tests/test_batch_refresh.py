@@ -0,0 +1,43 @@
+# tests/test_batch_refresh.py
+
+import sqlite3
+import fast_extract
+from batch_refresh import refresh_platform
+from price_store import init_price_store
+
+
+def test_failed_browser_fallback_keeps_the_pages_read_over_http(monkeypatch):
+    urls = [f"https://example.com/dp/{i}" for i in range(5)]
+    # The last page cannot be read over HTTP, and its browser fallback times out
+    monkeypatch.setattr(fast_extract, 'fetch_many', lambda urls, throttle=None: {url: None if url.endswith('/4') else 'html' for url in urls})
+    monkeypatch.setitem(fast_extract.PARSERS, 'amazon', lambda html, url: {'name': url, 'price': '1,299'})
+
+    def browser_fallback(url):
+        raise TimeoutError('No browser became available')
+
+    def scrape_many(links, throttle):
+        products = fast_extract.extract_products('amazon', links, browser_fallback, throttle=throttle)
+        return {url: (product['price'], product['name']) for url, product in products.items()}
+
+    conn = sqlite3.connect(':memory:')
+    init_price_store(conn)
+    conn.executemany('INSERT INTO amazon_data (name, link) VALUES (?, ?)', [(url, url) for url in urls])
+
+    srnos = [row[0] for row in conn.execute('SELECT srno FROM amazon_data')]
+    stats = refresh_platform(conn, 'amazon', None, srnos, scrape_many=scrape_many, run_date='2026-01-01')
+    assert (stats['refreshed'], stats['failed']) == (4, 1)
+
+
+def test_browsers_are_warmed_only_for_pages_that_need_them(monkeypatch):
+    urls = [f"https://example.com/dp/{i}" for i in range(8)]
+    unreadable = set(urls[:6])
+    monkeypatch.setattr(fast_extract, 'fetch_many', lambda urls, throttle=None: {url: None if url in unreadable else 'html' for url in urls})
+    monkeypatch.setitem(fast_extract.PARSERS, 'amazon', lambda html, url: {'name': url, 'price': '1,299'})
+    warmed = []
+
+    products = fast_extract.extract_products('amazon', urls, lambda url: {'name': url, 'price': '999'},
+                                             fallback_workers=4, warm_browsers=warmed.append)
+    assert len(products) == 8 and warmed == [4]
+    unreadable.clear()
+    fast_extract.extract_products('amazon', urls, None, warm_browsers=warmed.append)
+    assert warmed == [4]
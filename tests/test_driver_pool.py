@@ -0,0 +1,61 @@
+# tests/test_driver_pool.py
+
+import threading
+import time
+import pytest
+from driver_pool import DriverPool
+
+
+class FakeDriver:
+    def quit(self):
+        pass
+
+
+class FakePool(DriverPool):
+    """A DriverPool that hands out stand-ins instead of starting Chrome."""
+
+    def _start_driver(self):
+        driver = FakeDriver()
+        self._pages[id(driver)] = 0
+        self.stats['started'] += 1
+        return driver
+
+    def _reset(self, driver):
+        return True
+
+
+def test_waiter_gets_a_new_browser_when_one_is_recycled():
+    pool = FakePool(size=1, max_pages=1, checkout_timeout=5)
+    first = pool.checkout()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.checkout()))
+    waiter.start()
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    pool.checkin(first)  # worn out after one page: quit, and its slot freed
+    waiter.join(timeout=5)
+
+    assert got and got[0] is not first
+    assert time.monotonic() - started < 1
+    assert pool.stats['recycled'] == 1
+    assert pool._live == 1
+
+
+def test_waiter_gets_the_returned_browser():
+    pool = FakePool(size=1, max_pages=10, checkout_timeout=5)
+    first = pool.checkout()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.checkout()))
+    waiter.start()
+    time.sleep(0.1)
+    pool.checkin(first)
+    waiter.join(timeout=5)
+    assert got == [first]
+
+
+def test_checkout_times_out_when_every_browser_is_busy():
+    pool = FakePool(size=1, checkout_timeout=0.1)
+    pool.checkout()
+    with pytest.raises(TimeoutError):
+        pool.checkout()
@@ -0,0 +1,89 @@
+# tests/test_job_queue.py
+
+import os
+import subprocess
+import sys
+import pytest
+import job_queue
+from job_queue import PRIORITIES, QueueFull, claim, enqueue, finish, get_job
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, 'JOBS_DB', str(tmp_path / 'jobs.db'))
+    monkeypatch.setattr(job_queue, 'dedupe_stats', {})
+    conn = job_queue.get_jobs_connection()
+    job_queue.init_jobs(conn)
+    yield conn
+    conn.close()
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_dedupe_key_reuses_the_active_job(conn):
+    job_id = enqueue(conn, 'scrape', {'link': 'x'}, dedupe_key='scrape:x')
+    assert enqueue(conn, 'scrape', {'link': 'x'}, dedupe_key='scrape:x') == job_id
+    claim(conn, 'w1')
+    assert enqueue(conn, 'scrape', {'link': 'x'}, dedupe_key='scrape:x') == job_id
+    finish(conn, job_id, result={})
+    # Finished jobs drop out of the partial index, so the key is free again
+    assert enqueue(conn, 'scrape', {'link': 'x'}, dedupe_key='scrape:x') != job_id
+    assert job_queue.dedupe_stats['scrape'] == {'leaders': 2, 'shared': 2}
+
+
+def test_full_priority_class_raises(conn, monkeypatch):
+    monkeypatch.setitem(job_queue.QUEUE_DEPTH, 'interactive', 2)
+    enqueue(conn, 'scrape')
+    first = enqueue(conn, 'scrape', dedupe_key='a')
+    with pytest.raises(QueueFull):
+        enqueue(conn, 'scrape')
+    # A duplicate is still answered with the queued job, and other classes are unaffected
+    assert enqueue(conn, 'scrape', dedupe_key='a') == first
+    enqueue(conn, 'nightly', priority='nightly')
+    claim(conn, 'w1')
+    enqueue(conn, 'scrape')
+
+
+def test_claims_interactive_first_then_in_order(conn):
+    nightly = enqueue(conn, 'nightly', priority='nightly')
+    first = enqueue(conn, 'scrape')
+    second = enqueue(conn, 'scrape')
+    assert [claim(conn, 'w1')['id'] for _ in range(3)] == [first, second, nightly]
+    assert claim(conn, 'w1') is None
+
+
+def test_interactive_workers_skip_nightly_jobs(conn):
+    nightly = enqueue(conn, 'nightly', priority='nightly')
+    assert claim(conn, 'w1', max_priority=PRIORITIES['interactive']) is None
+    assert claim(conn, 'w2')['id'] == nightly
+    assert get_job(conn, nightly)['worker'] == 'w2'
+
+
+def test_dead_worker_jobs_are_requeued_then_failed(conn, monkeypatch):
+    monkeypatch.setattr(job_queue, 'JOB_MAX_ATTEMPTS', 2)
+    job_id = enqueue(conn, 'scrape')
+    claim(conn, 'w1')
+    assert job_queue.requeue_worker_jobs(conn, 'w1') == 1
+    assert get_job(conn, job_id)['status'] == 'queued'
+    claim(conn, 'w2')
+    assert job_queue.requeue_worker_jobs(conn, 'w1') == 0
+    assert job_queue.requeue_worker_jobs(conn, 'w2') == 0
+    job = get_job(conn, job_id)
+    assert (job['status'], job['error'], job['attempts']) == ('failed', 'worker died', 2)
+
+
+def test_orphans_of_live_workers_are_left_running(conn):
+    live = enqueue(conn, 'scrape')
+    claim(conn, str(os.getpid()))
+    dead = enqueue(conn, 'scrape')
+    claim(conn, str(dead_pid()))
+    unnamed = enqueue(conn, 'scrape')
+    claim(conn, 'interactive-1')
+    assert job_queue.requeue_orphans(conn) == 2
+    assert get_job(conn, live)['status'] == 'running'
+    assert get_job(conn, dead)['status'] == 'queued'
+    assert get_job(conn, unnamed)['status'] == 'queued'
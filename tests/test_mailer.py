@@ -0,0 +1,79 @@
+# tests/test_mailer.py
+
+import time
+import sqlite3
+import pytest
+import mailer
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(mailer, 'MAIL_QUEUE_DB', str(tmp_path / 'mail_queue.db'))
+    mailer.enqueue_digests('run-1', {f"user{i}@example.com": [{'platform': 'amazon', 'srno': i}] for i in range(3)})
+    conn = mailer.get_queue_connection()
+    yield conn
+    conn.close()
+
+
+def statuses(conn):
+    return dict(conn.execute('SELECT to_email, status FROM mail_queue').fetchall())
+
+
+def test_claims_do_not_overlap(conn):
+    first = mailer.claim_batch(conn, limit=2)
+    second = mailer.claim_batch(conn, limit=2)
+    assert len(first) == 2 and len(second) == 1
+    assert not {row['id'] for row in first} & {row['id'] for row in second}
+    assert mailer.claim_batch(conn) == []
+
+
+def test_recent_claims_are_left_to_their_sender(conn):
+    claimed = mailer.claim_batch(conn)
+    assert len(claimed) == 3
+    # Another sender starting up must not take these back
+    assert mailer.claim_batch(conn) == []
+    assert set(statuses(conn).values()) == {'sending'}
+
+
+def test_abandoned_claims_are_claimed_again(conn):
+    mailer.claim_batch(conn, limit=1)
+    with conn:
+        conn.execute("UPDATE mail_queue SET claimed_at = ? WHERE status = 'sending'",
+                     (time.time() - mailer.MAIL_CLAIM_TIMEOUT - 1,))
+    assert len(mailer.claim_batch(conn)) == 3
+
+
+def test_mark_failed_schedules_a_retry_then_gives_up(conn):
+    row = mailer.claim_batch(conn, limit=1)[0]
+    mailer.mark_failed(conn, row['id'], row['attempts'], 'refused')
+    retried = conn.execute('SELECT status, attempts, next_attempt_at FROM mail_queue WHERE id = ?', (row['id'],)).fetchone()
+    assert retried['status'] == 'pending' and retried['attempts'] == 1
+    assert retried['next_attempt_at'] > time.time()
+
+    mailer.mark_failed(conn, row['id'], mailer.MAIL_MAX_ATTEMPTS - 1, 'refused')
+    assert conn.execute('SELECT status FROM mail_queue WHERE id = ?', (row['id'],)).fetchone()[0] == 'failed'
+
+
+def test_queues_without_claimed_at_are_upgraded(tmp_path, monkeypatch):
+    path = tmp_path / 'old_queue.db'
+    old = sqlite3.connect(path)
+    old.execute('''
+        CREATE TABLE mail_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT NOT NULL, to_email TEXT NOT NULL,
+            items TEXT NOT NULL DEFAULT '[]', status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, last_error TEXT,
+            created_at REAL NOT NULL, sent_at REAL, UNIQUE (run_id, to_email)
+        )
+    ''')
+    old.execute("INSERT INTO mail_queue (run_id, to_email, status, next_attempt_at, created_at) VALUES ('r', 'a@example.com', 'sending', 0, 0)")
+    old.commit()
+    old.close()
+
+    monkeypatch.setattr(mailer, 'MAIL_QUEUE_DB', str(path))
+    conn = mailer.get_queue_connection()
+    try:
+        mailer.init_mail_queue(conn)
+        # A message left sending before claims were timed is recovered
+        assert [row['to_email'] for row in mailer.claim_batch(conn)] == ['a@example.com']
+    finally:
+        conn.close()
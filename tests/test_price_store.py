@@ -0,0 +1,43 @@
+# tests/test_price_store.py
+
+import random
+import sqlite3
+from price_store import init_price_store, record_price, record_prices
+from product_features import rebuild_product_features, FEATURE_FIELDS
+
+
+def fresh_store():
+    conn = sqlite3.connect(':memory:')
+    init_price_store(conn)
+    return conn
+
+
+def contents(conn):
+    observations = conn.execute('SELECT * FROM price_observations ORDER BY platform, product_id, observed_at').fetchall()
+    features = conn.execute(f"SELECT platform, product_id, {', '.join(FEATURE_FIELDS)} FROM product_features "
+                            "ORDER BY platform, product_id").fetchall()
+    return observations, [tuple(round(v, 6) if isinstance(v, float) else v for v in row) for row in features]
+
+
+def test_record_prices_matches_writing_one_at_a_time():
+    rng = random.Random(7)
+    one_by_one, batched = fresh_store(), fresh_store()
+    # Same-day corrections, backfilled dates and repeats within a batch
+    for _ in range(20):
+        observations = [(rng.choice(['amazon', 'flipkart']), rng.randint(1, 6), str(rng.randint(100, 110)),
+                         f"2026-01-{rng.randint(1, 5):02d}") for _ in range(rng.randint(1, 12))]
+        for platform, product_id, price, observed_at in observations:
+            record_price(one_by_one, platform, product_id, price, observed_at)
+        record_prices(batched, observations)
+
+    assert contents(batched) == contents(one_by_one)
+    expected = contents(batched)
+    rebuild_product_features(batched)
+    assert contents(batched) == expected
+
+
+def test_record_prices_skips_unparseable_prices():
+    conn = fresh_store()
+    written = record_prices(conn, [('amazon', 1, 'N/A', None), ('amazon', 2, '₹1,299.00', None), ('amazon', 3, '0', None)])
+    assert written == 1
+    assert conn.execute('SELECT product_id, price_paise FROM price_observations').fetchall() == [(2, 129900)]
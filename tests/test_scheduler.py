@@ -0,0 +1,39 @@
+# tests/test_scheduler.py
+
+import pytest
+import scheduler
+from price_store import init_price_store
+from db import connect
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / 'price_history.db'))
+    init_price_store(conn)
+    scheduler.init_schedule(conn)
+    with conn:
+        conn.executemany('INSERT INTO amazon_data (name, link) VALUES (?, ?)',
+                         [(f"p{i}", f"https://example.com/dp/{i}") for i in range(60)])
+        conn.execute('''
+            INSERT INTO refresh_schedule (platform, product_id, interval, next_check_at)
+            SELECT 'amazon', srno, 3600, 0 FROM amazon_data
+        ''')
+    yield conn
+    conn.close()
+
+
+def test_interrupted_pass_keeps_the_chunks_it_committed(conn):
+    batches = []
+
+    def scrape_many(links, throttle):
+        batches.append(links)
+        if len(batches) > 1:
+            raise KeyboardInterrupt
+        return {link: ('1,299', link) for link in links}
+
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.run_due(conn, {'amazon': None}, budget_per_hour=100, batch_scrapers={'amazon': scrape_many})
+    assert len(batches[0]) == 50
+    # Only the chunk that was cut short is still due
+    assert scheduler.count_due(conn) == 10
+    assert scheduler.claim_due(conn, budget_per_hour=100) == {'amazon': list(range(51, 61))}
@@ -0,0 +1,61 @@
+# train_model.py
+#
+# Offline training job for the price drop model. Run it after the nightly
+# price update:
+#
+#     python train_model.py          # incremental when possible
+#     python train_model.py --full   # retrain from scratch
+#
+# Increments add trees to the forest; once it would grow past
+# TRACKIT_MODEL_MAX_TREES the model is retrained from scratch instead.
+
+import os
+import sys
+import logging
+from db import get_price_history_db_connection
+from predictor import PricePredictionModel, dataset_version, INCREMENT_TREES, MODEL_MAX_TREES
+from price_store import latest_observed_at
+from product_features import load_features
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+MODEL_DIR = os.environ.get('TRACKIT_MODEL_DIR', os.path.join(basedir, 'models'))
+
+
+def train(conn, model_dir=MODEL_DIR, full=False, platform='amazon'):
+    """Trains (or updates) the model and saves a new artifact if the data changed.
+
+    Returns the path of the saved artifact, or None when nothing changed or
+    there was too little new data to update the model with.
+    """
+    version = dataset_version(conn, platform)
+    watermark = latest_observed_at(conn, platform)
+    predictor = None if full else PricePredictionModel.load_latest(model_dir)
+
+    if predictor is not None and predictor.version == version:
+        logging.info(f"Model is already trained on dataset {version}; nothing to do.")
+        return None
+
+    if predictor is not None and predictor.watermark:
+        if predictor.model.n_estimators + INCREMENT_TREES > MODEL_MAX_TREES:
+            logging.info(f"Forest has {predictor.model.n_estimators} trees; retraining from scratch.")
+        else:
+            new_dataset = load_features(conn, platform, since=predictor.watermark)
+            if not predictor.update_model(new_dataset, INCREMENT_TREES):
+                # The watermark is not moved, so these products count towards the next run
+                logging.info("Keeping the current model until there is more new data.")
+                return None
+            return predictor.save(model_dir, version, watermark)
+
+    predictor = PricePredictionModel(load_features(conn, platform))
+    predictor.preprocess_data()
+    predictor.train_model()
+    return predictor.save(model_dir, version, watermark)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    conn = get_price_history_db_connection()
+    try:
+        print(train(conn, full='--full' in sys.argv[1:]))
+    finally:
+        conn.close()
@@ -0,0 +1,152 @@
+# watchlist.py
+
+import os
+import sys
+import json
+import logging
+from db import open_connection
+
+# Legacy JSON columns of the User table, and the platform each one tracks
+PLATFORM_COLUMNS = {
+    'srno_a': 'amazon',
+    'srno_f': 'flipkart',
+}
+
+
+def platform_for_column(columnname):
+    """Maps a legacy column name ('srno_a', 'srno_A', 'srno_f') to its platform."""
+    try:
+        return PLATFORM_COLUMNS[columnname.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown watchlist column: {columnname}")
+
+
+def init_watchlist(conn):
+    """Creates the watchlist table and its (platform, srno) lookup index."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS watchlist (
+            user_id INTEGER NOT NULL,
+            platform TEXT NOT NULL,
+            srno INTEGER NOT NULL,
+            PRIMARY KEY (user_id, platform, srno)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_watchlist_product ON watchlist (platform, srno)')
+    conn.commit()
+
+
+def add_to_watchlist(conn, user_id, platform, srno):
+    """Returns True if the product was added, False if it was already there."""
+    cursor = conn.execute('INSERT OR IGNORE INTO watchlist (user_id, platform, srno) VALUES (?, ?, ?)',
+                          (user_id, platform, srno))
+    return cursor.rowcount > 0
+
+
+def remove_from_watchlist(conn, user_id, platform, srno):
+    """Returns True if the product was removed, False if it was not watched."""
+    cursor = conn.execute('DELETE FROM watchlist WHERE user_id = ? AND platform = ? AND srno = ?',
+                          (user_id, platform, srno))
+    return cursor.rowcount > 0
+
+
+def get_watchlist(conn, user_id):
+    """Returns {platform: [srno, ...]} for one user, in the order items were added."""
+    watchlist = {platform: [] for platform in PLATFORM_COLUMNS.values()}
+    cursor = conn.execute('SELECT platform, srno FROM watchlist WHERE user_id = ? ORDER BY rowid', (user_id,))
+    for platform, srno in cursor.fetchall():
+        watchlist.setdefault(platform, []).append(srno)
+    return watchlist
+
+
+def get_watchlist_page(conn, user_id, platform, limit, offset=0):
+    """Returns one page of a user's srnos for a platform, in the order items were added."""
+    cursor = conn.execute('''
+        SELECT srno FROM watchlist WHERE user_id = ? AND platform = ? ORDER BY rowid LIMIT ? OFFSET ?
+    ''', (user_id, platform, limit, offset))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def count_watchlist(conn, user_id):
+    """Returns {platform: number of watched products} for one user."""
+    counts = {platform: 0 for platform in PLATFORM_COLUMNS.values()}
+    cursor = conn.execute('SELECT platform, COUNT(*) FROM watchlist WHERE user_id = ? GROUP BY platform', (user_id,))
+    counts.update(cursor.fetchall())
+    return counts
+
+
+def plan_alerts(conn, drops):
+    """Joins dropped products to the users watching them.
+
+    `drops` maps platform to a list of dropped srnos. The drops are loaded
+    into a temporary table and joined through the (platform, srno) index,
+    so the work grows with the number of drops, not with users x products.
+    Returns {email: [(platform, srno), ...]}.
+    """
+    conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS dropped_products (
+            platform TEXT NOT NULL,
+            srno INTEGER NOT NULL,
+            PRIMARY KEY (platform, srno)
+        )
+    ''')
+    conn.execute('DELETE FROM dropped_products')
+    conn.executemany('INSERT OR IGNORE INTO dropped_products (platform, srno) VALUES (?, ?)',
+                     [(platform, srno) for platform, srnos in drops.items() for srno in srnos])
+
+    cursor = conn.execute('''
+        SELECT u.email, w.platform, w.srno
+        FROM dropped_products d
+        JOIN watchlist w ON w.platform = d.platform AND w.srno = d.srno
+        JOIN User u ON u.id = w.user_id
+        ORDER BY u.email, w.platform, w.srno
+    ''')
+    alerts = {}
+    for email, platform, srno in cursor.fetchall():
+        alerts.setdefault(email, []).append((platform, srno))
+    conn.execute('DELETE FROM dropped_products')
+    conn.commit()
+    return alerts
+
+
+def migrate_json_watchlists(conn):
+    """Copies the srno_a / srno_f JSON lists of every user into the watchlist table.
+
+    Safe to re-run. Returns the number of watchlist rows inserted.
+    """
+    init_watchlist(conn)
+    columns = [row[1].lower() for row in conn.execute('PRAGMA table_info(User)').fetchall()]
+    legacy_columns = [column for column in PLATFORM_COLUMNS if column in columns]
+    if not legacy_columns:
+        return 0
+
+    rows = []
+    cursor = conn.execute(f"SELECT id, {', '.join(legacy_columns)} FROM User")
+    for user in cursor.fetchall():
+        for column, cell in zip(legacy_columns, user[1:]):
+            if not cell:
+                continue
+            try:
+                srnos = json.loads(cell)
+            except json.JSONDecodeError:
+                logging.warning(f"Skipping malformed {column} for user {user[0]}")
+                continue
+            rows.extend((user[0], PLATFORM_COLUMNS[column], int(srno)) for srno in srnos)
+
+    before = conn.total_changes
+    conn.executemany('INSERT OR IGNORE INTO watchlist (user_id, platform, srno) VALUES (?, ?, ?)', rows)
+    conn.commit()
+    inserted = conn.total_changes - before
+    logging.info(f"Migrated {inserted} watchlist entries from JSON columns.")
+    return inserted
+
+
+if __name__ == '__main__':
+    # python watchlist.py [path/to/users.db]
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(basedir, 'users.db')
+    logging.basicConfig(level=logging.INFO)
+    conn = open_connection(db_path)
+    try:
+        print(migrate_json_watchlists(conn))
+    finally:
+        conn.close()